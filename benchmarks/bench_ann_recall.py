@@ -0,0 +1,216 @@
+"""
+ANN recall@k and latency vs exact search on a synthetic corpus.
+
+Loads clustered random vectors into a scratch table (`kb_bench_vectors`),
+computes exact neighbours in NumPy, builds an HNSW or IVFFlat index through
+`services.vector_index` and sweeps ef_search / probes:
+
+    poetry run python benchmarks/bench_ann_recall.py --rows 100000 --dim 256 --method hnsw
+    poetry run python benchmarks/bench_ann_recall.py --method ivfflat --lists 300 --sweep 1,5,10,20
+
+With --quantization halfvec|binary the index is built on the quantized
+expression instead and the sweep is over the re-rank oversampling factor
+(shortlist = k * oversample, re-ranked by exact distance), at a fixed
+--ef-search / --probes. Compare `index.size_bytes` with a --quantization none
+run for the compression ratio:
+
+    poetry run python benchmarks/bench_ann_recall.py --dim 1536 --metric cosine --quantization binary --sweep 1,2,4,8,16
+
+Needs DATABASE_URL pointing at a database with pgvector. The scratch table is
+dropped at the end unless --keep is given.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from rag_knowledge_base_fastapi.services.db import get_engine
+from rag_knowledge_base_fastapi.services.vector_index import (
+    VectorIndexSpec,
+    apply_search_params,
+    create_vector_index,
+    distance_operator,
+    quantized_distance,
+)
+
+TABLE = "kb_bench_vectors"
+
+
+def synthetic(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    return centers[labels] + 0.3 * rng.normal(size=(rows, dim)).astype(np.float32)
+
+
+def exact_neighbours(corpus: np.ndarray, queries: np.ndarray, k: int, metric: str) -> np.ndarray:
+    if metric == "l2":
+        d = (queries**2).sum(1)[:, None] - 2 * queries @ corpus.T + (corpus**2).sum(1)[None, :]
+    elif metric == "cosine":
+        cn = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+        qn = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        d = -(qn @ cn.T)
+    else:
+        d = -(queries @ corpus.T)
+    return np.argsort(d, axis=1)[:, :k] + 1  # ids are 1-based BIGSERIAL
+
+
+def _lit(v: np.ndarray) -> str:
+    return "[" + ",".join(map(str, v.tolist())) + "]"
+
+
+def load(corpus: np.ndarray) -> None:
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(f"CREATE TABLE {TABLE} (id BIGSERIAL PRIMARY KEY, embedding VECTOR({corpus.shape[1]}) NOT NULL)"))
+    raw = engine.raw_connection()
+    try:
+        with raw.driver_connection.cursor() as cur:
+            with cur.copy(f"COPY {TABLE} (embedding) FROM STDIN") as copy:
+                for v in corpus:
+                    copy.write_row((_lit(v),))
+        raw.driver_connection.commit()
+    finally:
+        raw.close()
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {TABLE}"))
+
+
+def run_queries(
+    queries: np.ndarray,
+    k: int,
+    op: str,
+    *,
+    exact: bool,
+    ef_search=None,
+    probes=None,
+    shortlist: str | None = None,
+    oversample: int = 1,
+):
+    engine = get_engine()
+    if shortlist:
+        # Same two-stage shape as retrieval._build_search_sql.
+        sql = text(
+            f"SELECT id FROM (SELECT id, embedding FROM {TABLE} ORDER BY {shortlist} LIMIT :n) s "
+            f"ORDER BY embedding {op} CAST(:q AS vector) LIMIT :k"
+        )
+        if ef_search is not None:
+            ef_search = max(ef_search, k * oversample)
+    else:
+        sql = text(f"SELECT id FROM {TABLE} ORDER BY embedding {op} CAST(:q AS vector) LIMIT :k")
+    results, latencies = [], []
+    with engine.connect() as conn:
+        if exact:
+            conn.execute(text("SET LOCAL enable_indexscan = off"))
+        apply_search_params(conn, ef_search=ef_search, probes=probes)
+        for q in queries:
+            lit = _lit(q)
+            t0 = time.perf_counter()
+            ids = conn.execute(sql, {"q": lit, "k": k, "n": k * oversample}).scalars().all()
+            latencies.append((time.perf_counter() - t0) * 1000)
+            results.append(ids)
+    return results, np.array(latencies)
+
+
+def relation_size(name: str) -> int:
+    with get_engine().connect() as conn:
+        return int(conn.execute(text("SELECT pg_relation_size(CAST(:n AS regclass))"), {"n": name}).scalar_one())
+
+
+def recall(found: list[list[int]], truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t.tolist())) / k for f, t in zip(found, truth)]))
+
+
+def summarize(lat: np.ndarray) -> dict:
+    return {"p50_ms": float(np.percentile(lat, 50)), "p99_ms": float(np.percentile(lat, 99))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--clusters", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--metric", choices=["l2", "cosine", "ip"], default="l2")
+    parser.add_argument("--method", choices=["hnsw", "ivfflat"], default="hnsw")
+    parser.add_argument("--m", type=int, default=16)
+    parser.add_argument("--ef-construction", type=int, default=64)
+    parser.add_argument("--lists", type=int, default=100)
+    parser.add_argument("--sweep", default=None, help="comma-separated ef_search (hnsw) or probes (ivfflat)")
+    parser.add_argument("--quantization", choices=["none", "halfvec", "binary"], default="none")
+    parser.add_argument("--ef-search", type=int, default=40, help="fixed ef_search when sweeping oversample")
+    parser.add_argument("--probes", type=int, default=10, help="fixed probes when sweeping oversample")
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    corpus = synthetic(args.rows, args.dim, args.clusters)
+    queries = synthetic(args.queries, args.dim, args.clusters, seed=1)
+    truth = exact_neighbours(corpus, queries, args.k, args.metric)
+    op = distance_operator(args.metric)
+
+    t0 = time.perf_counter()
+    load(corpus)
+    load_s = time.perf_counter() - t0
+
+    exact_ids, exact_lat = run_queries(queries, args.k, op, exact=True)
+
+    spec = VectorIndexSpec(
+        method=args.method,
+        metric=args.metric,
+        m=args.m,
+        ef_construction=args.ef_construction,
+        lists=args.lists,
+        table=TABLE,
+        quantization=args.quantization,
+        dim=args.dim,
+    )
+    t0 = time.perf_counter()
+    create_vector_index(spec, concurrently=False)
+    build_s = time.perf_counter() - t0
+
+    points = []
+    if args.quantization == "none":
+        default_sweep = "10,20,40,80,160,320" if args.method == "hnsw" else "1,2,5,10,20,50"
+        for value in [int(x) for x in (args.sweep or default_sweep).split(",")]:
+            knobs = {"ef_search": value} if args.method == "hnsw" else {"probes": value}
+            ids, lat = run_queries(queries, args.k, op, exact=False, **knobs)
+            points.append({**knobs, f"recall@{args.k}": recall(ids, truth), **summarize(lat)})
+    else:
+        shortlist = quantized_distance(args.quantization, metric=args.metric, dim=args.dim, param=":q")
+        knobs = {"ef_search": args.ef_search} if args.method == "hnsw" else {"probes": args.probes}
+        for value in [int(x) for x in (args.sweep or "1,2,4,8,16").split(",")]:
+            ids, lat = run_queries(queries, args.k, op, exact=False, shortlist=shortlist, oversample=value, **knobs)
+            points.append({"oversample": value, **knobs, f"recall@{args.k}": recall(ids, truth), **summarize(lat)})
+
+    index_bytes = relation_size(spec.name)
+
+    if not args.keep:
+        with get_engine().begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+    print(json.dumps({
+        "rows": args.rows,
+        "dim": args.dim,
+        "metric": args.metric,
+        "index": {
+            "method": args.method,
+            "name": spec.name,
+            "quantization": args.quantization,
+            "build_seconds": build_s,
+            "size_bytes": index_bytes,
+        },
+        "load_seconds": load_s,
+        "exact": {f"recall@{args.k}": recall(exact_ids, truth), **summarize(exact_lat)},
+        "ann": points,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Sync (threadpool) vs async request path under concurrent load.
+
+Each simulated /chat request embeds the query, runs a "DB query" and calls the
+chat completion API. OpenAI calls go over real HTTP to `stub_openai_server`
+(fixed latency, in a separate process); the DB stage is a stub that sleeps
+`--db-ms`. The sync path runs the sync services on a threadpool the size of
+Starlette's default (40), which is how FastAPI serves plain `def` endpoints;
+the async path awaits the async services on the event loop:
+
+    poetry run python benchmarks/bench_async_concurrency.py --concurrency 200 --requests 2000
+
+Prints req/s and latency percentiles for both paths as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from stub_openai_server import StubConfig, serve_in_process
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    ms = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "req_per_sec": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+async def drive(request, concurrency: int, total: int) -> dict:
+    """Closed loop: `concurrency` clients issue requests back to back."""
+    latencies: list[float] = []
+    counter = iter(range(total))
+
+    async def client() -> None:
+        for i in counter:
+            t0 = time.perf_counter()
+            await request(i)
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - t0)
+
+
+async def main_async(args: argparse.Namespace) -> dict:
+    from rag_knowledge_base_fastapi.services.embedding_cache import aembed_query, embed_query
+    from rag_knowledge_base_fastapi.services.openai_client import (
+        acall_with_retries,
+        call_with_retries,
+        get_async_openai_client,
+        get_openai_client,
+    )
+
+    db_s = args.db_ms / 1000
+    messages = [{"role": "user", "content": "question"}]
+    sync_client = get_openai_client()
+    async_client = get_async_openai_client()
+
+    def sync_request(i: int) -> None:
+        embed_query(f"sync question {i}")
+        time.sleep(db_s)
+        call_with_retries(
+            lambda timeout: sync_client.chat.completions.create(
+                model=settings.openai_chat_model, messages=messages, timeout=timeout
+            )
+        )
+
+    async def async_request(i: int) -> None:
+        await aembed_query(f"async question {i}")
+        await asyncio.sleep(db_s)
+        await acall_with_retries(
+            lambda timeout: async_client.chat.completions.create(
+                model=settings.openai_chat_model, messages=messages, timeout=timeout
+            )
+        )
+
+    loop = asyncio.get_running_loop()
+    pool = ThreadPoolExecutor(max_workers=args.threads)
+
+    async def via_threadpool(i: int) -> None:
+        await loop.run_in_executor(pool, sync_request, i)
+
+    report = {
+        "sync_threadpool": await drive(via_threadpool, args.concurrency, args.requests),
+        "async": await drive(async_request, args.concurrency, args.requests),
+    }
+    pool.shutdown()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=40, help="sync path worker threads")
+    parser.add_argument("--api-ms", type=float, default=50.0, help="stub OpenAI latency per call")
+    parser.add_argument("--db-ms", type=float, default=10.0, help="stub DB query latency")
+    args = parser.parse_args()
+
+    base_url, stub = serve_in_process(StubConfig(latency_s=args.api_ms / 1000, dim=64))
+    settings.openai_base_url = base_url
+    settings.openai_api_key = settings.openai_api_key or "stub"
+    # Measure the request path, not the limiter or the query cache. The HTTP
+    # pool keeps OPENAI_MAX_CONNECTIONS: httpcore scans every pooled connection
+    # per request, so oversizing it costs the async path more than it gains.
+    settings.openai_concurrency_initial = settings.openai_concurrency_max = args.concurrency * 2
+    settings.query_cache_max_entries = 0
+
+    report = asyncio.run(main_async(args))
+    report["config"] = vars(args)
+    print(json.dumps(report, indent=2))
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
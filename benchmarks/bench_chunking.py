@@ -0,0 +1,125 @@
+"""
+CHUNKER=chars vs CHUNKER=tokens on a large corpus: throughput and what gets stored.
+
+Chunks --corpus (a directory of .txt files) or --mb of synthetic prose in
+paragraphs with both chunkers, once over each whole document and once
+streamed in 64 KiB pieces as ingestion jobs do:
+
+    poetry run python benchmarks/bench_chunking.py --mb 50 --max-tokens 512
+
+Prints MB/s, chunk counts, mean tokens per chunk (and as a fraction of
+--max-tokens), the share of chunks that start or end mid-word, and stored
+characters relative to the corpus, as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.chunking import chunk_text, iter_chunks
+from rag_knowledge_base_fastapi.services.tokenizer import get_tokenizer
+
+WORDS = (
+    "index vector query latency cache shard replica postgres token budget chunk embedding recall "
+    "throughput batch filter rank score document source model answer stream pool lock commit the a of "
+    "to and in is for with on that by this be are from at as it or an was which can"
+).split()
+PIECE_CHARS = 1 << 16
+
+
+def synthetic_corpus(mb: float, seed: int) -> list[str]:
+    """Documents of 5-200 paragraphs of 1-8 sentences each."""
+    rng = random.Random(seed)
+    docs: list[str] = []
+    size = 0
+    while size < mb * 1e6:
+        paragraphs = []
+        for _ in range(rng.randint(5, 200)):
+            sentences = (
+                " ".join(rng.choices(WORDS, k=rng.randint(5, 30))).capitalize() + rng.choice(".!?")
+                for _ in range(rng.randint(1, 8))
+            )
+            paragraphs.append(" ".join(sentences))
+        docs.append("\n\n".join(paragraphs))
+        size += len(docs[-1])
+    return docs
+
+
+def mid_word(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start > 0 else " "
+    after = text[end] if end < len(text) else " "
+    return before.isalnum() and text[start].isalnum() or after.isalnum() and text[end - 1].isalnum()
+
+
+def run(docs: list[str], *, mode: str, size: int, overlap: int) -> dict:
+    t0 = time.perf_counter()
+    chunked = [chunk_text(doc, chunk_size=size, chunk_overlap=overlap, mode=mode) for doc in docs]
+    elapsed = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    streamed = 0
+    for doc in docs:
+        pieces = (doc[i : i + PIECE_CHARS] for i in range(0, len(doc), PIECE_CHARS))
+        streamed += sum(1 for _ in iter_chunks(pieces, chunk_size=size, chunk_overlap=overlap, mode=mode))
+    stream_elapsed = time.perf_counter() - t0
+
+    tok = get_tokenizer()
+    chars = sum(map(len, docs))
+    chunks = [c for doc_chunks in chunked for c in doc_chunks]
+    tokens = [tok.count(c.content) for c in chunks]
+    split = 0
+    for doc, doc_chunks in zip(docs, chunked):
+        pos = 0
+        for c in doc_chunks:
+            # Chunks are in document order and overlap, so search from the previous start.
+            start = doc.find(c.content, pos)
+            pos = start + 1
+            split += mid_word(doc, start, start + len(c.content))
+    return {
+        "mb_per_sec": chars / elapsed / 1e6,
+        "stream_mb_per_sec": chars / stream_elapsed / 1e6,
+        "chunks": len(chunks),
+        "stream_chunks_match": streamed == len(chunks),
+        "mean_tokens": sum(tokens) / max(1, len(chunks)),
+        "max_tokens": max(tokens, default=0),
+        "split_words_pct": 100 * split / max(1, len(chunks)),
+        "stored_chars_ratio": sum(len(c.content) for c in chunks) / chars,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=Path, help="directory of .txt files (default: synthetic)")
+    parser.add_argument("--mb", type=float, default=50.0, help="size of the synthetic corpus")
+    parser.add_argument("--chunk-size", type=int, default=settings.chunk_size_chars, help="CHUNKER=chars window")
+    parser.add_argument("--chunk-overlap", type=int, default=settings.chunk_overlap_chars)
+    parser.add_argument("--max-tokens", type=int, default=settings.chunk_max_tokens, help="CHUNKER=tokens budget")
+    parser.add_argument("--overlap-tokens", type=int, default=settings.chunk_overlap_tokens)
+    args = parser.parse_args()
+
+    if args.corpus:
+        docs = [p.read_text(encoding="utf-8", errors="replace") for p in sorted(args.corpus.rglob("*.txt"))]
+    else:
+        docs = synthetic_corpus(args.mb, seed=0)
+
+    chars = run(docs, mode="chars", size=args.chunk_size, overlap=args.chunk_overlap)
+    tokens = run(docs, mode="tokens", size=args.max_tokens, overlap=args.overlap_tokens)
+    for report in (chars, tokens):
+        report["budget_fill"] = report["mean_tokens"] / args.max_tokens
+    report = {
+        "corpus": {"documents": len(docs), "mb": sum(map(len, docs)) / 1e6},
+        "tokenizer": get_tokenizer().name,
+        "chars": chars,
+        "tokens": tokens,
+        "chunk_ratio": tokens["chunks"] / max(1, chars["chunks"]),
+        "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
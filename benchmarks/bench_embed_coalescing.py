@@ -0,0 +1,110 @@
+"""
+Query embedding with and without the request coalescer under concurrent load.
+
+`--concurrency` clients embed distinct queries back to back through
+`aembed_query` (query cache off), first with QUERY_EMBED_COALESCE_WINDOW_MS=0
+(one embeddings request per query) and then with --window-ms. Requests go
+over real HTTP to `stub_openai_server`, which takes --api-ms per request
+whatever its size, and counts the requests it was charged for; with
+--max-concurrent it answers 429 beyond that many in flight, like a rate
+limit:
+
+    poetry run python benchmarks/bench_embed_coalescing.py --concurrency 64 --requests 4000
+
+Prints queries/s, latency percentiles and upstream requests per query for
+both runs as JSON. `--concurrency 1` shows the idle case (no added latency).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+
+import numpy as np
+from stub_openai_server import StubConfig, serve_in_process
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+
+def stub_requests(base_url: str) -> int:
+    with urllib.request.urlopen(f"{base_url}/stats") as resp:
+        return json.load(resp)["requests"]
+
+
+async def drive(concurrency: int, total: int, tag: str) -> tuple[list[float], float]:
+    from rag_knowledge_base_fastapi.services.embedding_cache import aembed_query
+
+    latencies: list[float] = []
+    counter = iter(range(total))
+
+    async def client() -> None:
+        for i in counter:
+            t0 = time.perf_counter()
+            await aembed_query(f"{tag} question number {i}")
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - t0
+
+
+async def run(args: argparse.Namespace, base_url: str, window_ms: float) -> dict:
+    from rag_knowledge_base_fastapi.services import embedding_coalescer
+
+    settings.query_embed_coalesce_window_ms = window_ms
+    embedding_coalescer._coalescer = None  # pick up the window
+    before = stub_requests(base_url)
+    latencies, elapsed = await drive(args.concurrency, args.requests, f"w{window_ms}")
+    upstream = stub_requests(base_url) - before
+
+    ms = np.array(latencies) * 1000
+    report = {
+        "queries_per_sec": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "upstream_requests": upstream,
+        "requests_per_query": upstream / len(latencies),
+    }
+    coalescer = embedding_coalescer.get_query_embedding_coalescer()
+    if coalescer is not None:
+        report["largest_batch"] = coalescer.stats().largest_batch
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--api-ms", type=float, default=30.0, help="stub latency per embeddings request")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="stub 429s beyond this many in flight (0 = off)")
+    args = parser.parse_args()
+
+    base_url, stub = serve_in_process(
+        StubConfig(latency_s=args.api_ms / 1000, max_concurrent=args.max_concurrent, dim=64)
+    )
+    settings.openai_base_url = base_url
+    settings.openai_api_key = settings.openai_api_key or "stub"
+    settings.embedding_provider = "openai"
+    settings.query_cache_max_entries = 0
+    settings.query_cache_sqlite_path = ""
+    settings.query_embed_coalesce_max_batch = args.max_batch
+
+    async def both() -> dict:
+        # One event loop for both runs: the async OpenAI client is bound to it.
+        return {
+            "uncoalesced": await run(args, base_url, 0),
+            "coalesced": await run(args, base_url, args.window_ms),
+        }
+
+    report = asyncio.run(both())
+    report["config"] = vars(args)
+    print(json.dumps(report, indent=2))
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Ingestion throughput: per-chunk embedding vs batched `embed_texts`.
+
+Runs against a fake embeddings backend that charges a fixed latency per HTTP
+request plus a small per-input cost, so no OpenAI key is needed:
+
+    poetry run python benchmarks/bench_ingest_batching.py --chunks 2500
+
+With `--with-db` the full insert path is also measured against DATABASE_URL
+(run `python -m rag_knowledge_base_fastapi.services.schema` first). Rows are
+written under source="bench-ingest" and removed afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import time
+from types import SimpleNamespace
+
+from rag_knowledge_base_fastapi.services.openai_embeddings import OpenAIEmbeddingsClient
+
+DIM = 1536
+
+
+class FakeEmbeddingsBackend:
+    """Mimics `OpenAI().embeddings` with simulated network latency."""
+
+    def __init__(self, request_latency_s: float, per_item_s: float) -> None:
+        self.request_latency_s = request_latency_s
+        self.per_item_s = per_item_s
+        self.calls = 0
+        self._rng = random.Random(0)
+        self.embeddings = self
+
+    def create(self, *, model: str, input, **kwargs):  # noqa: A002 - mirrors the SDK signature
+        items = [input] if isinstance(input, str) else list(input)
+        self.calls += 1
+        time.sleep(self.request_latency_s + self.per_item_s * len(items))
+        vec = [self._rng.random() for _ in range(DIM)]
+        return SimpleNamespace(
+            data=[SimpleNamespace(index=i, embedding=vec) for i in range(len(items))]
+        )
+
+
+def _chunks(n: int) -> list[tuple[int, str]]:
+    rng = random.Random(42)
+    words = ["alpha", "beta", "gamma", "delta", "vector", "index", "query", "token"]
+    return [(i, " ".join(rng.choice(words) for _ in range(160))) for i in range(n)]
+
+
+def bench_embedding(chunks: list[tuple[int, str]], backend: FakeEmbeddingsBackend) -> dict:
+    embedder = OpenAIEmbeddingsClient(client=backend)
+    texts = [c for _, c in chunks]
+
+    backend.calls = 0
+    t0 = time.perf_counter()
+    for t in texts:
+        embedder.embed_text(t)
+    per_chunk_s = time.perf_counter() - t0
+    per_chunk_calls = backend.calls
+
+    backend.calls = 0
+    t0 = time.perf_counter()
+    embedder.embed_texts(texts)
+    batched_s = time.perf_counter() - t0
+    batched_calls = backend.calls
+
+    return {
+        "chunks": len(texts),
+        "before": {"seconds": per_chunk_s, "api_calls": per_chunk_calls, "chunks_per_sec": len(texts) / per_chunk_s},
+        "after": {"seconds": batched_s, "api_calls": batched_calls, "chunks_per_sec": len(texts) / batched_s},
+    }
+
+
+def bench_db(chunks: list[tuple[int, str]], backend: FakeEmbeddingsBackend) -> dict:
+    from sqlalchemy import text
+
+    from rag_knowledge_base_fastapi.services.db import get_engine
+    from rag_knowledge_base_fastapi.services.kb_repository import insert_chunks_with_embeddings
+
+    engine = get_engine()
+    embedder = OpenAIEmbeddingsClient(client=backend)
+    sql = text(
+        """
+        INSERT INTO kb_chunks (source, doc_id, chunk_index, content, metadata, embedding)
+        VALUES (:source, :doc_id, :chunk_index, :content, CAST(:metadata AS jsonb), CAST(:embedding AS vector))
+        """
+    )
+
+    def cleanup() -> None:
+        with engine.begin() as conn:
+            conn.execute(text("DELETE FROM kb_chunks WHERE source = 'bench-ingest'"))
+            conn.execute(text("DELETE FROM kb_documents WHERE source = 'bench-ingest'"))
+
+    cleanup()
+
+    # Before: the original loop, one embedding request + one INSERT per chunk.
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        for chunk_index, content in chunks:
+            emb = embedder.embed_text(content)
+            conn.execute(
+                sql,
+                {
+                    "source": "bench-ingest",
+                    "doc_id": "before",
+                    "chunk_index": chunk_index,
+                    "content": content,
+                    "metadata": "{}",
+                    "embedding": "[" + ",".join(map(str, emb.vector)) + "]",
+                },
+            )
+    before_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    insert_chunks_with_embeddings(source="bench-ingest", doc_id="after", chunks=chunks, embedder=embedder)
+    after_s = time.perf_counter() - t0
+
+    cleanup()
+    return {
+        "chunks": len(chunks),
+        "before": {"seconds": before_s, "chunks_per_sec": len(chunks) / before_s},
+        "after": {"seconds": after_s, "chunks_per_sec": len(chunks) / after_s},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2500)
+    parser.add_argument("--request-latency-ms", type=float, default=40.0)
+    parser.add_argument("--per-item-ms", type=float, default=0.05)
+    parser.add_argument("--with-db", action="store_true")
+    args = parser.parse_args()
+
+    backend = FakeEmbeddingsBackend(args.request_latency_ms / 1000, args.per_item_ms / 1000)
+    chunks = _chunks(args.chunks)
+
+    report = {"embedding": bench_embedding(chunks, backend)}
+    if args.with_db:
+        report["insert_path"] = bench_db(chunks, backend)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Cost of MMR diversification over N over-fetched candidates.
+
+Times `services.mmr.mmr` (one candidate similarity matrix, top_k vector
+steps) for each --n against a per-pair Python loop doing the same
+selection, on synthetic embeddings that come in clusters of
+near-duplicates, as chunks of one repeated passage do:
+
+    poetry run python benchmarks/bench_mmr.py --dim 1536 --top-k 10 --n 25 50 100 200 500
+
+Prints, per N, the median and p99 milliseconds of both, whether they pick
+the same candidates, and the mean pairwise similarity of the picks next to
+that of the plain top_k (lower = more diverse), as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from functools import partial
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.services.mmr import mmr
+
+
+def candidates(n: int, dim: int, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    """
+    n candidates in clusters of about 5 near-duplicates and their relevance
+    (cosine similarity to a query), sorted best first as a search returns them.
+    """
+    query = rng.standard_normal(dim).astype(np.float32)
+    centers = rng.standard_normal((max(1, n // 5), dim)).astype(np.float32) + 0.5 * query
+    cand = centers[rng.integers(0, len(centers), n)] + 0.1 * rng.standard_normal((n, dim)).astype(np.float32)
+    sims = cand @ query / (np.linalg.norm(cand, axis=1) * np.linalg.norm(query))
+    order = np.argsort(-sims)
+    return cand[order], sims[order]
+
+
+def loop_mmr(cand: np.ndarray, relevance: np.ndarray, *, top_k: int, lambda_: float) -> list[int]:
+    """The textbook formulation: per step, every candidate against every pick."""
+    unit = [c / np.linalg.norm(c) for c in cand]
+    lo, hi = float(min(relevance)), float(max(relevance))
+    relevance = [(float(r) - lo) / (hi - lo) if hi > lo else 1.0 for r in relevance]
+    picked: list[int] = []
+    for _ in range(min(top_k, len(unit))):
+        best, best_gain = -1, -np.inf
+        for i, u in enumerate(unit):
+            if i in picked:
+                continue
+            redundancy = max((float(u @ unit[j]) for j in picked), default=0.0)
+            gain = lambda_ * relevance[i] - (1 - lambda_) * redundancy
+            if gain > best_gain:
+                best, best_gain = i, gain
+        picked.append(best)
+    return picked
+
+
+def mean_similarity(cand: np.ndarray, picks) -> float:
+    unit = cand[list(picks)] / np.linalg.norm(cand[list(picks)], axis=1, keepdims=True)
+    sims = unit @ unit.T
+    k = len(unit)
+    return float((sims.sum() - k) / max(1, k * (k - 1)))
+
+
+def timings(fn, repeat: int) -> tuple[float, float]:
+    ms = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        ms.append((time.perf_counter() - t0) * 1000)
+    return float(np.percentile(ms, 50)), float(np.percentile(ms, 99))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, nargs="+", default=[25, 50, 100, 200, 300, 500])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--lambda", dest="lambda_", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=200, help="timed runs of the vectorized version per N")
+    parser.add_argument("--loop-repeat", type=int, default=5, help="timed runs of the Python loop per N")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for n in args.n:
+        cand, relevance = candidates(n, args.dim, rng)
+        fast = partial(mmr, cand, relevance, top_k=args.top_k, lambda_=args.lambda_)
+        loop = partial(loop_mmr, cand, relevance, top_k=args.top_k, lambda_=args.lambda_)
+        picks = fast()
+        fast_p50, fast_p99 = timings(fast, args.repeat)
+        loop_p50, loop_p99 = timings(loop, args.loop_repeat)
+        results.append(
+            {
+                "n": n,
+                "vectorized_p50_ms": fast_p50,
+                "vectorized_p99_ms": fast_p99,
+                "loop_p50_ms": loop_p50,
+                "loop_p99_ms": loop_p99,
+                "speedup": loop_p50 / fast_p50,
+                "same_picks": picks.tolist() == loop(),
+                "top_k_similarity": mean_similarity(cand, range(min(args.top_k, n))),
+                "mmr_similarity": mean_similarity(cand, picks),
+            }
+        )
+    print(json.dumps({"results": results, "config": vars(args)}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+In-process NumPy index: load time, single vs batched query latency, filters.
+
+Builds a `NumpyVectorIndex` of random vectors in a temporary directory
+(no Postgres needed), reopens it to time the mmap load, then measures
+search latency one query at a time, batched (one GEMM per block for the
+whole batch) and with a `source` filter:
+
+    poetry run python benchmarks/bench_numpy_index.py --rows 200000 --dtype float16
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.services.numpy_index import NumpyVectorIndex
+
+
+def percentiles(samples: list[float]) -> dict:
+    ms = np.array(samples) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--metric", choices=["l2", "cosine", "ip"], default="cosine")
+    parser.add_argument("--sources", type=int, default=20, help="distinct source values (filter selectivity)")
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    report: dict = {"config": vars(args)}
+
+    with tempfile.TemporaryDirectory() as path:
+        index = NumpyVectorIndex(path, dim=args.dim, dtype=args.dtype, metric=args.metric)
+        batch = 5000
+        t0 = time.perf_counter()
+        for start in range(0, args.rows, batch):
+            n = min(batch, args.rows - start)
+            index.add(
+                source=f"source-{(start // batch) % args.sources}",
+                doc_id=f"doc-{start // batch}",
+                chunks=[(i, f"chunk {start + i}") for i in range(n)],
+                vectors=rng.normal(size=(n, args.dim)).astype(np.float32),
+            )
+        append_s = time.perf_counter() - t0
+        index.close()
+        report["append"] = {"rows": args.rows, "seconds": append_s, "rows_per_sec": args.rows / append_s}
+
+        t0 = time.perf_counter()
+        index = NumpyVectorIndex(path, dim=args.dim, dtype=args.dtype, metric=args.metric)
+        report["open_seconds"] = time.perf_counter() - t0
+
+        queries = rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+        index.search(queries[:1], top_k=args.top_k)  # fault the pages in once
+
+        single = []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, top_k=args.top_k)
+            single.append(time.perf_counter() - t0)
+        report["single_query"] = percentiles(single)
+
+        t0 = time.perf_counter()
+        index.search(queries, top_k=args.top_k)
+        batched_s = time.perf_counter() - t0
+        report["batched"] = {
+            "queries": args.queries,
+            "seconds": batched_s,
+            "per_query_ms": batched_s / args.queries * 1000,
+            "speedup_vs_single": (sum(single) / args.queries) / (batched_s / args.queries),
+        }
+
+        filtered = []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, top_k=args.top_k, source="source-0")
+            filtered.append(time.perf_counter() - t0)
+        report["filtered_source"] = percentiles(filtered)
+        index.close()
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
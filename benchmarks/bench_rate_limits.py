@@ -0,0 +1,121 @@
+"""
+Interactive latency under an ingestion burst against a rate-limiting stub.
+
+Starts `stub_openai_server` in-process, points the shared OpenAI client at it
+and runs bulk-lane embedding batches alongside interactive-lane query
+embeddings and chat calls. Reports interactive latency percentiles, how many
+calls failed with UpstreamUnavailableError (503 in the API), the stub's 429
+count and the limiter's final state:
+
+    poetry run python benchmarks/bench_rate_limits.py --seconds 10 --max-concurrent 8
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import threading
+import time
+from dataclasses import asdict
+
+from stub_openai_server import StubConfig, serve_in_thread
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--max-concurrent", type=int, default=8, help="stub returns 429 above this")
+    parser.add_argument("--latency-ms", type=float, default=30.0)
+    parser.add_argument("--bulk-workers", type=int, default=16)
+    parser.add_argument("--interactive-workers", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=32)
+    args = parser.parse_args()
+
+    server = serve_in_thread(
+        StubConfig(latency_s=args.latency_ms / 1000, max_concurrent=args.max_concurrent, dim=64)
+    )
+    settings.openai_base_url = server.base_url
+    settings.openai_api_key = settings.openai_api_key or "stub"
+
+    # Import after configuring settings so the shared client targets the stub.
+    from rag_knowledge_base_fastapi.services.openai_client import (
+        UpstreamUnavailableError,
+        call_with_retries,
+        get_limiter,
+        get_openai_client,
+    )
+    from rag_knowledge_base_fastapi.services.openai_embeddings import OpenAIEmbeddingsClient
+
+    stop = time.monotonic() + args.seconds
+    lock = threading.Lock()
+    interactive_ms: list[float] = []
+    counts = {"bulk_batches": 0, "bulk_failed": 0, "interactive_ok": 0, "interactive_failed": 0}
+
+    def bulk_worker() -> None:
+        embedder = OpenAIEmbeddingsClient(lane="bulk")
+        texts = [f"bulk chunk {i}" for i in range(args.batch)]
+        while time.monotonic() < stop:
+            try:
+                embedder.embed_texts(texts)
+                key = "bulk_batches"
+            except UpstreamUnavailableError:
+                key = "bulk_failed"
+            with lock:
+                counts[key] += 1
+
+    def interactive_worker(n: int) -> None:
+        embedder = OpenAIEmbeddingsClient(lane="interactive")
+        client = get_openai_client()
+        i = 0
+        while time.monotonic() < stop:
+            t0 = time.perf_counter()
+            try:
+                embedder.embed_text(f"user question {n}-{i}")
+                call_with_retries(
+                    lambda timeout: client.chat.completions.create(
+                        model=settings.openai_chat_model,
+                        messages=[{"role": "user", "content": "hi"}],
+                        timeout=timeout,
+                    ),
+                    lane="interactive",
+                )
+                elapsed = (time.perf_counter() - t0) * 1000
+                with lock:
+                    interactive_ms.append(elapsed)
+                    counts["interactive_ok"] += 1
+            except UpstreamUnavailableError:
+                with lock:
+                    counts["interactive_failed"] += 1
+            i += 1
+
+    threads = [threading.Thread(target=bulk_worker) for _ in range(args.bulk_workers)]
+    threads += [threading.Thread(target=interactive_worker, args=(n,)) for n in range(args.interactive_workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    ms = sorted(interactive_ms)
+    print(json.dumps({
+        "counts": counts,
+        "interactive_latency_ms": {
+            "p50": percentile(ms, 50),
+            "p95": percentile(ms, 95),
+            "p99": percentile(ms, 99),
+        },
+        "stub": server.config.stats,
+        "limiter": asdict(get_limiter().stats()),
+    }, indent=2))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
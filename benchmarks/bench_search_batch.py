@@ -0,0 +1,141 @@
+"""
+/search one query at a time vs /search/batch, in queries per second.
+
+Runs the same queries through `asearch_chunks` (sequentially, one embedding
+call and one statement each) and `asearch_chunks_batch` for batch sizes
+1, 2, 4, ... up to --max-batch, and checks both return the same hits.
+Embeddings go over real HTTP to `stub_openai_server` (--api-ms per request,
+whatever the batch size) with the query cache off. By default the searches
+run against an in-process numpy index of --rows synthetic chunks; with
+--with-db they run against the Postgres corpus at DATABASE_URL instead:
+
+    poetry run python benchmarks/bench_search_batch.py --mode hybrid --queries 512
+
+Prints queries/sec per batch size and the speedup over single queries as JSON.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+import numpy as np
+from stub_openai_server import StubConfig, serve_in_process
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+
+WORDS = (
+    "index vector query latency cache shard replica postgres token budget chunk embedding recall "
+    "throughput batch filter rank score document source model answer stream pool lock commit"
+).split()
+
+
+def build_numpy_index(args: argparse.Namespace, rng: random.Random) -> None:
+    from rag_knowledge_base_fastapi.services.numpy_index import get_numpy_index
+
+    index = get_numpy_index()
+    vectors = np.random.default_rng(0).normal(size=(args.rows, args.dim)).astype(np.float32)
+    per_doc = 100
+    for start in range(0, args.rows, per_doc):
+        n = min(per_doc, args.rows - start)
+        index.add(
+            source=f"source-{(start // per_doc) % args.sources}",
+            doc_id=f"doc-{start // per_doc}",
+            chunks=[(i, " ".join(rng.choices(WORDS, k=40))) for i in range(n)],
+            vectors=vectors[start:start + n],
+        )
+
+
+def make_queries(args: argparse.Namespace, rng: random.Random):
+    from rag_knowledge_base_fastapi.services.retrieval import SearchQuery
+
+    modes = ["vector", "lexical", "hybrid"] if args.mode == "mixed" else [args.mode]
+    queries = []
+    for i in range(args.queries):
+        source = f"source-{rng.randrange(args.sources)}" if rng.random() < args.filtered else None
+        queries.append(
+            SearchQuery(
+                query=f"{' '.join(rng.sample(WORDS, 3))} {i}",
+                top_k=args.top_k,
+                source=source,
+                mode=rng.choice(modes),
+            )
+        )
+    return queries
+
+
+def same_hits(a, b) -> bool:
+    return [h.id for h in a] == [h.id for h in b] and np.allclose([h.score for h in a], [h.score for h in b])
+
+
+async def main_async(args: argparse.Namespace, queries) -> dict:
+    from rag_knowledge_base_fastapi.services.retrieval import asearch_chunks, asearch_chunks_batch
+
+    t0 = time.perf_counter()
+    single = []
+    for q in queries:
+        single.append(
+            await asearch_chunks(query=q.query, top_k=q.top_k, doc_id=q.doc_id, source=q.source, mode=q.mode)
+        )
+    elapsed = time.perf_counter() - t0
+    report: dict = {"single": {"queries_per_sec": len(queries) / elapsed}}
+
+    size = 1
+    while size <= args.max_batch:
+        t0 = time.perf_counter()
+        batched = []
+        for start in range(0, len(queries), size):
+            batched.extend(await asearch_chunks_batch(queries[start:start + size]))
+        elapsed = time.perf_counter() - t0
+        qps = len(queries) / elapsed
+        report[f"batch_{size}"] = {
+            "queries_per_sec": qps,
+            "speedup": qps / report["single"]["queries_per_sec"],
+            "identical": all(same_hits(a, b) for a, b in zip(single, batched)),
+        }
+        size *= 2
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--mode", choices=["vector", "lexical", "hybrid", "mixed"], default="vector")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--filtered", type=float, default=0.0, help="fraction of queries with a source filter")
+    parser.add_argument("--api-ms", type=float, default=20.0, help="stub embedding latency per request")
+    parser.add_argument("--with-db", action="store_true", help="search Postgres (DATABASE_URL) instead")
+    parser.add_argument("--rows", type=int, default=50_000, help="numpy index size")
+    parser.add_argument("--dim", type=int, default=256, help="numpy index and stub embedding dim")
+    parser.add_argument("--sources", type=int, default=10)
+    args = parser.parse_args()
+
+    dim = args.dim if not args.with_db else settings.embed_dim
+    base_url, stub = serve_in_process(StubConfig(latency_s=args.api_ms / 1000, dim=dim))
+    settings.openai_base_url = base_url
+    settings.openai_api_key = settings.openai_api_key or "stub"
+    settings.embedding_provider = "openai"
+    settings.query_cache_max_entries = 0
+    settings.query_cache_sqlite_path = ""
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as path:
+        if not args.with_db:
+            settings.retrieval_backend = "numpy"
+            settings.numpy_index_dir = path
+            settings.embed_dim = dim
+            build_numpy_index(args, rng)
+        report = asyncio.run(main_async(args, make_queries(args, rng)))
+
+    report["config"] = vars(args)
+    print(json.dumps(report, indent=2))
+    stub.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+/ingest/file memory: buffered (read + decode + chunk_text, then one insert)
+vs the streaming pipeline (services.streaming_ingest).
+
+Writes a synthetic UTF-8 text file, then ingests it once per mode, each in
+a fresh subprocess so peak RSS (ru_maxrss) is per mode. Runs offline
+against the numpy backend in a temporary directory with small vectors,
+so the numbers are the pipeline's own (text, chunk lists, batches):
+
+    poetry run python benchmarks/bench_stream_ingest.py --size-mb 500
+
+--embedder zeros (default) returns a constant vector so embedding cost
+doesn't dominate; --embedder hashing uses the offline hashing embedder.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+_VOCAB = [
+    "vector", "index", "query", "token", "latency", "cache", "embedding", "chunk", "document",
+    "search", "answer", "context", "model", "batch", "stream", "recall", "naïve", "café",
+]
+
+
+def write_corpus(path: str, size_mb: int) -> int:
+    """Repeat a ~4 MB block of random words up to size_mb; returns bytes written."""
+    rng = random.Random(0)
+    words = [rng.choice(_VOCAB) + ("." if rng.random() < 0.08 else "") for _ in range(600_001)]
+    # The block length isn't a multiple of the chunk step, so chunk
+    # boundaries drift across repeats and chunks stay distinct.
+    block = (" ".join(words) + "\n").encode("utf-8")
+    written = 0
+    with open(path, "wb") as f:
+        while written < size_mb * 1024 * 1024:
+            f.write(block)
+            written += len(block)
+    return written
+
+
+class ZeroEmbedder:
+    """Async embedder returning one constant vector."""
+
+    model = "bench-zeros"
+
+    def __init__(self, dim: int) -> None:
+        import numpy as np
+
+        from rag_knowledge_base_fastapi.services.openai_embeddings import EmbeddingResult
+
+        self._result = EmbeddingResult(model=self.model, vector=np.full(dim, 0.5, dtype=np.float32))
+
+    async def embed_text(self, text: str):
+        return self._result
+
+    async def embed_texts(self, texts: list[str]):
+        return [self._result] * len(texts)
+
+
+def _embedder(name: str, dim: int):
+    if name == "hashing":
+        from rag_knowledge_base_fastapi.services.providers import AsyncHashingEmbedder
+
+        return AsyncHashingEmbedder(dim=dim)
+    return ZeroEmbedder(dim)
+
+
+async def run_buffered(path: str, embedder) -> dict:
+    from rag_knowledge_base_fastapi.config.settings import settings
+    from rag_knowledge_base_fastapi.services.chunking import chunk_text
+    from rag_knowledge_base_fastapi.services.kb_repository import ainsert_chunks_with_embeddings
+
+    # What /ingest/file did before: whole upload -> str -> list of chunks.
+    with open(path, "rb") as f:
+        raw = f.read()
+    content = raw.decode("utf-8")
+    chunks = chunk_text(content, chunk_size=settings.chunk_size_chars, chunk_overlap=settings.chunk_overlap_chars)
+    result = await ainsert_chunks_with_embeddings(
+        source="bench-stream",
+        doc_id="buffered",
+        chunks=[(c.chunk_index, c.content) for c in chunks],
+        embedder=embedder,
+    )
+    return {"bytes": len(raw), "chunks": len(chunks), "inserted": result.inserted}
+
+
+async def run_streaming(path: str, embedder, read_bytes: int) -> dict:
+    from rag_knowledge_base_fastapi.services.streaming_ingest import aingest_stream
+
+    async def blocks():
+        with open(path, "rb") as f:
+            while block := f.read(read_bytes):
+                yield block
+
+    result = await aingest_stream(blocks(), source="bench-stream", doc_id="streaming", embedder=embedder)
+    return {"bytes": result.bytes_read, "chunks": result.chunks_created, "inserted": result.inserted}
+
+
+def child(args: argparse.Namespace) -> None:
+    embedder = _embedder(args.embedder, args.dim)
+    t0 = time.perf_counter()
+    if args.child == "buffered":
+        out = asyncio.run(run_buffered(args.path, embedder))
+    else:
+        out = asyncio.run(run_streaming(args.path, embedder, args.read_bytes))
+    seconds = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    print(json.dumps({
+        **out,
+        "seconds": seconds,
+        "mb_per_sec": out["bytes"] / seconds / 1e6,
+        "chunks_per_sec": out["chunks"] / seconds,
+        "peak_rss_mb": peak_mb,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=16)
+    parser.add_argument("--embedder", choices=["zeros", "hashing"], default="zeros")
+    parser.add_argument("--modes", default="streaming,buffered")
+    parser.add_argument("--read-bytes", type=int, default=1024 * 1024)
+    parser.add_argument("--child", choices=["buffered", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "corpus.txt")
+        size = write_corpus(path, args.size_mb)
+        report: dict = {"file_bytes": size, "dim": args.dim, "embedder": args.embedder, "modes": {}}
+        for mode in args.modes.split(","):
+            env = {
+                **os.environ,
+                "RETRIEVAL_BACKEND": "numpy",
+                "NUMPY_INDEX_DIR": os.path.join(tmp, f"index-{mode}"),
+                "EMBED_DIM": str(args.dim),
+                "QUERY_CACHE_SQLITE_PATH": "",
+            }
+            cmd = [
+                sys.executable, __file__, "--child", mode, "--path", path,
+                "--dim", str(args.dim), "--embedder", args.embedder, "--read-bytes", str(args.read_bytes),
+            ]
+            out = subprocess.run(cmd, env=env, capture_output=True, text=True)
+            if out.returncode:
+                report["modes"][mode] = {"error": out.stderr.strip().splitlines()[-1:]}
+            else:
+                report["modes"][mode] = json.loads(out.stdout)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Vector transport: text literals vs base64 + binary pgvector parameters.
+
+Per ingested chunk a vector crosses the wire twice (embeddings API -> app,
+app -> Postgres); per search the query vector goes app -> Postgres once.
+Measures client-side serialization time and bytes for both encodings:
+
+- API response: JSON float list (encoding_format="float", decoded to a
+  Python list) vs base64 float32 decoded with np.frombuffer
+- DB parameter: '[0.1,0.2,...]' text literal + CAST vs the binary pgvector
+  dumper registered in db._register_pgvector
+
+    poetry run python benchmarks/bench_vector_transport.py --dim 1536
+
+With --with-db, also times real INSERTs and searches both ways against
+DATABASE_URL in a scratch table (`kb_bench_transport`, dropped afterwards).
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import time
+
+import numpy as np
+from pgvector.psycopg.vector import VectorBinaryDumper
+
+TABLE = "kb_bench_transport"
+
+
+def per_call_us(fn, reps: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1e6
+
+
+def bench_serialization(dim: int, reps: int) -> dict:
+    vec = np.random.default_rng(0).normal(size=dim).astype(np.float32)
+    as_list = vec.tolist()
+
+    json_body = json.dumps({"embedding": as_list})
+    b64_body = json.dumps({"embedding": base64.b64encode(vec.tobytes()).decode()})
+    literal = "[" + ",".join(map(str, as_list)) + "]"
+    dumper = VectorBinaryDumper(np.ndarray)
+    binary = dumper.dump(vec)
+
+    return {
+        "api_response": {
+            "json_floats": {
+                "bytes": len(json_body),
+                "decode_us": per_call_us(lambda: json.loads(json_body)["embedding"], reps),
+            },
+            "base64_float32": {
+                "bytes": len(b64_body),
+                "decode_us": per_call_us(
+                    lambda: np.frombuffer(base64.b64decode(json.loads(b64_body)["embedding"]), dtype="<f4"), reps
+                ),
+            },
+        },
+        "db_parameter": {
+            "text_literal": {
+                "bytes": len(literal),
+                "serialize_us": per_call_us(lambda: "[" + ",".join(map(str, as_list)) + "]", reps),
+            },
+            "binary_pgvector": {
+                "bytes": len(binary),
+                "serialize_us": per_call_us(lambda: dumper.dump(vec), reps),
+            },
+        },
+    }
+
+
+def bench_db(dim: int, rows: int, searches: int) -> dict:
+    from sqlalchemy import text
+
+    from rag_knowledge_base_fastapi.services.db import get_engine
+
+    engine = get_engine()
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(rows, dim)).astype(np.float32)
+    queries = rng.normal(size=(searches, dim)).astype(np.float32)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(f"CREATE TABLE {TABLE} (id BIGSERIAL PRIMARY KEY, embedding vector({dim}) NOT NULL)"))
+
+    def literal(v: np.ndarray) -> str:
+        return "[" + ",".join(map(str, v.tolist())) + "]"
+
+    insert_text = text(f"INSERT INTO {TABLE} (embedding) VALUES (CAST(:e AS vector))")
+    insert_binary = text(f"INSERT INTO {TABLE} (embedding) VALUES (:e)")
+    search_text = text(
+        f"SELECT id, embedding <-> CAST(:q AS vector) AS score FROM {TABLE} "
+        f"ORDER BY embedding <-> CAST(:q AS vector) LIMIT 5"
+    )
+    search_binary = text(f"SELECT id, embedding <-> :q AS score FROM {TABLE} ORDER BY score LIMIT 5")
+
+    try:
+        report = {"rows": rows, "searches": searches}
+        for name, sql, encode in (
+            ("text_literal", insert_text, literal),
+            ("binary_pgvector", insert_binary, lambda v: v),
+        ):
+            t0 = time.perf_counter()
+            with engine.begin() as conn:
+                conn.execute(sql, [{"e": encode(v)} for v in vectors])
+            report[f"insert_{name}_rows_per_sec"] = rows / (time.perf_counter() - t0)
+
+        for name, sql, encode in (
+            ("text_literal", search_text, literal),
+            ("binary_pgvector", search_binary, lambda v: v),
+        ):
+            latencies = []
+            with engine.connect() as conn:
+                for q in queries:
+                    t0 = time.perf_counter()
+                    conn.execute(sql, {"q": encode(q)}).fetchall()
+                    latencies.append(time.perf_counter() - t0)
+            report[f"search_{name}_p50_ms"] = float(np.percentile(latencies, 50) * 1000)
+        return report
+    finally:
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--reps", type=int, default=2000)
+    parser.add_argument("--with-db", action="store_true")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--searches", type=int, default=200)
+    args = parser.parse_args()
+
+    report = {"dim": args.dim, "serialization": bench_serialization(args.dim, args.reps)}
+    if args.with_db:
+        report["db"] = bench_db(args.dim, args.rows, args.searches)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Closed-loop load test for a running server's POST /search.
+
+    poetry run uvicorn rag_knowledge_base_fastapi.main:app --workers 1
+    poetry run python benchmarks/load_search.py --concurrency 16 --requests 2000
+
+Reports throughput and latency percentiles as JSON, plus the server's
+connection-pool counters from /db/health taken before and after the run.
+Compare runs across commits to see the effect of server-side changes.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+QUERIES = [
+    "How is the knowledge base ingested?",
+    "What database stores the embeddings?",
+    "How are citations produced?",
+    "What happens when the context is insufficient?",
+]
+
+
+def _post(url: str, payload: dict, timeout: float) -> None:
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(req, timeout=timeout) as resp:
+        resp.read()
+
+
+def _get_json(url: str) -> dict | None:
+    try:
+        with urllib.request.urlopen(url, timeout=10) as resp:
+            return json.loads(resp.read())
+    except OSError:
+        return None
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    url = args.base_url.rstrip("/") + "/search"
+    errors = 0
+
+    def one(i: int) -> float | None:
+        nonlocal errors
+        payload = {"query": QUERIES[i % len(QUERIES)], "top_k": args.top_k}
+        t0 = time.perf_counter()
+        try:
+            _post(url, payload, args.timeout)
+        except OSError:
+            errors += 1
+            return None
+        return time.perf_counter() - t0
+
+    pool_before = (_get_json(args.base_url.rstrip("/") + "/db/health") or {}).get("pool")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        latencies = sorted(x for x in ex.map(one, range(args.requests)) if x is not None)
+    elapsed = time.perf_counter() - t0
+
+    pool_after = (_get_json(args.base_url.rstrip("/") + "/db/health") or {}).get("pool")
+
+    ms = [x * 1000 for x in latencies]
+    print(json.dumps({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "req_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": statistics.fmean(ms) if ms else 0.0,
+            "p50": percentile(ms, 50),
+            "p95": percentile(ms, 95),
+            "p99": percentile(ms, 99),
+            "max": ms[-1] if ms else 0.0,
+        },
+        "pool_before": pool_before,
+        "pool_after": pool_after,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+Offline benchmark suite for tracking regressions between releases.
+
+Runs with the deterministic providers (EMBEDDING_PROVIDER=hashing,
+CHAT_PROVIDER=echo), so no OpenAI key or network access is needed:
+
+- chunking: `chunk_text` throughput on a synthetic corpus
+- ingest: chunks/sec through embedding (+ the INSERT path with --with-db)
+- search: `search_chunks` p50/p95/p99 at each --corpus-sizes step (--with-db)
+- chat: end-to-end latency per stage (embed, retrieval, time to first
+  token, total) through the streaming path
+
+    poetry run python benchmarks/run_suite.py --output bench-results.json
+    poetry run python benchmarks/run_suite.py --with-db --corpus-sizes 1000,10000,50000
+
+--with-db uses DATABASE_URL (run `python -m rag_knowledge_base_fastapi.services.schema`
+first). Rows are written under source="bench-suite" and removed afterwards;
+use a scratch database, since other rows in kb_chunks affect search timings.
+Output is one JSON document (stdout, or --output).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+SOURCE = "bench-suite"
+SUITE_VERSION = 1
+
+_VOCAB = [
+    "vector", "index", "query", "token", "latency", "cache", "embedding", "chunk", "document",
+    "search", "answer", "context", "model", "batch", "stream", "recall", "cluster", "graph",
+    "postgres", "memory", "request", "throughput", "shard", "replica", "budget", "signal",
+]
+
+
+def synthetic_text(chars: int, seed: int) -> str:
+    rng = random.Random(seed)
+    sentences: list[str] = []
+    size = 0
+    while size < chars:
+        s = " ".join(rng.choice(_VOCAB) for _ in range(rng.randint(6, 18))).capitalize() + "."
+        sentences.append(s)
+        size += len(s) + 1
+    return " ".join(sentences)[:chars]
+
+
+def percentiles(samples_s: list[float]) -> dict:
+    ms = np.array(samples_s) * 1000
+    return {
+        "n": len(samples_s),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+    }
+
+
+def bench_chunking(chars: int) -> dict:
+    from rag_knowledge_base_fastapi.services.chunking import chunk_text
+
+    text = synthetic_text(chars, seed=1)
+    t0 = time.perf_counter()
+    chunks = chunk_text(text, chunk_size=settings.chunk_size_chars, chunk_overlap=settings.chunk_overlap_chars)
+    elapsed = time.perf_counter() - t0
+    return {
+        "chars": len(text),
+        "chunks": len(chunks),
+        "seconds": elapsed,
+        "mb_per_sec": len(text) / elapsed / 1e6,
+        "chunks_per_sec": len(chunks) / elapsed,
+    }
+
+
+def _doc_chunks(doc: int, n: int) -> list[tuple[int, str]]:
+    from rag_knowledge_base_fastapi.services.chunking import chunk_text
+
+    step = settings.chunk_size_chars - settings.chunk_overlap_chars
+    text = synthetic_text(step * n + settings.chunk_overlap_chars, seed=1000 + doc)
+    chunks = chunk_text(text, chunk_size=settings.chunk_size_chars, chunk_overlap=settings.chunk_overlap_chars)
+    return [(c.chunk_index, c.content) for c in chunks[:n]]
+
+
+def bench_ingest_embedding(n_chunks: int) -> dict:
+    from rag_knowledge_base_fastapi.services.providers import get_embedder
+
+    texts = [content for _, content in _doc_chunks(0, n_chunks)]
+    t0 = time.perf_counter()
+    get_embedder(lane="bulk").embed_texts(texts)
+    elapsed = time.perf_counter() - t0
+    return {"chunks": len(texts), "seconds": elapsed, "chunks_per_sec": len(texts) / elapsed}
+
+
+class _Corpus:
+    """Grows the bench-suite rows in kb_chunks one document at a time."""
+
+    def __init__(self, doc_chunks: int) -> None:
+        self.doc_chunks = doc_chunks
+        self.rows = 0
+        self.docs = 0
+        self.insert_seconds = 0.0
+
+    def grow_to(self, rows: int) -> None:
+        from rag_knowledge_base_fastapi.services.kb_repository import insert_chunks_with_embeddings
+
+        while self.rows < rows:
+            chunks = _doc_chunks(self.docs, min(self.doc_chunks, rows - self.rows))
+            t0 = time.perf_counter()
+            result = insert_chunks_with_embeddings(source=SOURCE, doc_id=f"doc-{self.docs}", chunks=chunks)
+            self.insert_seconds += time.perf_counter() - t0
+            self.rows += result.inserted
+            self.docs += 1
+
+
+def _cleanup() -> None:
+    from sqlalchemy import text
+
+    from rag_knowledge_base_fastapi.services.db import get_engine
+
+    with get_engine().begin() as conn:
+        conn.execute(text("DELETE FROM kb_chunks WHERE source = :source"), {"source": SOURCE})
+        conn.execute(text("DELETE FROM kb_documents WHERE source = :source"), {"source": SOURCE})
+
+
+def _queries(n: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(_VOCAB) for _ in range(rng.randint(3, 8))) for _ in range(n)]
+
+
+def bench_search(corpus: _Corpus, sizes: list[int], queries: int, top_k: int) -> dict:
+    from rag_knowledge_base_fastapi.services.retrieval import search_chunks
+
+    steps = []
+    for size in sizes:
+        corpus.grow_to(size)
+        latencies = []
+        for q in _queries(queries):
+            t0 = time.perf_counter()
+            search_chunks(query=q, top_k=top_k)
+            latencies.append(time.perf_counter() - t0)
+        steps.append({"corpus_rows": corpus.rows, **percentiles(latencies)})
+    return {
+        "top_k": top_k,
+        "steps": steps,
+        "ingest": {
+            "chunks": corpus.rows,
+            "seconds": corpus.insert_seconds,
+            "chunks_per_sec": corpus.rows / corpus.insert_seconds if corpus.insert_seconds else None,
+        },
+    }
+
+
+async def bench_chat(requests: int, top_k: int, with_db: bool) -> dict:
+    from rag_knowledge_base_fastapi.services.chat_service import _build_messages
+    from rag_knowledge_base_fastapi.services.embedding_cache import aembed_query
+    from rag_knowledge_base_fastapi.services.providers import get_chat_provider
+    from rag_knowledge_base_fastapi.services.retrieval import RetrievalHit, asearch_chunks
+
+    stages: dict[str, list[float]] = {"embed": [], "retrieval": [], "first_token": [], "generation": [], "total": []}
+    stub_hits = [RetrievalHit(i, SOURCE, None, i, "context " * 100, 0.0) for i in range(top_k)]
+
+    for q in _queries(requests, seed=11):
+        t_start = time.perf_counter()
+        await aembed_query(q)
+        t_embed = time.perf_counter()
+        # asearch_chunks embeds again; the query cache (size 1 here) makes that free.
+        hits = await asearch_chunks(query=q, top_k=top_k) if with_db else stub_hits
+        t_retrieval = time.perf_counter()
+
+        t_first = None
+        async for _ in get_chat_provider().astream(_build_messages(q, hits)):
+            t_first = t_first or time.perf_counter()
+        t_end = time.perf_counter()
+
+        stages["embed"].append(t_embed - t_start)
+        stages["retrieval"].append(t_retrieval - t_embed)
+        stages["first_token"].append((t_first or t_end) - t_retrieval)
+        stages["generation"].append(t_end - t_retrieval)
+        stages["total"].append(t_end - t_start)
+
+    return {
+        "requests": requests,
+        "retrieval": "postgres" if with_db else "skipped (no --with-db)",
+        "stages": {name: percentiles(samples) for name, samples in stages.items()},
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _package_version() -> str | None:
+    try:
+        return metadata.version("rag-knowledge-base-fastapi")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunking-chars", type=int, default=5_000_000)
+    parser.add_argument("--ingest-chunks", type=int, default=2000)
+    parser.add_argument("--with-db", action="store_true")
+    parser.add_argument("--corpus-sizes", default="1000,10000", help="comma-separated row counts (--with-db)")
+    parser.add_argument("--doc-chunks", type=int, default=200, help="chunks per ingested document")
+    parser.add_argument("--search-queries", type=int, default=200)
+    parser.add_argument("--chat-requests", type=int, default=100)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--chat-latency-ms", type=float, default=800.0, help="echo backend total latency")
+    parser.add_argument("--chat-ttft-ms", type=float, default=250.0, help="echo backend time to first token")
+    parser.add_argument("--output", default=None, help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    settings.embedding_provider = "hashing"
+    settings.chat_provider = "echo"
+    settings.echo_chat_latency_ms = args.chat_latency_ms
+    settings.echo_chat_ttft_ms = args.chat_ttft_ms
+    # Measure embedding work instead of cache hits (1 entry still dedupes
+    # the second embed inside asearch_chunks).
+    settings.query_cache_max_entries = 1
+    settings.query_cache_sqlite_path = ""
+
+    results: dict = {
+        "chunking": bench_chunking(args.chunking_chars),
+        "ingest_embedding": bench_ingest_embedding(args.ingest_chunks),
+    }
+    if args.with_db:
+        sizes = sorted(int(s) for s in args.corpus_sizes.split(",") if s.strip())
+        _cleanup()
+        try:
+            results["search"] = bench_search(_Corpus(args.doc_chunks), sizes, args.search_queries, args.top_k)
+            results["chat"] = asyncio.run(bench_chat(args.chat_requests, args.top_k, with_db=True))
+        finally:
+            _cleanup()
+    else:
+        results["search"] = {"skipped": "needs --with-db"}
+        results["chat"] = asyncio.run(bench_chat(args.chat_requests, args.top_k, with_db=False))
+
+    report = {
+        "suite_version": SUITE_VERSION,
+        "package_version": _package_version(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": vars(args),
+        "results": results,
+    }
+    out = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(out + "\n")
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Local stand-in for the OpenAI HTTP API that injects rate limits.
+
+Implements POST /v1/embeddings and POST /v1/chat/completions (including
+`stream: true`) with a fixed latency and answers 429 (with Retry-After) when more than `--max-concurrent`
+requests are in flight, or randomly with `--rate-limit-prob`. GET /stats
+returns request counters.
+
+    poetry run python benchmarks/stub_openai_server.py --port 8099 --max-concurrent 8
+    OPENAI_BASE_URL=http://127.0.0.1:8099/v1 OPENAI_API_KEY=stub poetry run uvicorn ...
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import multiprocessing
+import random
+import threading
+import time
+from array import array
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+@dataclass
+class StubConfig:
+    latency_s: float = 0.02
+    max_concurrent: int = 0  # 0 = unlimited
+    rate_limit_prob: float = 0.0
+    retry_after_s: float = 0.2
+    dim: int = 1536
+    answer: str = "This is a stub answer citing [1]."
+    stats: dict = field(default_factory=lambda: {"requests": 0, "ok": 0, "rate_limited": 0, "max_in_flight": 0})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "StubOpenAIServer"
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+    def log_message(self, *args) -> None:  # keep benchmark output clean
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict[str, str] | None = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.server.lock:
+                self._send_json(200, dict(self.server.config.stats))
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        cfg = self.server.config
+
+        with self.server.lock:
+            cfg.stats["requests"] += 1
+            self.server.in_flight += 1
+            in_flight = self.server.in_flight
+            cfg.stats["max_in_flight"] = max(cfg.stats["max_in_flight"], in_flight)
+        try:
+            limited = (cfg.max_concurrent and in_flight > cfg.max_concurrent) or (
+                random.random() < cfg.rate_limit_prob
+            )
+            if limited:
+                with self.server.lock:
+                    cfg.stats["rate_limited"] += 1
+                self._send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached (stub)", "type": "rate_limit_exceeded"}},
+                    {"Retry-After": f"{cfg.retry_after_s:g}"},
+                )
+                return
+
+            if self.path.endswith("/chat/completions") and body.get("stream"):
+                self._stream_chat(body)
+                with self.server.lock:
+                    cfg.stats["ok"] += 1
+                return
+
+            time.sleep(cfg.latency_s)
+            if self.path.endswith("/embeddings"):
+                self._send_json(200, self._embeddings(body))
+            elif self.path.endswith("/chat/completions"):
+                self._send_json(200, self._chat(body))
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            with self.server.lock:
+                cfg.stats["ok"] += 1
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _embeddings(self, body: dict) -> dict:
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        dim = self.server.config.dim
+        data = []
+        for i, text in enumerate(inputs):
+            rng = random.Random(hash(text))
+            vec = array("f", (rng.uniform(-1, 1) for _ in range(dim)))
+            emb = base64.b64encode(vec.tobytes()).decode() if body.get("encoding_format") == "base64" else vec.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        }
+
+    def _chat(self, body: dict) -> dict:
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.server.config.answer},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+
+    def _stream_chat(self, body: dict) -> None:
+        """SSE like the real API: latency is split evenly across the word deltas."""
+        words = self.server.config.answer.split(" ")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for i, word in enumerate(words):
+                time.sleep(self.server.config.latency_s / len(words))
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [
+                        {"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}
+                    ],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client cancelled the stream
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog (5) drops bursts of new connections
+
+    def __init__(self, address: tuple[str, int], config: StubConfig) -> None:
+        super().__init__(address, _Handler)
+        self.config = config
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def serve_in_thread(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> StubOpenAIServer:
+    """Start a stub server on a background thread (port 0 = pick a free port)."""
+    server = StubOpenAIServer((host, port), config)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve_in_process(config: StubConfig, host: str = "127.0.0.1", port: int = 0) -> tuple[str, multiprocessing.Process]:
+    """
+    Start a stub server in a forked child process; returns (base_url, process).
+
+    Use this when the benchmark itself is CPU-bound in Python (e.g. an event
+    loop), so the stub's handler threads don't compete with it for the GIL.
+    Stats are not shared back with the parent.
+    """
+    server = StubOpenAIServer((host, port), config)
+    proc = multiprocessing.get_context("fork").Process(target=server.serve_forever, daemon=True)
+    proc.start()
+    server.socket.close()  # the child owns the listening socket now
+    return server.base_url, proc
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--max-concurrent", type=int, default=0)
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.2)
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_s=args.latency_ms / 1000,
+        max_concurrent=args.max_concurrent,
+        rate_limit_prob=args.rate_limit_prob,
+        retry_after_s=args.retry_after,
+        dim=args.dim,
+    )
+    server = StubOpenAIServer((args.host, args.port), config)
+    print(f"stub OpenAI API listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,51 @@
+import json
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+
 from fastapi import FastAPI
 from rag_knowledge_base_fastapi.config.settings import settings
-from rag_knowledge_base_fastapi.services.db import create_db_engine, check_db_health
-
-from rag_knowledge_base_fastapi.models.ingest import IngestTextRequest
-from rag_knowledge_base_fastapi.services.chunking import chunk_text
-from rag_knowledge_base_fastapi.services.kb_repository import insert_chunks_with_embeddings
-from rag_knowledge_base_fastapi.models.search import SearchRequest, SearchResponse, SearchHit
-from rag_knowledge_base_fastapi.services.retrieval import search_chunks
+from rag_knowledge_base_fastapi.services.db import (
+    check_db_health,
+    dispose_async_engine,
+    dispose_engine,
+    get_async_engine,
+    get_engine,
+    get_pool_stats,
+    init_async_engine,
+    init_engine,
+)
+
+from rag_knowledge_base_fastapi.models.ingest import BulkLoadRequest, IngestTextRequest
+from rag_knowledge_base_fastapi.services.bulk_load import bulk_load_status, start_bulk_load
+from rag_knowledge_base_fastapi.services.ingest_jobs import (
+    IngestJob,
+    QueueFullError,
+    close_ingest_queue,
+    get_ingest_queue,
+)
+from rag_knowledge_base_fastapi.models.search import (
+    BatchSearchRequest,
+    BatchSearchResponse,
+    SearchHit,
+    SearchRequest,
+    SearchResponse,
+)
+from rag_knowledge_base_fastapi.services.retrieval import SearchQuery, asearch_chunks, asearch_chunks_batch
 
 from rag_knowledge_base_fastapi.models.chat import ChatRequest, ChatResponse, Citation
-from rag_knowledge_base_fastapi.services.chat_service import answer_with_rag
-from fastapi import UploadFile, File, Form, HTTPException
+from rag_knowledge_base_fastapi.services.chat_service import aanswer_with_rag, astream_answer_with_rag
+from fastapi import UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from rag_knowledge_base_fastapi.services.openai_client import UpstreamUnavailableError, close_openai_clients
+from rag_knowledge_base_fastapi.services.embedding_cache import get_query_embedding_cache
+from rag_knowledge_base_fastapi.services.embedding_coalescer import get_query_embedding_coalescer
+from rag_knowledge_base_fastapi.services.answer_cache import get_answer_cache
+from rag_knowledge_base_fastapi.services.numpy_index import close_numpy_index, get_numpy_index
+from rag_knowledge_base_fastapi.services.kb_repository import adelete_document, alist_documents, text_doc_id
+from rag_knowledge_base_fastapi.services.metrics import MetricsMiddleware, Sample, register_collector, render_metrics
+from rag_knowledge_base_fastapi.services.slow_requests import close_slow_request_sampler
 
 from sqlalchemy import text
-from rag_knowledge_base_fastapi.services.db import create_db_engine
 
 
 
@@ -24,12 +56,45 @@ from fastapi.staticfiles import StaticFiles
 
 
 
-app = FastAPI(title ="RAG Knowledge Base (FastAPI)", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One engine (and connection pool) per worker process. Request handlers
+    # use the async engine; the sync one serves health checks and scripts.
+    init_engine()
+    init_async_engine()
+    if settings.retrieval_backend == "numpy":
+        get_numpy_index()  # mmap the matrix now rather than on the first search
+    get_ingest_queue().start()
+    try:
+        yield
+    finally:
+        await close_ingest_queue()
+        await dispose_async_engine()
+        dispose_engine()
+        close_numpy_index()
+        await close_openai_clients()
+        close_slow_request_sampler()
+
+
+app = FastAPI(title ="RAG Knowledge Base (FastAPI)", version="0.1.0", lifespan=lifespan)
 
 BASE_DIR = Path(__file__).resolve().parent
 STATIC_DIR = BASE_DIR / "static"
 
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(UpstreamUnavailableError)
+async def upstream_unavailable_handler(request: Request, exc: UpstreamUnavailableError) -> JSONResponse:
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))} if exc.retry_after else None
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=headers)
+
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError) -> JSONResponse:
+    headers = {"Retry-After": str(max(1, round(exc.retry_after)))}
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers=headers)
 
 
 @app.get("/health")
@@ -45,50 +110,106 @@ def config() -> dict:
         "rag_top_k_default": settings.rag_top_k_default,
         "chunk_size_chars": settings.chunk_size_chars,
         "chunk_overlap_chars": settings.chunk_overlap_chars,
+        "chunker": settings.chunker,
+        "chunk_max_tokens": settings.chunk_max_tokens,
+        "chunk_overlap_tokens": settings.chunk_overlap_tokens,
         "openai_api_key_configured": bool(settings.openai_api_key),
+        "embedding_provider": settings.embedding_provider,
+        "chat_provider": settings.chat_provider,
     }
 
 @app.get("/db/health")
 def db_health() -> dict:
-    engine = create_db_engine()
+    engine = get_engine()
     result = check_db_health(engine)
+    pool = get_pool_stats(engine)
+    async_pool = get_pool_stats(get_async_engine())
     return {
         "ok": result.ok,
         "server_version": result.server_version,
         "error": result.error,
+        "pool": asdict(pool) if pool else None,
+        "async_pool": asdict(async_pool) if async_pool else None,
     }
 
-@app.post("/ingest/text")
-def ingest_text(req: IngestTextRequest) -> dict:
-    chunks = chunk_text(
-        req.content,
-        chunk_size=settings.chunk_size_chars,
-        chunk_overlap=settings.chunk_overlap_chars,
-    )
+@app.get("/cache/stats")
+def cache_stats() -> dict:
+    return {
+        "query_embeddings": asdict(get_query_embedding_cache().stats()),
+        "answers": asdict(get_answer_cache().stats()),
+    }
 
-    result = insert_chunks_with_embeddings(
+@register_collector
+def _service_metrics():
+    for name, engine in (("sync", get_engine()), ("async", get_async_engine())):
+        pool = get_pool_stats(engine)
+        if pool is None:
+            continue
+        labels = (("pool", name),)
+        yield Sample("rag_db_pool_size", "Connections kept open by the pool.", pool.size, labels)
+        yield Sample("rag_db_pool_checked_out", "Connections currently in use.", pool.checked_out, labels)
+        yield Sample("rag_db_pool_overflow", "Connections beyond the pool size (negative while below it).", pool.overflow, labels)
+        yield Sample("rag_db_pool_timeouts_total", "Checkouts that timed out.", pool.timeouts, labels, "counter")
+
+    for name, stats in (
+        ("query_embeddings", get_query_embedding_cache().stats()),
+        ("answers", get_answer_cache().stats()),
+    ):
+        labels = (("cache", name),)
+        yield Sample("rag_cache_entries", "Entries held by the cache.", stats.size, labels)
+        yield Sample("rag_cache_hits_total", "Cache lookups answered from the cache.", stats.hits, labels, "counter")
+        yield Sample("rag_cache_misses_total", "Cache lookups that missed.", stats.misses, labels, "counter")
+        lookups = stats.hits + stats.misses
+        hit_ratio = stats.hits / lookups if lookups else 0
+        yield Sample("rag_cache_hit_ratio", "Hits over lookups since start.", hit_ratio, labels)
+
+    coalescer = get_query_embedding_coalescer()
+    if coalescer is not None:
+        stats = coalescer.stats()
+        for name, help, value in (
+            ("rag_embed_coalescer_queries_total", "Queries embedded through the coalescer.", stats.queries),
+            ("rag_embed_coalescer_batches_total", "Embeddings requests sent by the coalescer.", stats.batches),
+        ):
+            yield Sample(name, help, value, kind="counter")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _job_accepted(job: IngestJob) -> dict:
+    return {"job_id": job.id, "status": job.status, "doc_id": job.doc_id, "status_url": f"/ingest/jobs/{job.id}"}
+
+@app.post("/ingest/text", status_code=202)
+async def ingest_text(req: IngestTextRequest) -> dict:
+    if not req.content.strip():
+        raise HTTPException(status_code=400, detail="Content is empty.")
+
+    job = await get_ingest_queue().submit_text(
+        req.content,
         source=req.source,
-        doc_id=req.doc_id,
-        chunks=[(c.chunk_index, c.content) for c in chunks],
+        doc_id=req.doc_id or text_doc_id(req.content),
         metadata={"ingest_type": "text"},
     )
-
-    return {
-        "source": req.source,
-        "doc_id": req.doc_id,
-        "chunks_created": len(chunks),
-        "chunks_inserted": result.inserted,
-    }
+    return _job_accepted(job)
 
 @app.post("/search", response_model=SearchResponse)
-def search(req: SearchRequest) -> SearchResponse:
-    hits = search_chunks(
+async def search(req: SearchRequest) -> SearchResponse:
+    hits = await asearch_chunks(
         query=req.query,
         top_k=req.top_k,
         doc_id=req.doc_id,
         source=req.source,
+        ef_search=req.ef_search,
+        probes=req.probes,
+        oversample=req.oversample,
+        mode=req.mode,
+        mmr_lambda=req.mmr_lambda,
+        fetch_multiplier=req.fetch_multiplier,
     )
 
+    return _search_response(req, hits)
+
+def _search_response(req: SearchRequest, hits) -> SearchResponse:
     return SearchResponse(
         query=req.query,
         top_k=req.top_k,
@@ -105,19 +226,79 @@ def search(req: SearchRequest) -> SearchResponse:
         ],
     )
 
+@app.post("/search/batch", response_model=BatchSearchResponse)
+async def search_batch(req: BatchSearchRequest) -> BatchSearchResponse:
+    """Run many searches in one round trip: one embedding request and one SQL statement per query shape."""
+    results = await asearch_chunks_batch([SearchQuery(**r.model_dump()) for r in req.requests])
+    return BatchSearchResponse(results=[_search_response(r, hits) for r, hits in zip(req.requests, results)])
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest) -> ChatResponse:
-    result = answer_with_rag(
+async def chat(req: ChatRequest) -> ChatResponse:
+    result = await aanswer_with_rag(
         message=req.message,
         top_k=req.top_k,
         doc_id=req.doc_id,
         source=req.source,
+        ef_search=req.ef_search,
+        probes=req.probes,
+        oversample=req.oversample,
+        mode=req.mode,
+        mmr_lambda=req.mmr_lambda,
+        fetch_multiplier=req.fetch_multiplier,
     )
 
     return ChatResponse(
         message=req.message,
         answer=result.answer,
         citations=result.citations,
+        cached=result.cached,
+        context_tokens=result.context_tokens,
+        context_tokens_saved=result.context_tokens_saved,
+    )
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest) -> StreamingResponse:
+    """
+    Server-Sent Events: `retrieval` (hits), then `token` (answer deltas),
+    then `done` (cited indices + citations); `error` if the answer fails
+    midway.
+    """
+    events = astream_answer_with_rag(
+        message=req.message,
+        top_k=req.top_k,
+        doc_id=req.doc_id,
+        source=req.source,
+        ef_search=req.ef_search,
+        probes=req.probes,
+        oversample=req.oversample,
+        mode=req.mode,
+        mmr_lambda=req.mmr_lambda,
+        fetch_multiplier=req.fetch_multiplier,
+    )
+    # Run retrieval before committing to a 200 so validation, DB and
+    # upstream-unavailable errors still map to normal HTTP responses.
+    first = await anext(events)
+
+    async def body():
+        # On client disconnect Starlette cancels this task; closing `events`
+        # then closes the upstream OpenAI stream.
+        try:
+            yield _sse(*first)
+            async for event, data in events:
+                yield _sse(event, data)
+        except Exception as exc:
+            yield _sse("error", {"detail": str(exc)})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 @app.get("/", response_class=HTMLResponse)
@@ -125,7 +306,7 @@ def home() -> HTMLResponse:
     html = (STATIC_DIR / "chat.html").read_text(encoding="utf-8")
     return HTMLResponse(content=html)
 
-@app.post("/ingest/file")
+@app.post("/ingest/file", status_code=202)
 async def ingest_file(
     file: UploadFile = File(...),
     source: str = Form("upload"),
@@ -136,46 +317,56 @@ async def ingest_file(
     if not filename.lower().endswith(".txt"):
         raise HTTPException(status_code=400, detail="Only .txt files are supported.")
 
-    raw = await file.read()
-
-    try:
-        content = raw.decode("utf-8")
-    except UnicodeDecodeError:
-        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded text.")
-
-    if not content.strip():
-        raise HTTPException(status_code=400, detail="Uploaded file is empty.")
-
-    chunks = chunk_text(
-        content,
-        chunk_size=settings.chunk_size_chars,
-        chunk_overlap=settings.chunk_overlap_chars,
-    )
-
-    result = insert_chunks_with_embeddings(
+    # Starlette has already spooled the upload to a temp file; the job keeps
+    # its own copy, since the request's goes away when we return.
+    job = await get_ingest_queue().submit_file(
+        file.file,
         source=source,
         doc_id=doc_id or filename,
-        chunks=[(c.chunk_index, c.content) for c in chunks],
         metadata={"ingest_type": "file", "filename": filename},
     )
+    return _job_accepted(job)
+
+@app.get("/ingest/jobs/{job_id}")
+def ingest_job_status(job_id: str) -> dict:
+    job = get_ingest_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job.")
+    return job.to_dict()
+
+@app.post("/admin/bulk-load", status_code=202)
+def admin_bulk_load(req: BulkLoadRequest) -> dict:
+    if not settings.bulk_load_root:
+        raise HTTPException(status_code=404, detail="Bulk loading is disabled (BULK_LOAD_ROOT is not set).")
+    root = Path(settings.bulk_load_root).resolve()
+    path = (root / req.path).resolve()
+    if not path.is_relative_to(root) or not path.exists():
+        raise HTTPException(status_code=400, detail="Path must exist under BULK_LOAD_ROOT.")
+    try:
+        return start_bulk_load(path, source=req.source, keep_indexes=not req.drop_indexes)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
 
-    return {
-        "source": source,
-        "doc_id": doc_id or filename,
-        "filename": filename,
-        "chunks_created": len(chunks),
-        "chunks_inserted": result.inserted,
-    }
+@app.get("/admin/bulk-load")
+def admin_bulk_load_status() -> dict:
+    status = bulk_load_status()
+    if status is None:
+        raise HTTPException(status_code=404, detail="No bulk load has run.")
+    return status
 
 @app.get("/kb/docs")
-def list_docs() -> list[dict]:
-    e = create_db_engine()
-    with e.connect() as c:
-        rows = c.execute(text("""
-            select source, doc_id, count(*) as chunks
-            from kb_chunks
-            group by source, doc_id
-            order by max(id) desc
-        """)).fetchall()
-
-    return [{"source": r[0], "doc_id": r[1], "chunks": r[2]} for r in rows]
+async def list_docs(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: int | None = Query(None, description="next_cursor of the previous page"),
+    source: str | None = None,
+    prefix: str | None = Query(None, description="doc_id prefix"),
+) -> dict:
+    page = await alist_documents(limit=limit, cursor=cursor, source=source, prefix=prefix)
+    return {"docs": page.docs, "next_cursor": page.next_cursor}
+
+@app.delete("/kb/docs/{doc_id}")
+async def delete_doc(doc_id: str, source: str | None = None) -> dict:
+    deleted = await adelete_document(doc_id=doc_id, source=source)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Unknown document.")
+    return {"doc_id": doc_id, "source": source, "deleted": deleted}
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -8,6 +10,12 @@ class ChatRequest(BaseModel):
     top_k: int = Field(default=5, ge=1, le=20, description="How many chunks to retrieve for context")
     doc_id: str | None = Field(default=None, description="Optional filter to a specific document id")
     source: str | None = Field(default=None, description="Optional filter to a specific source")
+    ef_search: int | None = Field(default=None, ge=1, le=1000, description="HNSW search breadth for this query (recall vs latency)")
+    probes: int | None = Field(default=None, ge=1, le=32768, description="IVFFlat lists to probe for this query (recall vs latency)")
+    oversample: int | None = Field(default=None, ge=1, le=100, description="Shortlist size as a multiple of top_k when VECTOR_QUANTIZATION is set")
+    mode: Literal["vector", "lexical", "hybrid"] | None = Field(default=None, description="vector, lexical (full-text, no embedding call) or hybrid (both, fused); default SEARCH_MODE")
+    mmr_lambda: float | None = Field(default=None, ge=0, le=1, description="MMR trade-off between relevance (1.0) and diversity (0.0); default MMR_LAMBDA")
+    fetch_multiplier: int | None = Field(default=None, ge=1, le=25, description="Fetch top_k * this many candidates and keep the top_k picked by MMR (1 = off); default MMR_FETCH_MULTIPLIER")
 
 
 class Citation(BaseModel):
@@ -22,3 +30,6 @@ class ChatResponse(BaseModel):
     message: str
     answer: str
     citations: list[Citation]
+    cached: bool = Field(default=False, description="Served from the semantic answer cache (no search or completion)")
+    context_tokens: int = Field(default=0, description="Tokens of retrieved context in the prompt")
+    context_tokens_saved: int = Field(default=0, description="Context tokens saved by merging overlapping chunks and the CONTEXT_MAX_TOKENS budget")
@@ -5,5 +5,16 @@ from pydantic import BaseModel, Field
 class IngestTextRequest(BaseModel):
     source: str = Field(..., description="Logical source identifier,  e.g. filename or URL")
     content: str = Field(..., description="Raw text content to chunk and ingest")
-    doc_id: str | None = Field(default=None, description="Optional document id for grouping")
-    
\ No newline at end of file
+    doc_id: str | None = Field(default=None, description="Document id; re-ingesting it replaces the document (default: derived from the content)")
+
+
+class BulkLoadRequest(BaseModel):
+    path: str = Field(..., description="Directory of .txt files or a JSONL file, relative to BULK_LOAD_ROOT")
+    source: str | None = Field(default=None, description="Source for the documents (default: directory/file name)")
+    drop_indexes: bool = Field(
+        default=False,
+        description=(
+            "Drop kb_chunks indexes for the load and rebuild them afterwards: faster, but searches lose the ANN "
+            "index and ingests fail until the rebuild finishes"
+        ),
+    )
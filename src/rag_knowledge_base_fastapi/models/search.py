@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 
@@ -8,6 +10,12 @@ class SearchRequest(BaseModel):
     top_k: int = Field(default=5, ge=1, le=20, description="Number of chunks to retrieve")
     doc_id: str | None = Field(default=None, description="Optional filter to a specific document id")
     source: str | None = Field(default=None, description="Optional filter to a specific source")
+    ef_search: int | None = Field(default=None, ge=1, le=1000, description="HNSW search breadth for this query (recall vs latency)")
+    probes: int | None = Field(default=None, ge=1, le=32768, description="IVFFlat lists to probe for this query (recall vs latency)")
+    oversample: int | None = Field(default=None, ge=1, le=100, description="Shortlist size as a multiple of top_k when VECTOR_QUANTIZATION is set")
+    mode: Literal["vector", "lexical", "hybrid"] | None = Field(default=None, description="vector, lexical (full-text, no embedding call) or hybrid (both, fused); default SEARCH_MODE")
+    mmr_lambda: float | None = Field(default=None, ge=0, le=1, description="MMR trade-off between relevance (1.0) and diversity (0.0); default MMR_LAMBDA")
+    fetch_multiplier: int | None = Field(default=None, ge=1, le=25, description="Fetch top_k * this many candidates and keep the top_k picked by MMR (1 = off); default MMR_FETCH_MULTIPLIER")
 
 
 class SearchHit(BaseModel):
@@ -16,10 +24,18 @@ class SearchHit(BaseModel):
     doc_id: str | None
     chunk_index: int
     content: str
-    score: float = Field(..., description="Similarity score (lower distance => better match)")
+    score: float = Field(..., description="vector: distance (lower is better); lexical/hybrid: relevance (higher is better)")
 
 
 class SearchResponse(BaseModel):
     query: str
     top_k: int
     hits: list[SearchHit]
+
+
+class BatchSearchRequest(BaseModel):
+    requests: list[SearchRequest] = Field(..., min_length=1, max_length=256, description="Searches to run together; results come back in the same order")
+
+
+class BatchSearchResponse(BaseModel):
+    results: list[SearchResponse]
@@ -0,0 +1,239 @@
+"""
+Semantic answer cache for /chat.
+
+A question whose embedding is within ANSWER_CACHE_SIMILARITY (cosine) of a
+cached question with the same filters, search mode, top_k, ANN and MMR
+settings and models gets the cached answer instead of a search and a chat
+completion.
+
+Each entry records the chunk ids its answer was built from, with a
+fingerprint of their state (see `chunks_fingerprint`). A hit is only
+served after re-checking the fingerprint, so an answer is dropped once a
+re-ingest changed or deleted any of its chunks, whichever process or
+tool (API, bulk loader) did the write. Answers are per process, bounded
+by ANSWER_CACHE_MAX_ENTRIES (LRU) and ANSWER_CACHE_TTL_SECONDS.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable, Sequence
+
+import numpy as np
+from sqlalchemy import text
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.db import get_async_engine, get_engine
+from rag_knowledge_base_fastapi.services.numpy_index import get_numpy_index
+
+
+@dataclass(frozen=True)
+class AnswerCacheStats:
+    size: int
+    max_entries: int
+    hits: int
+    misses: int
+    stale: int  # near matches dropped because their chunks changed
+    evictions: int
+    expirations: int
+    hit_rate: float
+
+
+@dataclass(frozen=True)
+class CachedAnswer:
+    id: int
+    value: Any
+    chunk_ids: tuple[int, ...]
+    fingerprint: Hashable
+    similarity: float
+
+
+@dataclass
+class _Entry:
+    partition: Hashable
+    vector: np.ndarray  # unit length
+    value: Any
+    chunk_ids: tuple[int, ...]
+    fingerprint: Hashable
+    expires_at: float
+
+
+class _Partition:
+    """Entries sharing a key, with their vectors stacked for one matrix-vector product."""
+
+    def __init__(self) -> None:
+        self.ids: list[int] = []
+        self.matrix: np.ndarray | None = None  # rebuilt lazily after changes
+
+
+class AnswerCache:
+    def __init__(self, *, max_entries: int, ttl_seconds: float, threshold: float) -> None:
+        self._max_entries = max(0, max_entries)
+        self._ttl = ttl_seconds
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._partitions: dict[Hashable, _Partition] = {}
+        self._next_id = 1
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_entries > 0
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        part = self._partitions[entry.partition]
+        part.ids.remove(entry_id)
+        part.matrix = None
+        if not part.ids:
+            del self._partitions[entry.partition]
+
+    def lookup(self, partition: Hashable, vector: np.ndarray) -> CachedAnswer | None:
+        """
+        Nearest cached question in `partition` at or above the threshold.
+        Counts a miss if there is none; callers then `confirm` or `reject` it.
+        """
+        q = _unit(vector)
+        with self._lock:
+            part = self._partitions.get(partition)
+            if part is not None:
+                # Expired entries must not shadow a live match behind them.
+                now = time.monotonic()
+                for entry_id in [i for i in part.ids if now >= self._entries[i].expires_at]:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                part = self._partitions.get(partition)
+            if part is not None and part.matrix is None:
+                part.matrix = np.stack([self._entries[i].vector for i in part.ids])
+            best: CachedAnswer | None = None
+            if part is not None:
+                sims = part.matrix @ q
+                pos = int(np.argmax(sims))
+                entry_id = part.ids[pos]
+                entry = self._entries[entry_id]
+                if sims[pos] >= self._threshold:
+                    self._entries.move_to_end(entry_id)
+                    best = CachedAnswer(
+                        id=entry_id,
+                        value=entry.value,
+                        chunk_ids=entry.chunk_ids,
+                        fingerprint=entry.fingerprint,
+                        similarity=float(sims[pos]),
+                    )
+            if best is None:
+                self.misses += 1
+            return best
+
+    def confirm(self, hit: CachedAnswer) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def reject(self, hit: CachedAnswer) -> None:
+        """The hit's chunks changed: drop it and count a miss."""
+        with self._lock:
+            if hit.id in self._entries:
+                self._remove(hit.id)
+            self.stale += 1
+            self.misses += 1
+
+    def put(
+        self,
+        partition: Hashable,
+        vector: np.ndarray,
+        value: Any,
+        *,
+        chunk_ids: Sequence[int],
+        fingerprint: Hashable,
+    ) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(
+                partition=partition,
+                vector=_unit(vector),
+                value=value,
+                chunk_ids=tuple(chunk_ids),
+                fingerprint=fingerprint,
+                expires_at=time.monotonic() + self._ttl,
+            )
+            part = self._partitions.setdefault(partition, _Partition())
+            part.ids.append(entry_id)
+            part.matrix = None
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._partitions.clear()
+
+    def stats(self) -> AnswerCacheStats:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return AnswerCacheStats(
+                size=len(self._entries),
+                max_entries=self._max_entries,
+                hits=self.hits,
+                misses=self.misses,
+                stale=self.stale,
+                evictions=self.evictions,
+                expirations=self.expirations,
+                hit_rate=self.hits / lookups if lookups else 0.0,
+            )
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+# An upsert that changes a chunk sets created_at = now() (kb_repository), and
+# deletes drop rows, so (count, max(created_at)) moves on any change that
+# matters. Primary key lookups only.
+_FINGERPRINT_SQL = text("SELECT count(*), max(created_at) FROM kb_chunks WHERE id = ANY(:ids)")
+
+
+def chunks_fingerprint(chunk_ids: Sequence[int]) -> Hashable:
+    """Value that changes when any of these chunks is re-written or deleted."""
+    if settings.retrieval_backend == "numpy":
+        # Changed chunks get new ids there; live count is enough.
+        return get_numpy_index().live_count(chunk_ids)
+    with get_engine().connect() as conn:
+        return tuple(conn.execute(_FINGERPRINT_SQL, {"ids": list(chunk_ids)}).one())
+
+
+async def achunks_fingerprint(chunk_ids: Sequence[int]) -> Hashable:
+    """Async variant of `chunks_fingerprint`."""
+    if settings.retrieval_backend == "numpy":
+        return await asyncio.to_thread(get_numpy_index().live_count, chunk_ids)
+    async with get_async_engine().connect() as conn:
+        return tuple((await conn.execute(_FINGERPRINT_SQL, {"ids": list(chunk_ids)})).one())
+
+
+_cache: AnswerCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = AnswerCache(
+                max_entries=settings.answer_cache_max_entries,
+                ttl_seconds=settings.answer_cache_ttl_seconds,
+                threshold=settings.answer_cache_similarity,
+            )
+        return _cache
@@ -0,0 +1,524 @@
+"""
+Bulk corpus loader for initial backfills.
+
+    python -m rag_knowledge_base_fastapi.services.bulk_load corpus/        # *.txt files, recursively
+    python -m rag_knowledge_base_fastapi.services.bulk_load corpus.jsonl   # one document per line
+
+Three overlapping stages instead of one /ingest request per document:
+
+- chunk: documents are read, chunked and hashed in a process pool
+- embed: large batches of chunk texts go to the embedding provider from a
+  few threads (each batch is packed into EMBED_BATCH_MAX_* requests)
+- copy: rows are streamed into kb_chunks with binary COPY FROM STDIN,
+  committing every `commit_rows` rows
+
+Secondary and ANN indexes on kb_chunks are dropped before the load and
+rebuilt from their saved definitions afterwards (also when the load
+fails), which is much faster than maintaining them row by row. Searches
+lose them meanwhile, and upserts (/ingest, ingest jobs) fail without the
+unique chunk key, so run it before serving traffic, or pass
+`--keep-indexes` for a load into a live table. If the process is killed
+mid-load, `schema` and `vector_index create` recreate them.
+
+Documents already stored under the same (source, doc_id) are replaced
+whole, so a re-loaded document with fewer chunks keeps no old tail: with
+`--keep-indexes` their rows are deleted in the transaction that copies
+the new ones, otherwise every older ingest of a loaded document is
+deleted before the unique key is rebuilt. A document that occurs more
+than once in the corpus keeps its last copy. JSONL documents without a
+doc_id get one from their content, as /ingest/text does. The
+kb_documents catalog is then refreshed from kb_chunks in one pass.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from functools import partial
+from itertools import chain, groupby
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+import numpy as np
+from sqlalchemy import text
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.chunking import ChunkMode, chunk_text, chunking_options
+from rag_knowledge_base_fastapi.services.db import get_engine
+from rag_knowledge_base_fastapi.services.kb_repository import content_hash, text_doc_id
+from rag_knowledge_base_fastapi.services.numpy_index import get_numpy_index
+from rag_knowledge_base_fastapi.services.providers import Embedder, get_embedder
+from rag_knowledge_base_fastapi.services.schema import _DEDUPE_SQL, chunk_indexes, refresh_documents
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# (source, doc_id, chunk_index, content, content_hash, metadata)
+ChunkRow = tuple[str, str, int, str, str, dict[str, Any]]
+
+_COPY_SQL = """
+COPY kb_chunks (source, doc_id, chunk_index, content, content_hash, embedding_model, metadata, embedding)
+FROM STDIN WITH (FORMAT BINARY)
+"""
+_COPY_TYPES = ["text", "text", "int4", "text", "text", "text", "jsonb", "vector"]
+
+_DELETE_DOCUMENTS_SQL = """
+DELETE FROM kb_chunks c
+USING unnest(%s::text[], %s::text[]) AS d(source, doc_id)
+WHERE c.source = d.source AND c.doc_id = d.doc_id
+"""
+
+@dataclass(frozen=True)
+class CorpusDocument:
+    source: str
+    doc_id: str
+    metadata: dict[str, Any]
+    content: str | None = None  # JSONL documents carry their text
+    path: str | None = None  # files are read in the worker process
+
+
+@dataclass
+class StageStats:
+    rows: int = 0
+    # Busy time summed over the stage's workers; the stages overlap.
+    seconds: float = 0.0
+
+    def to_dict(self) -> dict[str, float]:
+        return {**asdict(self), "rows_per_sec": self.rows / self.seconds if self.seconds else 0.0}
+
+
+@dataclass
+class BulkLoadStats:
+    documents: int = 0
+    skipped: list[str] = field(default_factory=list)  # documents that aren't UTF-8
+    chunk: StageStats = field(default_factory=StageStats)
+    embed: StageStats = field(default_factory=StageStats)
+    copy: StageStats = field(default_factory=StageStats)
+    dedupe_deleted: int = 0
+    index_seconds: dict[str, float] = field(default_factory=dict)  # rebuild time per index
+    catalog_seconds: float = 0.0  # kb_documents refresh
+    wall_seconds: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "documents": self.documents,
+            "skipped": list(self.skipped),
+            "chunk": self.chunk.to_dict(),
+            "embed": self.embed.to_dict(),
+            "copy": self.copy.to_dict(),
+            "dedupe_deleted": self.dedupe_deleted,
+            "index_seconds": dict(self.index_seconds),
+            "catalog_seconds": self.catalog_seconds,
+            "wall_seconds": self.wall_seconds,
+            "rows_per_sec": self.copy.rows / self.wall_seconds if self.wall_seconds else 0.0,
+        }
+
+
+ProgressCallback = Callable[[BulkLoadStats], None]
+
+
+# ---------------------------------------------------------------------------
+# Input
+# ---------------------------------------------------------------------------
+
+
+def iter_documents(path: str | os.PathLike, *, source: str | None = None) -> Iterator[CorpusDocument]:
+    """
+    Documents of a corpus: a directory of .txt files (doc_id = path relative
+    to it, source = `source` or the directory name) or a JSONL file with one
+    {"content", "source"?, "doc_id"?, "metadata"?} object per line
+    (doc_id defaults to one derived from the content).
+    """
+    root = Path(path)
+    if root.is_dir():
+        src = source or root.name
+        for file in sorted(root.rglob("*.txt")):
+            rel = file.relative_to(root).as_posix()
+            meta = {"ingest_type": "bulk", "filename": rel}
+            yield CorpusDocument(source=src, doc_id=rel, metadata=meta, path=str(file))
+        return
+
+    with open(root, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            doc = json.loads(line)
+            if not isinstance(doc.get("content"), str):
+                raise ValueError(f"{root}:{line_no}: 'content' must be a string")
+            yield CorpusDocument(
+                source=doc.get("source") or source or root.stem,
+                doc_id=doc.get("doc_id") or text_doc_id(doc["content"]),
+                metadata={"ingest_type": "bulk", **(doc.get("metadata") or {})},
+                content=doc["content"],
+            )
+
+
+def _chunk_document(
+    doc: CorpusDocument, chunk_size: int, chunk_overlap: int, mode: ChunkMode
+) -> tuple[list[ChunkRow] | None, float]:
+    """Process pool task: (rows, seconds); rows is None if the file isn't UTF-8."""
+    t0 = time.perf_counter()
+    try:
+        content = doc.content if doc.path is None else Path(doc.path).read_text(encoding="utf-8")
+    except UnicodeDecodeError:
+        return None, time.perf_counter() - t0
+    rows = [
+        (doc.source, doc.doc_id, c.chunk_index, c.content, content_hash(c.content), doc.metadata)
+        for c in chunk_text(content, chunk_size=chunk_size, chunk_overlap=chunk_overlap, mode=mode)
+    ]
+    return rows, time.perf_counter() - t0
+
+
+def _bounded_map(
+    executor: Executor, fn: Callable[[T], R], items: Iterable[T], *, inflight: int
+) -> Iterator[tuple[T, R]]:
+    """(item, fn(item)) in input order, submitting lazily with at most `inflight` tasks queued."""
+    pending: deque[tuple[T, Future]] = deque()
+    for item in items:
+        pending.append((item, executor.submit(fn, item)))
+        if len(pending) >= inflight:
+            done, fut = pending.popleft()
+            yield done, fut.result()
+    while pending:
+        done, fut = pending.popleft()
+        yield done, fut.result()
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+
+def _chunk_stage(
+    docs: Iterable[CorpusDocument], pool: Executor, stats: BulkLoadStats, *, procs: int, batch_rows: int
+) -> Iterator[list[ChunkRow]]:
+    """
+    Chunk documents in the process pool; yields batches of about
+    `batch_rows` rows. A document repeated within a batch (same source and
+    doc_id, e.g. identical JSONL lines) keeps only its last occurrence;
+    the stages replace copies from earlier batches like stored documents.
+    """
+    chunker = partial(_chunk_document, **chunking_options())
+    batch: list[ChunkRow] = []
+    in_batch: set[tuple[str, str]] = set()
+    for doc, (rows, seconds) in _bounded_map(pool, chunker, docs, inflight=procs * 4):
+        stats.documents += 1
+        stats.chunk.seconds += seconds
+        if rows is None:
+            stats.skipped.append(doc.path or f"{doc.source}/{doc.doc_id}")
+            continue
+        key = (doc.source, doc.doc_id)
+        if key in in_batch:
+            batch = [row for row in batch if (row[0], row[1]) != key]
+        in_batch.add(key)
+        stats.chunk.rows += len(rows)
+        batch.extend(rows)
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+            in_batch.clear()
+    if batch:
+        yield batch
+
+
+def _embed_batch(batch: list[ChunkRow], *, embedder: Embedder) -> tuple[list[np.ndarray], float]:
+    """Thread pool task: one vector per row, each distinct text embedded once."""
+    t0 = time.perf_counter()
+    texts: dict[str, str] = {}
+    for row in batch:
+        texts.setdefault(row[4], row[3])
+    vectors = dict(zip(texts, (e.vector for e in embedder.embed_texts(list(texts.values())))))
+    return [vectors[row[4]] for row in batch], time.perf_counter() - t0
+
+
+def _copy_stage(
+    embedded: Iterator[tuple[list[ChunkRow], list[np.ndarray]]],
+    stats: BulkLoadStats,
+    *,
+    model: str,
+    commit_rows: int,
+    replace: bool,
+    on_progress: ProgressCallback | None,
+) -> None:
+    """
+    With `replace`, the stored rows of each batch's documents are deleted
+    before its COPY (needs the unique chunk key to be cheap); otherwise
+    `_rebuild_indexes` removes older ingests afterwards in one pass, and
+    only documents already copied in the same transaction (same
+    created_at, which that pass can't tell apart) are deleted here.
+    """
+    engine = get_engine()
+    for first in embedded:
+        # About commit_rows rows per transaction, so a failure late in the
+        # load keeps what was already committed. Batches hold whole documents.
+        with engine.begin() as conn:
+            t0 = time.perf_counter()
+            copied = 0
+            in_transaction: set[tuple[str, str]] = set()
+            with conn.connection.driver_connection.cursor() as cur:
+                for batch, vectors in chain([first], embedded):
+                    docs = list(dict.fromkeys((row[0], row[1]) for row in batch))
+                    delete = docs if replace else [d for d in docs if d in in_transaction]
+                    in_transaction.update(docs)
+                    if delete:
+                        cur.execute(_DELETE_DOCUMENTS_SQL, ([d[0] for d in delete], [d[1] for d in delete]))
+                        stats.dedupe_deleted += cur.rowcount
+                    with cur.copy(_COPY_SQL) as copy:
+                        copy.set_types(_COPY_TYPES)
+                        for (source, doc_id, chunk_index, content, h, meta), vector in zip(batch, vectors):
+                            copy.write_row((source, doc_id, chunk_index, content, h, model, meta, vector))
+                    copied += len(batch)
+                    if copied >= commit_rows:
+                        break
+        stats.copy.rows += copied
+        stats.copy.seconds += time.perf_counter() - t0
+        if on_progress is not None:
+            on_progress(stats)
+
+
+def _numpy_stage(
+    embedded: Iterator[tuple[list[ChunkRow], list[np.ndarray]]],
+    stats: BulkLoadStats,
+    *,
+    model: str,
+    on_progress: ProgressCallback | None,
+) -> None:
+    """
+    RETRIEVAL_BACKEND=numpy: append each batch to the in-process index,
+    tombstoning the chunks already stored for its documents.
+    """
+    index = get_numpy_index()
+    for batch, vectors in embedded:
+        t0 = time.perf_counter()
+        rows = list(zip(batch, vectors))
+        for (source, doc_id), group in groupby(rows, key=lambda r: (r[0][0], r[0][1])):
+            group = list(group)
+            stored = index.doc_chunks(source=source, doc_id=doc_id)
+            stats.dedupe_deleted += len(stored)
+            index.add(
+                source=source,
+                doc_id=doc_id,
+                chunks=[(row[2], row[3]) for row, _ in group],
+                vectors=np.stack([v for _, v in group]),
+                metadata=group[0][0][5],
+                content_hashes=[row[4] for row, _ in group],
+                embedding_model=model,
+                replace_ids=[chunk_id for chunk_id, _, _ in stored.values()],
+            )
+        stats.copy.rows += len(batch)
+        stats.copy.seconds += time.perf_counter() - t0
+        if on_progress is not None:
+            on_progress(stats)
+
+
+# ---------------------------------------------------------------------------
+# Indexes
+# ---------------------------------------------------------------------------
+
+
+def _drop_indexes() -> list[tuple[str, str]]:
+    """Drop every index on kb_chunks but the primary key; returns (name, definition) pairs."""
+    with get_engine().begin() as conn:
+        indexes = chunk_indexes(conn)
+        for name, _ in indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    return indexes
+
+
+def _rebuild_indexes(
+    indexes: list[tuple[str, str]], stats: BulkLoadStats, *, maintenance_work_mem: str | None
+) -> None:
+    engine = get_engine()
+    # Re-loaded documents leave their old rows behind (possibly more chunks
+    # than the new version has); the unique key wouldn't build over them.
+    with engine.begin() as conn:
+        stats.dedupe_deleted += conn.execute(text(_DEDUPE_SQL)).rowcount
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if maintenance_work_mem:
+            conn.execute(text("SELECT set_config('maintenance_work_mem', :v, false)"), {"v": maintenance_work_mem})
+        failed: list[str] = []
+        for name, definition in indexes:
+            # One index that won't build must not cost the others.
+            t0 = time.perf_counter()
+            try:
+                conn.execute(text(definition))
+            except Exception as exc:
+                failed.append(f"{name} ({type(exc).__name__}: {exc})")
+                continue
+            stats.index_seconds[name] = time.perf_counter() - t0
+        conn.execute(text("ANALYZE kb_chunks"))
+    if failed:
+        raise RuntimeError(
+            f"Could not rebuild {len(failed)} index(es) on kb_chunks: {'; '.join(failed)}. "
+            "Fix the cause, then run `schema` and `vector_index create` to recreate them."
+        )
+
+
+def _refresh_catalog(stats: BulkLoadStats) -> None:
+    # COPY bypasses the per-document catalog upkeep of kb_repository; one
+    # set-based pass afterwards is cheaper than per-row maintenance anyway.
+    t0 = time.perf_counter()
+    with get_engine().begin() as conn:
+        refresh_documents(conn)
+    stats.catalog_seconds = time.perf_counter() - t0
+
+
+# ---------------------------------------------------------------------------
+# Entry points
+# ---------------------------------------------------------------------------
+
+
+def bulk_load(
+    documents: Iterable[CorpusDocument],
+    *,
+    procs: int | None = None,
+    batch_rows: int = 2048,
+    embed_workers: int = 4,
+    commit_rows: int = 50_000,
+    keep_indexes: bool = False,
+    maintenance_work_mem: str | None = None,
+    embedder: Embedder | None = None,
+    on_progress: ProgressCallback | None = None,
+) -> BulkLoadStats:
+    """
+    Load `documents` (see `iter_documents`) into kb_chunks.
+
+    `batch_rows` chunks go to the embedder per call, with up to
+    `embed_workers` calls in flight. `on_progress` is called after every
+    commit with the running stats.
+    """
+    procs = procs or os.cpu_count() or 1
+    embedder = embedder or get_embedder(lane="bulk")
+    stats = BulkLoadStats()
+    started = time.perf_counter()
+    pg = settings.retrieval_backend != "numpy"
+    indexes = _drop_indexes() if pg and not keep_indexes else []
+
+    try:
+        # spawn: forking a process with live threads (the API server, the
+        # embed pool) can deadlock the child.
+        with ProcessPoolExecutor(procs, mp_context=multiprocessing.get_context("spawn")) as pool, \
+                ThreadPoolExecutor(embed_workers, thread_name_prefix="bulk-embed") as threads:
+            batches = _chunk_stage(documents, pool, stats, procs=procs, batch_rows=batch_rows)
+
+            def embedded() -> Iterator[tuple[list[ChunkRow], list[np.ndarray]]]:
+                embed = partial(_embed_batch, embedder=embedder)
+                for batch, (vectors, seconds) in _bounded_map(threads, embed, batches, inflight=embed_workers * 2):
+                    stats.embed.rows += len(batch)
+                    stats.embed.seconds += seconds
+                    yield batch, vectors
+
+            if pg:
+                _copy_stage(
+                    embedded(),
+                    stats,
+                    model=embedder.model,
+                    commit_rows=commit_rows,
+                    replace=not indexes,
+                    on_progress=on_progress,
+                )
+            else:
+                _numpy_stage(embedded(), stats, model=embedder.model, on_progress=on_progress)
+    finally:
+        try:
+            if indexes:
+                _rebuild_indexes(indexes, stats, maintenance_work_mem=maintenance_work_mem)
+        finally:
+            if pg:
+                _refresh_catalog(stats)
+            stats.wall_seconds = time.perf_counter() - started
+    return stats
+
+
+# Admin endpoint state: one load at a time per process.
+_run: dict[str, Any] | None = None
+_run_lock = threading.Lock()
+
+
+def start_bulk_load(path: Path, *, source: str | None = None, keep_indexes: bool = True) -> dict[str, Any]:
+    """
+    Run `bulk_load` on `path` in a background thread; returns the run status.
+    Raises RuntimeError if a load is already running.
+
+    Indexes are kept by default: the server is live, and dropping them
+    takes the ANN index from searches and the unique chunk key from
+    upserts until the load finishes.
+    """
+    global _run
+    with _run_lock:
+        if _run is not None and _run["status"] == "running":
+            raise RuntimeError("A bulk load is already running.")
+        run: dict[str, Any] = {
+            "status": "running",
+            "path": str(path),
+            "keep_indexes": keep_indexes,
+            "started_at": time.time(),
+            "finished_at": None,
+            "error": None,
+            "stats": BulkLoadStats().to_dict(),
+        }
+        _run = run
+
+    def progress(stats: BulkLoadStats) -> None:
+        run["stats"] = stats.to_dict()
+
+    def target() -> None:
+        try:
+            stats = bulk_load(iter_documents(path, source=source), keep_indexes=keep_indexes, on_progress=progress)
+            run.update(status="done", stats=stats.to_dict())
+        except Exception as exc:
+            run.update(status="failed", error=f"{type(exc).__name__}: {exc}")
+        finally:
+            run["finished_at"] = time.time()
+
+    threading.Thread(target=target, name="bulk-load", daemon=True).start()
+    return dict(run)
+
+
+def bulk_load_status() -> dict[str, Any] | None:
+    with _run_lock:
+        return dict(_run) if _run is not None else None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Bulk-load a corpus (directory of .txt files or JSONL) into kb_chunks.",
+    )
+    parser.add_argument("path")
+    parser.add_argument("--source", default=None, help="default: directory name / JSONL file stem")
+    parser.add_argument("--procs", type=int, default=None, help="chunking processes (default: CPU count)")
+    parser.add_argument("--batch-rows", type=int, default=2048, help="chunks per embedding call")
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--commit-rows", type=int, default=50_000)
+    parser.add_argument(
+        "--keep-indexes",
+        action="store_true",
+        help="don't drop/rebuild indexes (for a load into a live table; slower)",
+    )
+    parser.add_argument("--maintenance-work-mem", default=None, help="for the index rebuild, e.g. 2GB")
+    args = parser.parse_args()
+
+    def progress(stats: BulkLoadStats) -> None:
+        print(f"{stats.documents} documents, {stats.copy.rows} rows written", flush=True)
+
+    stats = bulk_load(
+        iter_documents(args.path, source=args.source),
+        procs=args.procs,
+        batch_rows=args.batch_rows,
+        embed_workers=args.embed_workers,
+        commit_rows=args.commit_rows,
+        keep_indexes=args.keep_indexes,
+        maintenance_work_mem=args.maintenance_work_mem,
+        on_progress=progress,
+    )
+    print(json.dumps(stats.to_dict(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,104 +1,422 @@
 from __future__ import annotations
 
 import re
+import time
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Hashable
 
-from openai import OpenAI
+import numpy as np
 
 from rag_knowledge_base_fastapi.config.settings import settings
 from rag_knowledge_base_fastapi.models.chat import Citation
-from rag_knowledge_base_fastapi.services.retrieval import search_chunks
+from rag_knowledge_base_fastapi.services.answer_cache import (
+    achunks_fingerprint,
+    chunks_fingerprint,
+    get_answer_cache,
+)
+from rag_knowledge_base_fastapi.services.context_packing import PackedContext, pack_context
+from rag_knowledge_base_fastapi.services.embedding_cache import aembed_query, embed_query
+from rag_knowledge_base_fastapi.services.metrics import TOKENS, observe_stage, timed
+from rag_knowledge_base_fastapi.services.mmr import mmr_params
+from rag_knowledge_base_fastapi.services.providers import chat_model, embedding_model, get_chat_provider
+from rag_knowledge_base_fastapi.services.retrieval import SearchMode, asearch_chunks, search_chunks
 
 
 @dataclass(frozen=True)
 class ChatResult:
     answer: str
     citations: list[Citation]
+    cached: bool = False  # served from the semantic answer cache
+    # Prompt context size, and tokens saved by merging / the budget.
+    context_tokens: int = 0
+    context_tokens_saved: int = 0
 
 
-def _build_context(hits) -> str:
-    lines: list[str] = []
-    for i, h in enumerate(hits, start=1):
-        # Keep content as-is; we can add truncation later if needed.
-        lines.append(f"[{i}] source={h.source} doc_id={h.doc_id} chunk={h.chunk_index} score={h.score:.4f}\n{h.content}")
-    return "\n\n".join(lines)
+@dataclass(frozen=True)
+class _CachedChat:
+    result: ChatResult
+    retrieval: list[dict[str, Any]]  # the "retrieval" stream event's hits
 
 
-def answer_with_rag(
-    *,
-    message: str,
-    top_k: int = 5,
-    doc_id: str | None = None,
-    source: str | None = None,
-) -> ChatResult:
+SYSTEM_PROMPT = (
+    "You are a helpful knowledge-base assistant.\n"
+    "Answer the user's question using ONLY the provided context.\n"
+    "If the context is insufficient, say you don't know and ask a clarifying question.\n"
+    "When you use information from a chunk, cite it like [1], [2], etc.\n"
+)
+
+
+def _validate_message(message: str) -> str:
     message = (message or "").strip()
     if not message:
         raise ValueError("message is required")
 
-    if not settings.openai_api_key:
+    if settings.chat_provider == "openai" and not settings.openai_api_key:
         raise ValueError("OPENAI_API_KEY is not configured.")
+    return message
 
-    hits = search_chunks(query=message, top_k=top_k, doc_id=doc_id, source=source)
 
-    context = _build_context(hits)
+def _pack(hits) -> PackedContext:
+    context = pack_context(hits, max_tokens=settings.context_max_tokens)
+    TOKENS.inc("context", context.tokens)
+    TOKENS.inc("context_saved", context.tokens_saved)
+    return context
 
-    system_prompt = (
-        "You are a helpful knowledge-base assistant.\n"
-        "Answer the user's question using ONLY the provided context.\n"
-        "If the context is insufficient, say you don't know and ask a clarifying question.\n"
-        "When you use information from a chunk, cite it like [1], [2], etc.\n"
-    )
 
+def _build_messages(message: str, context: PackedContext) -> list[dict[str, str]]:
     user_prompt = (
-        f"Context:\n{context}\n\n"
+        f"Context:\n{context.text}\n\n"
         f"User question:\n{message}\n\n"
         f"Answer:"
     )
 
-    client = OpenAI(api_key=settings.openai_api_key)
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
 
-    # If you don't have chat model in settings yet, default here.
-    chat_model = getattr(settings, "openai_chat_model", None) or "gpt-4o-mini"
 
-    resp = client.chat.completions.create(
-        model=chat_model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.2,
+def _citation(h) -> Citation:
+    return Citation(
+        id=h.id,
+        source=h.source,
+        doc_id=h.doc_id,
+        chunk_index=h.chunk_index,
+        score=h.score,
     )
 
-    answer = resp.choices[0].message.content or ""
 
+def _citations_for(cited: set[int], context: PackedContext) -> list[Citation]:
+    # [n] is a context block, which may hold several merged hits.
+    return [_citation(h) for _, h in context.hits_for(cited)]
+
+
+def _retrieval_hits(context: PackedContext) -> list[dict[str, Any]]:
+    return [{"n": b.n, **_citation(h).model_dump()} for b in context.blocks for h in b.hits]
+
+
+def _build_result(answer: str, context: PackedContext) -> ChatResult:
     cited = _extract_cited_indices(answer)
+    return ChatResult(
+        answer=answer.strip(),
+        citations=_citations_for(cited, context),
+        context_tokens=context.tokens,
+        context_tokens_saved=context.tokens_saved,
+    )
+
+
+def _cache_partition(
+    *,
+    top_k: int,
+    doc_id: str | None,
+    source: str | None,
+    mode: SearchMode | None,
+    mmr_lambda: float | None = None,
+    fetch_multiplier: int | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    oversample: int | None = None,
+) -> Hashable | None:
+    """Answer cache key of a request (the question embedding aside); None if not cacheable."""
+    mode = mode or settings.search_mode
+    # Lexical mode exists to skip the embedding call a lookup needs.
+    if not get_answer_cache().enabled or mode == "lexical":
+        return None
+    diversity = mmr_params(mode, mmr_lambda, fetch_multiplier)
+    # ANN knobs change recall, so an answer from a cheaper search must not
+    # serve a request that asked for a more thorough one.
+    knobs = (ef_search, probes, oversample)
+    return (chat_model(), embedding_model(), mode, top_k, doc_id or None, source or None, diversity, knobs)
+
+
+def _cached_answer(partition: Hashable, qvec: np.ndarray) -> _CachedChat | None:
+    cache = get_answer_cache()
+    hit = cache.lookup(partition, qvec)
+    if hit is None:
+        return None
+    if chunks_fingerprint(hit.chunk_ids) != hit.fingerprint:
+        cache.reject(hit)
+        return None
+    cache.confirm(hit)
+    return hit.value
+
+
+async def _acached_answer(partition: Hashable, qvec: np.ndarray) -> _CachedChat | None:
+    cache = get_answer_cache()
+    hit = cache.lookup(partition, qvec)
+    if hit is None:
+        return None
+    if await achunks_fingerprint(hit.chunk_ids) != hit.fingerprint:
+        cache.reject(hit)
+        return None
+    cache.confirm(hit)
+    return hit.value
+
+
+def _store_answer(
+    partition: Hashable,
+    qvec: np.ndarray,
+    result: ChatResult,
+    hits,
+    context: PackedContext,
+    fingerprint: Hashable,
+) -> None:
+    get_answer_cache().put(
+        partition,
+        qvec,
+        _CachedChat(result=result, retrieval=_retrieval_hits(context)),
+        chunk_ids=[h.id for h in hits],
+        fingerprint=fingerprint,
+    )
+
+
+def answer_with_rag(
+    *,
+    message: str,
+    top_k: int = 5,
+    doc_id: str | None = None,
+    source: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    oversample: int | None = None,
+    mode: SearchMode | None = None,
+    mmr_lambda: float | None = None,
+    fetch_multiplier: int | None = None,
+) -> ChatResult:
+    """
+    Retrieve context for `message` and answer from it.
+
+    Paraphrases of a recently answered question (same filters, mode, top_k,
+    ANN and MMR settings) get the cached answer, unless its chunks changed
+    since.
+    """
+    message = _validate_message(message)
+    partition = _cache_partition(
+        top_k=top_k,
+        doc_id=doc_id,
+        source=source,
+        mode=mode,
+        mmr_lambda=mmr_lambda,
+        fetch_multiplier=fetch_multiplier,
+        ef_search=ef_search,
+        probes=probes,
+        oversample=oversample,
+    )
+    if partition is not None:
+        # The search below reuses this embedding (query embedding cache).
+        qvec = embed_query(message)
+        cached = _cached_answer(partition, qvec)
+        if cached is not None:
+            return replace(cached.result, cached=True)
+
+    hits = search_chunks(
+        query=message,
+        top_k=top_k,
+        doc_id=doc_id,
+        source=source,
+        ef_search=ef_search,
+        probes=probes,
+        oversample=oversample,
+        mode=mode,
+        mmr_lambda=mmr_lambda,
+        fetch_multiplier=fetch_multiplier,
+    )
+    # Before the answer is generated: a re-ingest meanwhile makes it stale.
+    fingerprint = chunks_fingerprint([h.id for h in hits]) if partition is not None and hits else None
+
+    context = _pack(hits)
+    with timed("llm"):
+        answer = get_chat_provider().complete(_build_messages(message, context))
+    result = _build_result(answer, context)
+    if fingerprint is not None:
+        _store_answer(partition, qvec, result, hits, context, fingerprint)
+    return result
+
+
+async def aanswer_with_rag(
+    *,
+    message: str,
+    top_k: int = 5,
+    doc_id: str | None = None,
+    source: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    oversample: int | None = None,
+    mode: SearchMode | None = None,
+    mmr_lambda: float | None = None,
+    fetch_multiplier: int | None = None,
+) -> ChatResult:
+    """Async variant of `answer_with_rag` used by the API."""
+    message = _validate_message(message)
+    partition = _cache_partition(
+        top_k=top_k,
+        doc_id=doc_id,
+        source=source,
+        mode=mode,
+        mmr_lambda=mmr_lambda,
+        fetch_multiplier=fetch_multiplier,
+        ef_search=ef_search,
+        probes=probes,
+        oversample=oversample,
+    )
+    if partition is not None:
+        qvec = await aembed_query(message)
+        cached = await _acached_answer(partition, qvec)
+        if cached is not None:
+            return replace(cached.result, cached=True)
+
+    hits = await asearch_chunks(
+        query=message,
+        top_k=top_k,
+        doc_id=doc_id,
+        source=source,
+        ef_search=ef_search,
+        probes=probes,
+        oversample=oversample,
+        mode=mode,
+        mmr_lambda=mmr_lambda,
+        fetch_multiplier=fetch_multiplier,
+    )
+    fingerprint = await achunks_fingerprint([h.id for h in hits]) if partition is not None and hits else None
+
+    context = _pack(hits)
+    with timed("llm"):
+        answer = await get_chat_provider().acomplete(_build_messages(message, context))
+    result = _build_result(answer, context)
+    if fingerprint is not None:
+        _store_answer(partition, qvec, result, hits, context, fingerprint)
+    return result
+
+
+# (event name, JSON-serializable payload)
+StreamEvent = tuple[str, dict[str, Any]]
+
+
+class _CitationTracker:
+    """
+    `_extract_cited_indices` over text that arrives in pieces.
+
+    A marker can be split across deltas ("[1" + "2]"), so an unterminated
+    "[digits" tail is held back and prepended to the next piece.
+    """
+
+    _OPEN_TAIL = re.compile(r"\[\d*$")
+
+    def __init__(self) -> None:
+        self.cited: set[int] = set()
+        self._tail = ""
+
+    def feed(self, text: str) -> set[int]:
+        """Consume `text`; return indices not seen before."""
+        buf = self._tail + text
+        new = _extract_cited_indices(buf) - self.cited
+        self.cited |= new
+        m = self._OPEN_TAIL.search(buf)
+        self._tail = buf[m.start():] if m else ""
+        return new
+
+
+async def astream_answer_with_rag(
+    *,
+    message: str,
+    top_k: int = 5,
+    doc_id: str | None = None,
+    source: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    oversample: int | None = None,
+    mode: SearchMode | None = None,
+    mmr_lambda: float | None = None,
+    fetch_multiplier: int | None = None,
+) -> AsyncIterator[StreamEvent]:
+    """
+    Streaming variant of `aanswer_with_rag`.
+
+    Yields ("retrieval", ...) with the hits in the prompt and the context
+    token counts as soon as the search is done, then one ("token", ...)
+    per answer delta, then ("done", ...) with the cited indices and
+    citations. Closing the generator (e.g. the client went
+    away) closes the provider's stream and with it the upstream request.
+    A cached answer comes as a single token; both events say `cached`.
+    """
+    message = _validate_message(message)
+    partition = _cache_partition(
+        top_k=top_k,
+        doc_id=doc_id,
+        source=source,
+        mode=mode,
+        mmr_lambda=mmr_lambda,
+        fetch_multiplier=fetch_multiplier,
+        ef_search=ef_search,
+        probes=probes,
+        oversample=oversample,
+    )
+    if partition is not None:
+        qvec = await aembed_query(message)
+        cached = await _acached_answer(partition, qvec)
+        if cached is not None:
+            result = cached.result
+            yield "retrieval", {
+                "hits": cached.retrieval,
+                "context_tokens": result.context_tokens,
+                "context_tokens_saved": result.context_tokens_saved,
+                "cached": True,
+            }
+            cited = _extract_cited_indices(result.answer)
+            yield "token", {"text": result.answer}
+            yield "done", {
+                "cited": sorted(cited),
+                "citations": [h for h in cached.retrieval if h["n"] in cited],
+                "cached": True,
+            }
+            return
+
+    hits = await asearch_chunks(
+        query=message,
+        top_k=top_k,
+        doc_id=doc_id,
+        source=source,
+        ef_search=ef_search,
+        probes=probes,
+        oversample=oversample,
+        mode=mode,
+        mmr_lambda=mmr_lambda,
+        fetch_multiplier=fetch_multiplier,
+    )
+    fingerprint = await achunks_fingerprint([h.id for h in hits]) if partition is not None and hits else None
+    context = _pack(hits)
+    yield "retrieval", {
+        "hits": _retrieval_hits(context),
+        "context_tokens": context.tokens,
+        "context_tokens_saved": context.tokens_saved,
+        "cached": False,
+    }
+
+    deltas = get_chat_provider().astream(_build_messages(message, context))
+    tracker = _CitationTracker()
+    parts: list[str] = []
+    started = time.perf_counter()
+    try:
+        async for delta in deltas:
+            if not parts:
+                observe_stage("llm_ttft", time.perf_counter() - started)
+            tracker.feed(delta)
+            parts.append(delta)
+            yield "token", {"text": delta}
+    finally:
+        await deltas.aclose()
+    # Time spent on our consumer (the client reading the stream) included.
+    observe_stage("llm", time.perf_counter() - started)
 
-    # citations = [
-    #     Citation(
-    #         id=h.id,
-    #         source=h.source,
-    #         doc_id=h.doc_id,
-    #         chunk_index=h.chunk_index,
-    #         score=h.score,
-    #     )
-    #     for h in hits
-    # ]
-
-    citations = []
-    for i, h in enumerate(hits, start=1):
-        if i in cited:
-            citations.append(
-                Citation(
-                    id=h.id,
-                    source=h.source,
-                    doc_id=h.doc_id,
-                    chunk_index=h.chunk_index,
-                    score=h.score,
-                )
-            )
-
-    return ChatResult(answer=answer.strip(), citations=citations)
+    if fingerprint is not None:
+        # Only complete answers get here (a closed stream raises above).
+        _store_answer(partition, qvec, _build_result("".join(parts), context), hits, context, fingerprint)
+    yield "done", {
+        "cited": sorted(tracker.cited),
+        "citations": [{"n": n, **_citation(h).model_dump()} for n, h in context.hits_for(tracker.cited)],
+        "cached": False,
+    }
 
 def _extract_cited_indices(answer: str) -> set[int]:
         # Matches [1], [2], etc.
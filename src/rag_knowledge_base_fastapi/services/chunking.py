@@ -1,6 +1,26 @@
+"""
+Document chunking.
+
+CHUNKER=chars (the default) cuts fixed windows of CHUNK_SIZE_CHARS
+characters, CHUNK_OVERLAP_CHARS apart from the previous one. CHUNKER=tokens
+packs whole sentences (or lines) into chunks of up to CHUNK_MAX_TOKENS
+tokens, so chunks fill the embedding input and end at sentence boundaries,
+and repeats the trailing sentences of up to CHUNK_OVERLAP_TOKENS at the
+start of the next chunk. Both produce the same chunks whether the text is
+chunked at once or streamed in pieces.
+"""
 from __future__ import annotations
 
+import re
+from collections import deque
 from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, Iterator, Literal
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.metrics import timed
+from rag_knowledge_base_fastapi.services.tokenizer import Tokenizer, get_tokenizer
+
+ChunkMode = Literal["chars", "tokens"]
 
 
 @dataclass(frozen=True)
@@ -9,11 +29,31 @@ class TextChunk:
     content: str
 
 
+@dataclass(frozen=True, slots=True)
+class ChunkSpan:
+    """A chunk as `text[start:end]` of the source, without a copy of it."""
+
+    chunk_index: int
+    start: int
+    end: int
+    tokens: int
+
+
+def _validate(chunk_size: int, chunk_overlap: int) -> None:
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be > 0")
+    if chunk_overlap < 0:
+        raise ValueError("chunk_overlap must be >= 0")
+    if chunk_overlap >= chunk_size:
+        raise ValueError("chunk_overlap must be < chunk_size")
+
+
 def chunk_text(
     text: str,
     *,
     chunk_size: int,
     chunk_overlap: int,
+    mode: ChunkMode = "chars",
 ) -> list[TextChunk]:
     """
     Split text into overlapping character-based chunks.
@@ -23,13 +63,16 @@ def chunk_text(
     - chunk_overlap must be >= 0 and < chunk_size
     - Chunks are trimmed; empty chunks are dropped.
     - Deterministic ordering by chunk_index.
+
+    With mode="tokens", chunk_size and chunk_overlap are token counts and
+    the chunks are those of `iter_token_spans`.
     """
-    if chunk_size <= 0:
-        raise ValueError("chunk_size must be > 0")
-    if chunk_overlap < 0:
-        raise ValueError("chunk_overlap must be >= 0")
-    if chunk_overlap >= chunk_size:
-        raise ValueError("chunk_overlap must be < chunk_size")
+    if mode == "tokens":
+        return [
+            TextChunk(chunk_index=s.chunk_index, content=text[s.start : s.end])
+            for s in iter_token_spans(text or "", max_tokens=chunk_size, overlap_tokens=chunk_overlap)
+        ]
+    _validate(chunk_size, chunk_overlap)
 
     text = (text or "").strip()
     if not text:
@@ -53,3 +96,287 @@ def chunk_text(
         start += step
 
     return chunks
+
+
+class StreamingChunker:
+    """
+    `chunk_text` over text that arrives in pieces.
+
+    Produces exactly the chunks `chunk_text("".join(pieces))` would, while
+    buffering only the current window plus the latest piece. A window is
+    emitted once non-whitespace text is seen past its end, because only
+    then is it known not to be the (shorter) final chunk after the
+    trailing strip.
+    """
+
+    def __init__(self, *, chunk_size: int, chunk_overlap: int) -> None:
+        _validate(chunk_size, chunk_overlap)
+        self._size = chunk_size
+        self._step = chunk_size - chunk_overlap
+        self._buf = ""
+        self._offset = 0  # position of _buf[0] in the stripped text
+        self._start = 0  # start of the next window
+        self._last = -1  # position of the last non-whitespace character
+        self._idx = 0
+        self._started = False
+
+    def _emit(self, start: int, end: int, out: list[TextChunk]) -> None:
+        chunk = self._buf[start - self._offset : end - self._offset].strip()
+        if chunk:
+            out.append(TextChunk(chunk_index=self._idx, content=chunk))
+            self._idx += 1
+
+    def feed(self, piece: str) -> list[TextChunk]:
+        """Consume `piece`; return the chunks it completed."""
+        if not self._started:
+            piece = piece.lstrip()
+            if not piece:
+                return []
+            self._started = True
+        end_of_piece = self._offset + len(self._buf)
+        tail = piece.rstrip()
+        if tail:
+            self._last = end_of_piece + len(tail) - 1
+        self._buf += piece
+
+        out: list[TextChunk] = []
+        while self._last >= self._start + self._size:
+            self._emit(self._start, self._start + self._size, out)
+            self._start += self._step
+        if self._start > self._offset:
+            self._buf = self._buf[self._start - self._offset :]
+            self._offset = self._start
+        return out
+
+    def finish(self) -> list[TextChunk]:
+        """Flush the final window(s) at end of input."""
+        out: list[TextChunk] = []
+        n = self._last + 1
+        while self._start < n:
+            end = min(self._start + self._size, n)
+            self._emit(self._start, end, out)
+            if end == n:
+                break
+            self._start += self._step
+        self._buf = ""
+        self._offset = self._start = n
+        return out
+
+
+# Ends of sentence-like units for CHUNKER=tokens: sentence punctuation
+# followed by whitespace, a CJK full stop, or a line break. A unit runs from
+# a non-space character to the next of these (line breaks excluded).
+_UNIT_END = re.compile(r"[.!?]+[\"'\u201d\u2019)\]]*(?=\s)|[\u3002\uff01\uff1f]+|\n")
+_NONSPACE = re.compile(r"\S")
+# A unit longer than this many characters per token of budget is cut at a
+# space, so a line without sentence ends is not held in memory whole.
+_MAX_UNIT_CHARS_PER_TOKEN = 8
+# Piece size `iter_token_spans` feeds a whole text in.
+_BLOCK_CHARS = 1 << 16
+
+
+def _word_cut(piece: str, n: int) -> int:
+    """Length of the longest prefix of `piece[:n]` that ends a word, without trailing spaces (`n` if none)."""
+    k = n
+    if k < len(piece) and not piece[k].isspace():
+        while k > 0 and not piece[k - 1].isspace():
+            k -= 1
+    return len(piece[:k].rstrip()) or n
+
+
+class TokenChunker:
+    """
+    Sentence-aligned chunks of up to `max_tokens` tokens over text that
+    arrives in pieces.
+
+    Text is split into units (sentences, or lines without a sentence end)
+    and whole units are packed into a chunk until the next one does not fit;
+    the next chunk then starts with the last units of up to `overlap_tokens`.
+    A unit over the budget on its own is cut at the last space within it.
+    Tokens are counted per unit (with the whitespace before it), so a
+    chunk's count can differ from counting its text at once by a token or
+    so per unit boundary.
+
+    Chunks are `ChunkSpan`s with offsets into the whole text fed so far;
+    `text(span)` returns a span's text until the next `feed`. Only the
+    current chunk and the unfinished unit after it are buffered.
+    """
+
+    def __init__(self, *, max_tokens: int, overlap_tokens: int, tokenizer: Tokenizer | None = None) -> None:
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be > 0")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be >= 0 and < max_tokens")
+        self._max = max_tokens
+        self._overlap = overlap_tokens
+        self._max_unit_chars = max_tokens * _MAX_UNIT_CHARS_PER_TOKEN
+        self._tok = tokenizer or get_tokenizer()
+        self._buf = ""
+        self._offset = 0  # position of _buf[0] in the text
+        self._pos = 0  # end of the last unit
+        self._units: deque[tuple[int, int, int]] = deque()  # (start, end, tokens) of the current chunk
+        self._used = 0
+        self._emitted_end = 0
+        self._idx = 0
+
+    def text(self, span: ChunkSpan) -> str:
+        return self._buf[span.start - self._offset : span.end - self._offset]
+
+    def feed(self, piece: str) -> list[ChunkSpan]:
+        """Consume `piece`; return the chunks it completed."""
+        self._trim()
+        self._buf += piece
+        out: list[ChunkSpan] = []
+        self._scan(final=False, out=out)
+        return out
+
+    def finish(self) -> list[ChunkSpan]:
+        """Flush the final unit and chunk at end of input."""
+        self._trim()
+        out: list[ChunkSpan] = []
+        self._scan(final=True, out=out)
+        if self._units and self._units[-1][1] > self._emitted_end:
+            out.append(self._emit())
+        return out
+
+    def _trim(self) -> None:
+        keep = self._units[0][0] if self._units else self._pos
+        if keep > self._offset:
+            self._buf = self._buf[keep - self._offset :]
+            self._offset = keep
+
+    def _scan(self, *, final: bool, out: list[ChunkSpan]) -> None:
+        buf, off, limit = self._buf, self._offset, self._max_unit_chars
+        while (m := _NONSPACE.search(buf, self._pos - off)) is not None:
+            start = m.start()
+            window_end = min(len(buf), start + limit)
+            full = start + limit < len(buf)  # the cut below can't move with more text
+            stop = _UNIT_END.search(buf, start, window_end)
+            if stop is None:
+                if full:
+                    end = start + _word_cut(buf[start : window_end + 1], limit)
+                elif final:
+                    end = start + len(buf[start:window_end].rstrip())
+                else:
+                    return
+            elif stop.group() == "\n":
+                end = start + len(buf[start : stop.start()].rstrip())
+            else:
+                end = stop.end()
+                if end == window_end and not (full or final):
+                    return  # more CJK full stops may follow
+            self._unit(start, end, out)
+            self._pos = end + off
+
+    def _unit(self, start: int, end: int, out: list[ChunkSpan]) -> None:
+        buf, off, tok = self._buf, self._offset, self._tok
+        prev = self._pos - off
+        tokens = tok.count(buf[prev:end])
+        if tokens <= self._max:
+            self._add(start + off, end + off, tokens, out)
+            return
+        while start < end:
+            piece = buf[start:end]
+            cut = start + _word_cut(piece, max(1, len(tok.truncate(piece, self._max))))
+            self._add(start + off, cut + off, tok.count(buf[prev:cut]), out)
+            prev = cut
+            m = _NONSPACE.search(buf, cut, end)
+            start = m.start() if m else end
+
+    def _add(self, start: int, end: int, tokens: int, out: list[ChunkSpan]) -> None:
+        units = self._units
+        if units and self._used + tokens > self._max:
+            out.append(self._emit())
+            while units and (self._used > self._overlap or self._used + tokens > self._max):
+                self._used -= units.popleft()[2]
+        units.append((start, end, tokens))
+        self._used += tokens
+
+    def _emit(self) -> ChunkSpan:
+        span = ChunkSpan(
+            chunk_index=self._idx, start=self._units[0][0], end=self._units[-1][1], tokens=self._used
+        )
+        self._idx += 1
+        self._emitted_end = span.end
+        return span
+
+
+def iter_token_spans(
+    text: str,
+    *,
+    max_tokens: int,
+    overlap_tokens: int,
+    tokenizer: Tokenizer | None = None,
+) -> Iterator[ChunkSpan]:
+    """`TokenChunker` spans of `text`, lazily; `text[span.start:span.end]` is the chunk."""
+    chunker = TokenChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens, tokenizer=tokenizer)
+    for i in range(0, len(text), _BLOCK_CHARS):
+        yield from chunker.feed(text[i : i + _BLOCK_CHARS])
+    yield from chunker.finish()
+
+
+class _TokenTextChunker:
+    """`TokenChunker` with the `StreamingChunker` interface (`TextChunk`s)."""
+
+    def __init__(self, *, chunk_size: int, chunk_overlap: int) -> None:
+        self._chunker = TokenChunker(max_tokens=chunk_size, overlap_tokens=chunk_overlap)
+
+    def _texts(self, spans: list[ChunkSpan]) -> list[TextChunk]:
+        return [TextChunk(chunk_index=s.chunk_index, content=self._chunker.text(s)) for s in spans]
+
+    def feed(self, piece: str) -> list[TextChunk]:
+        return self._texts(self._chunker.feed(piece))
+
+    def finish(self) -> list[TextChunk]:
+        return self._texts(self._chunker.finish())
+
+
+def _new_chunker(mode: ChunkMode, chunk_size: int, chunk_overlap: int) -> StreamingChunker | _TokenTextChunker:
+    if mode == "tokens":
+        return _TokenTextChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return StreamingChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def chunking_options() -> dict[str, Any]:
+    """`mode`, `chunk_size` and `chunk_overlap` keyword arguments for the configured CHUNKER."""
+    if settings.chunker == "tokens":
+        return {
+            "mode": "tokens",
+            "chunk_size": settings.chunk_max_tokens,
+            "chunk_overlap": settings.chunk_overlap_tokens,
+        }
+    return {"mode": "chars", "chunk_size": settings.chunk_size_chars, "chunk_overlap": settings.chunk_overlap_chars}
+
+
+def iter_chunks(
+    pieces: Iterable[str],
+    *,
+    chunk_size: int,
+    chunk_overlap: int,
+    mode: ChunkMode = "chars",
+) -> Iterator[TextChunk]:
+    """Generator form of `chunk_text` over an iterable of text pieces."""
+    chunker = _new_chunker(mode, chunk_size, chunk_overlap)
+    for piece in pieces:
+        with timed("chunk"):
+            chunks = chunker.feed(piece)
+        yield from chunks
+    yield from chunker.finish()
+
+
+async def aiter_chunks(
+    pieces: AsyncIterable[str],
+    *,
+    chunk_size: int,
+    chunk_overlap: int,
+    mode: ChunkMode = "chars",
+) -> AsyncIterator[TextChunk]:
+    """Async variant of `iter_chunks`."""
+    chunker = _new_chunker(mode, chunk_size, chunk_overlap)
+    async for piece in pieces:
+        with timed("chunk"):
+            chunks = chunker.feed(piece)
+        for chunk in chunks:
+            yield chunk
+    for chunk in chunker.finish():
+        yield chunk
@@ -0,0 +1,141 @@
+"""
+Token-budgeted prompt context for /chat.
+
+Hits from the same document with consecutive chunk_index values are merged
+into one block, dropping the text `chunk_text` repeats between neighbours
+(CHUNK_OVERLAP_CHARS). Blocks are ordered by their most relevant hit and
+added until CONTEXT_MAX_TOKENS; the block that does not fit is cut off at
+the budget. Each block is one `[n]` in the prompt, and a citation of `[n]`
+maps back to every hit merged into it.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Sequence
+
+from rag_knowledge_base_fastapi.services.tokenizer import Tokenizer, get_tokenizer
+
+
+# Shortest suffix/prefix match taken as chunk overlap rather than chance.
+_MIN_OVERLAP_CHARS = 16
+# Below this many tokens of room a cut-off block is left out instead.
+_MIN_BLOCK_TOKENS = 32
+_SEPARATOR = "\n\n"
+
+
+@dataclass(frozen=True)
+class ContextBlock:
+    n: int  # the block's [n] in the prompt
+    hits: tuple[Any, ...]  # retrieval hits merged into it, in chunk order
+    text: str
+
+
+@dataclass(frozen=True)
+class PackedContext:
+    text: str
+    blocks: list[ContextBlock]
+    tokens: int
+    # The context as it used to be built: every hit verbatim, one [n] each.
+    unpacked_tokens: int
+    truncated: bool  # the last block was cut off, or blocks were left out
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.unpacked_tokens - self.tokens)
+
+    def hits_for(self, cited: set[int]) -> list[tuple[int, Any]]:
+        """(n, hit) for every hit in the cited blocks, in prompt order."""
+        return [(b.n, h) for b in self.blocks if b.n in cited for h in b.hits]
+
+
+def _header(n: int, hits: Sequence[Any], best: Any) -> str:
+    first, last = hits[0].chunk_index, hits[-1].chunk_index
+    chunks = str(first) if first == last else f"{first}-{last}"
+    return f"[{n}] source={best.source} doc_id={best.doc_id} chunk={chunks} score={best.score:.4f}"
+
+
+def _join(a: str, b: str) -> str:
+    """`a` + `b` without the longest suffix of `a` that `b` starts with."""
+    probe = b[:_MIN_OVERLAP_CHARS]
+    pos = a.find(probe)
+    while pos != -1:
+        if b.startswith(a[pos:]):
+            return a + b[len(a) - pos:]
+        pos = a.find(probe, pos + 1)
+    return f"{a} {b}"
+
+
+def _runs(hits: Sequence[Any]) -> list[tuple[Any, list[Any]]]:
+    """
+    (most relevant hit, run) for the runs of consecutive chunks of one
+    document among `hits`, most relevant run first.
+    """
+    rank = {h.id: i for i, h in enumerate(hits)}
+    by_doc: dict[tuple[str, str | None], list[Any]] = {}
+    for h in hits:
+        by_doc.setdefault((h.source, h.doc_id), []).append(h)
+
+    runs: list[list[Any]] = []
+    for doc_hits in by_doc.values():
+        doc_hits.sort(key=lambda h: h.chunk_index)
+        run = [doc_hits[0]]
+        for h in doc_hits[1:]:
+            if h.chunk_index == run[-1].chunk_index + 1:
+                run.append(h)
+            else:
+                runs.append(run)
+                run = [h]
+        runs.append(run)
+    best = [min(run, key=lambda h: rank[h.id]) for run in runs]
+    return sorted(zip(best, runs), key=lambda pair: rank[pair[0].id])
+
+
+def _unpacked_text(hits: Sequence[Any]) -> str:
+    return _SEPARATOR.join(
+        f"[{i}] source={h.source} doc_id={h.doc_id} chunk={h.chunk_index} score={h.score:.4f}\n{h.content}"
+        for i, h in enumerate(hits, start=1)
+    )
+
+
+def pack_context(hits: Sequence[Any], *, max_tokens: int, tokenizer: Tokenizer | None = None) -> PackedContext:
+    """
+    Build the prompt context from retrieval `hits` (most relevant first).
+
+    `max_tokens` bounds the context text (not the system prompt or the
+    question); 0 means no limit.
+    """
+    tok = tokenizer or get_tokenizer()
+    sep_tokens = tok.count(_SEPARATOR)
+
+    blocks: list[ContextBlock] = []
+    used = 0
+    truncated = False
+    for best, run in _runs(hits):
+        n = len(blocks) + 1
+        header = _header(n, run, best) + "\n"
+        body = run[0].content
+        for h in run[1:]:
+            body = _join(body, h.content)
+        cost = tok.count(header + body) + (sep_tokens if blocks else 0)
+
+        if max_tokens and used + cost > max_tokens:
+            truncated = True
+            room = max_tokens - used - tok.count(header) - (sep_tokens if blocks else 0)
+            if room < _MIN_BLOCK_TOKENS and blocks:
+                break
+            body = tok.truncate(body, max(0, room))
+            cost = tok.count(header + body) + (sep_tokens if blocks else 0)
+            blocks.append(ContextBlock(n=n, hits=tuple(run), text=header + body))
+            used += cost
+            break
+
+        blocks.append(ContextBlock(n=n, hits=tuple(run), text=header + body))
+        used += cost
+
+    return PackedContext(
+        text=_SEPARATOR.join(b.text for b in blocks),
+        blocks=blocks,
+        tokens=used,
+        unpacked_tokens=tok.count(_unpacked_text(hits)),
+        truncated=truncated,
+    )
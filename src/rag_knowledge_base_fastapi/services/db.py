@@ -1,11 +1,19 @@
 from __future__ import annotations
 
+import threading
+import time
 from dataclasses import dataclass
 
-from sqlalchemy import create_engine, text
+from pgvector.psycopg import register_vector, register_vector_async
+from psycopg import ProgrammingError
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.metrics import observe_stage
 
 
 @dataclass(frozen=True)
@@ -15,19 +23,220 @@ class DbHealth:
     error: str | None = None
 
 
+@dataclass(frozen=True)
+class PoolStats:
+    size: int
+    checked_out: int
+    overflow: int
+    checkouts: int
+    connects: int
+    timeouts: int
+    wait_seconds_total: float
+    wait_seconds_max: float
+
+
+class _PoolCounters:
+    """Checkout counters shared by a pool and any pool it is recreated into."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that records how long callers wait to check out a connection.
+
+    Wait time includes queueing for a free slot, opening new connections and
+    the pre-ping, i.e. everything between asking the pool for a connection
+    and getting one.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.counters = _PoolCounters()
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except PoolTimeoutError:
+            with self.counters.lock:
+                self.counters.timeouts += 1
+            raise
+        waited = time.perf_counter() - start
+        observe_stage("pool_wait", waited)
+        c = self.counters
+        with c.lock:
+            c.checkouts += 1
+            c.wait_seconds_total += waited
+            c.wait_seconds_max = max(c.wait_seconds_max, waited)
+        return conn
+
+    def _create_connection(self):
+        with self.counters.lock:
+            self.counters.connects += 1
+        return super()._create_connection()
+
+    def recreate(self):
+        new = super().recreate()
+        new.counters = self.counters
+        return new
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """Same counters as InstrumentedQueuePool, for the asyncio engine."""
+
+
+_engine: Engine | None = None
+_async_engine: AsyncEngine | None = None
+_engine_lock = threading.Lock()
+
+
+def _pool_kwargs() -> dict:
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": True,
+        "connect_args": {"connect_timeout": settings.db_connect_timeout_seconds},
+    }
+
+
+def _register_pgvector(dbapi_connection, connection_record) -> None:
+    """
+    Teach each new psycopg connection the pgvector types, so NumPy arrays
+    bind as `vector` parameters in the binary wire format (no text literals).
+
+    Skipped when the extension does not exist yet (before `init_db`).
+    """
+    try:
+        register_vector(dbapi_connection)
+    except ProgrammingError:
+        pass
+    # The type lookup opened a transaction; don't hand the connection out in it.
+    dbapi_connection.rollback()
+
+
+def _register_pgvector_async(dbapi_connection, connection_record) -> None:
+    async def register(conn) -> None:
+        try:
+            await register_vector_async(conn)
+        except ProgrammingError:
+            pass
+        await conn.rollback()
+
+    dbapi_connection.run_async(register)
+
+
 def create_db_engine() -> Engine:
     """
     Create a SQLAlchemy Engine for Postgres.
 
+    Most callers want `get_engine()` instead, which returns the shared
+    process-wide engine rather than building a new pool.
+
     Notes:
-    - Uses DATABASE_URL from settings (supports .env).
+    - Uses DATABASE_URL and DB_POOL_* from settings (supports .env).
     - pool_pre_ping helps avoid stale connections in long-running apps.
     """
-    return create_engine(
+    engine = create_engine(
         settings.database_url,
-        pool_pre_ping=True,
+        poolclass=InstrumentedQueuePool,
         future=True,
+        **_pool_kwargs(),
+    )
+    event.listen(engine, "connect", _register_pgvector)
+    return engine
+
+
+def create_async_db_engine() -> AsyncEngine:
+    """
+    Create an asyncio Engine (psycopg async driver) for the request path.
+
+    The same DATABASE_URL works: the postgresql+psycopg dialect picks the
+    async driver under create_async_engine. Pool settings match the sync engine.
+    """
+    engine = create_async_engine(
+        settings.database_url,
+        poolclass=InstrumentedAsyncQueuePool,
+        **_pool_kwargs(),
     )
+    event.listen(engine.sync_engine, "connect", _register_pgvector_async)
+    return engine
+
+
+def init_engine() -> Engine:
+    """Create the process-wide engine (idempotent). Called on app startup."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_db_engine()
+        return _engine
+
+
+def get_engine() -> Engine:
+    """
+    Return the process-wide engine.
+
+    The app creates it during lifespan startup; scripts and CLIs get it
+    lazily on first use.
+    """
+    return _engine or init_engine()
+
+
+def dispose_engine() -> None:
+    """Close all pooled connections and drop the process-wide engine."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+
+def init_async_engine() -> AsyncEngine:
+    """Create the process-wide async engine (idempotent). Called on app startup."""
+    global _async_engine
+    with _engine_lock:
+        if _async_engine is None:
+            _async_engine = create_async_db_engine()
+        return _async_engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """Return the process-wide async engine, creating it on first use."""
+    return _async_engine or init_async_engine()
+
+
+async def dispose_async_engine() -> None:
+    global _async_engine
+    with _engine_lock:
+        engine, _async_engine = _async_engine, None
+    if engine is not None:
+        await engine.dispose()
+
+
+def get_pool_stats(engine: Engine | AsyncEngine) -> PoolStats | None:
+    pool = engine.sync_engine.pool if isinstance(engine, AsyncEngine) else engine.pool
+    if not isinstance(pool, InstrumentedQueuePool):
+        return None
+    c = pool.counters
+    with c.lock:
+        return PoolStats(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            checkouts=c.checkouts,
+            connects=c.connects,
+            timeouts=c.timeouts,
+            wait_seconds_total=c.wait_seconds_total,
+            wait_seconds_max=c.wait_seconds_max,
+        )
 
 
 def check_db_health(engine: Engine) -> DbHealth:
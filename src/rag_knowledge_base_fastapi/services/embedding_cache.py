@@ -0,0 +1,414 @@
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Sequence
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.embedding_coalescer import get_query_embedding_coalescer
+from rag_knowledge_base_fastapi.services.metrics import timed
+from rag_knowledge_base_fastapi.services.providers import (
+    embedding_model,
+    get_async_embedder,
+    get_embedder,
+)
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form used both as cache key and as the text we embed."""
+    return " ".join(unicodedata.normalize("NFKC", text or "").split())
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    size: int
+    max_entries: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    shared_hits: int
+    inflight_joins: int
+
+
+class SqliteEmbeddingStore:
+    """
+    Optional shared tier: a SQLite file that lets every worker process on a
+    host reuse embeddings computed by the others.
+
+    Vectors are stored as raw little-endian float32 bytes.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float) -> None:
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (model, query)
+            )
+            """
+        )
+
+    def get(self, model: str, query: str) -> np.ndarray | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector, created_at FROM query_embeddings WHERE model = ? AND query = ?",
+                (model, query),
+            ).fetchone()
+        if row is None or time.time() - row[1] > self._ttl:
+            return None
+        return np.frombuffer(row[0], dtype="<f4")
+
+    def put(self, model: str, query: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (model, query, vector, created_at) VALUES (?, ?, ?, ?)",
+                (model, query, vector.astype("<f4").tobytes(), time.time()),
+            )
+
+
+class _Flight:
+    """One in-progress embedding call that concurrent callers can join."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.vector: np.ndarray | None = None
+        self.error: BaseException | None = None
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded in-process LRU + TTL cache of query embeddings.
+
+    - Keyed on (embedding model, normalized query text).
+    - Values are read-only float32 arrays (~6 KB for 1536 dims instead of
+      ~50 KB as a list of Python floats).
+    - Concurrent misses for the same key share one embedding call, for
+      threads (get_or_embed) and coroutines (aget_or_embed) alike.
+    - An optional shared store is consulted on local misses.
+    - get_or_embed_many / aget_or_embed_many embed all the misses of a
+      batch in one `embed_many` call (these are not coalesced with other
+      in-flight calls).
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int,
+        ttl_seconds: float,
+        shared: SqliteEmbeddingStore | None = None,
+    ) -> None:
+        self._max_entries = max(0, max_entries)
+        self._ttl = ttl_seconds
+        self._shared = shared
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], tuple[float, np.ndarray]] = OrderedDict()
+        self._inflight: dict[tuple[str, str], _Flight] = {}
+        self._async_inflight: dict[tuple[str, str], asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.shared_hits = 0
+        self.inflight_joins = 0
+
+    def _get_local(self, key: tuple[str, str]) -> np.ndarray | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, vector = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    def _put_local(self, key: tuple[str, str], vector: np.ndarray) -> None:
+        if self._max_entries == 0:
+            return
+        self._entries[key] = (time.monotonic() + self._ttl, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_embed(
+        self,
+        query: str,
+        model: str,
+        embed: Callable[[str], Sequence[float]],
+    ) -> np.ndarray:
+        """
+        Return the embedding for `query`, calling `embed(normalized_query)`
+        only when neither tier has it and no identical call is in flight.
+        """
+        normalized = normalize_query(query)
+        key = (model, normalized)
+
+        with self._lock:
+            vector = self._get_local(key)
+            if vector is not None:
+                self.hits += 1
+                return vector
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.inflight_joins += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.vector
+
+        try:
+            vector = self._shared.get(model, normalized) if self._shared else None
+            if vector is not None:
+                with self._lock:
+                    self.shared_hits += 1
+            else:
+                vector = np.asarray(embed(normalized), dtype=np.float32)
+                if self._shared:
+                    self._shared.put(model, normalized, vector)
+            flight.vector = self._store(key, vector)
+            return flight.vector
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    async def aget_or_embed(
+        self,
+        query: str,
+        model: str,
+        embed: Callable[[str], Awaitable[Sequence[float]]],
+    ) -> np.ndarray:
+        """Async variant of `get_or_embed` for the event-loop request path."""
+        normalized = normalize_query(query)
+        key = (model, normalized)
+
+        with self._lock:
+            vector = self._get_local(key)
+            if vector is not None:
+                self.hits += 1
+                return vector
+            task = self._async_inflight.get(key)
+            if task is None:
+                self.misses += 1
+                task = asyncio.ensure_future(self._afill(key, model, normalized, embed))
+                self._async_inflight[key] = task
+            else:
+                self.inflight_joins += 1
+
+        # Shielded: one caller being cancelled (client disconnect) must not
+        # cancel the embedding call the other callers are waiting on.
+        return await asyncio.shield(task)
+
+    async def _afill(
+        self,
+        key: tuple[str, str],
+        model: str,
+        normalized: str,
+        embed: Callable[[str], Awaitable[Sequence[float]]],
+    ) -> np.ndarray:
+        try:
+            vector = await asyncio.to_thread(self._shared.get, model, normalized) if self._shared else None
+            if vector is not None:
+                with self._lock:
+                    self.shared_hits += 1
+            else:
+                vector = np.asarray(await embed(normalized), dtype=np.float32)
+                if self._shared:
+                    await asyncio.to_thread(self._shared.put, model, normalized, vector)
+            return self._store(key, vector)
+        finally:
+            with self._lock:
+                self._async_inflight.pop(key, None)
+
+    def _lookup_many(self, model: str, texts: list[str]) -> tuple[dict[str, np.ndarray], list[str]]:
+        """Local hits for the distinct normalized `texts`, and the ones that missed."""
+        found: dict[str, np.ndarray] = {}
+        missing: list[str] = []
+        with self._lock:
+            for text in dict.fromkeys(texts):
+                vector = self._get_local((model, text))
+                if vector is None:
+                    self.misses += 1
+                    missing.append(text)
+                else:
+                    self.hits += 1
+                    found[text] = vector
+        return found, missing
+
+    def _shared_get_many(self, model: str, texts: list[str]) -> dict[str, np.ndarray]:
+        if not self._shared:
+            return {}
+        found = {}
+        for text in texts:
+            vector = self._shared.get(model, text)
+            if vector is not None:
+                found[text] = self._store((model, text), vector)
+        with self._lock:
+            self.shared_hits += len(found)
+        return found
+
+    def _store_many(self, model: str, texts: list[str], vectors: Sequence[Sequence[float]]) -> dict[str, np.ndarray]:
+        found = {}
+        for text, vector in zip(texts, vectors, strict=True):
+            vector = np.asarray(vector, dtype=np.float32)
+            if self._shared:
+                self._shared.put(model, text, vector)
+            found[text] = self._store((model, text), vector)
+        return found
+
+    def get_or_embed_many(
+        self,
+        queries: Sequence[str],
+        model: str,
+        embed_many: Callable[[list[str]], Sequence[Sequence[float]]],
+    ) -> list[np.ndarray]:
+        """
+        `get_or_embed` for a batch: the distinct normalized queries neither
+        tier has are embedded with one `embed_many(texts)` call. Returns one
+        vector per query, in order.
+        """
+        normalized = [normalize_query(q) for q in queries]
+        found, missing = self._lookup_many(model, normalized)
+        found.update(self._shared_get_many(model, missing))
+        missing = [t for t in missing if t not in found]
+        if missing:
+            found.update(self._store_many(model, missing, embed_many(missing)))
+        return [found[t] for t in normalized]
+
+    async def aget_or_embed_many(
+        self,
+        queries: Sequence[str],
+        model: str,
+        embed_many: Callable[[list[str]], Awaitable[Sequence[Sequence[float]]]],
+    ) -> list[np.ndarray]:
+        """Async variant of `get_or_embed_many`."""
+        normalized = [normalize_query(q) for q in queries]
+        found, missing = self._lookup_many(model, normalized)
+        if missing and self._shared:
+            found.update(await asyncio.to_thread(self._shared_get_many, model, missing))
+            missing = [t for t in missing if t not in found]
+        if missing:
+            vectors = await embed_many(missing)
+            if self._shared:
+                found.update(await asyncio.to_thread(self._store_many, model, missing, vectors))
+            else:
+                found.update(self._store_many(model, missing, vectors))
+        return [found[t] for t in normalized]
+
+    def _store(self, key: tuple[str, str], vector: np.ndarray) -> np.ndarray:
+        vector.setflags(write=False)
+        with self._lock:
+            self._put_local(key, vector)
+        return vector
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(
+                size=len(self._entries),
+                max_entries=self._max_entries,
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                expirations=self.expirations,
+                shared_hits=self.shared_hits,
+                inflight_joins=self.inflight_joins,
+            )
+
+
+_cache: QueryEmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            shared = (
+                SqliteEmbeddingStore(settings.query_cache_sqlite_path, settings.query_cache_ttl_seconds)
+                if settings.query_cache_sqlite_path
+                else None
+            )
+            _cache = QueryEmbeddingCache(
+                max_entries=settings.query_cache_max_entries,
+                ttl_seconds=settings.query_cache_ttl_seconds,
+                shared=shared,
+            )
+        return _cache
+
+
+def embed_query(query: str) -> np.ndarray:
+    """Embed a search/chat query through the process-wide cache."""
+
+    def embed(text: str) -> np.ndarray:
+        with timed("embed"):
+            return get_embedder(lane="interactive").embed_text(text).vector
+
+    return get_query_embedding_cache().get_or_embed(query, embedding_model(), embed)
+
+
+async def aembed_query(query: str) -> np.ndarray:
+    """
+    Async variant of `embed_query`. Misses go through the coalescer, if
+    enabled, to share embeddings requests with concurrent queries.
+    """
+    coalescer = get_query_embedding_coalescer()
+
+    async def embed(text: str) -> np.ndarray:
+        with timed("embed"):
+            if coalescer is not None:
+                return await coalescer.embed(text)
+            return (await get_async_embedder(lane="interactive").embed_text(text)).vector
+
+    return await get_query_embedding_cache().aget_or_embed(query, embedding_model(), embed)
+
+
+def embed_queries(queries: Sequence[str]) -> list[np.ndarray]:
+    """Embed many queries through the process-wide cache, the uncached ones in batched requests."""
+
+    def embed_many(texts: list[str]) -> list[np.ndarray]:
+        with timed("embed"):
+            return [r.vector for r in get_embedder(lane="interactive").embed_texts(texts)]
+
+    return get_query_embedding_cache().get_or_embed_many(queries, embedding_model(), embed_many)
+
+
+async def aembed_queries(queries: Sequence[str]) -> list[np.ndarray]:
+    """Async variant of `embed_queries`."""
+
+    async def embed_many(texts: list[str]) -> list[np.ndarray]:
+        with timed("embed"):
+            return [r.vector for r in await get_async_embedder(lane="interactive").embed_texts(texts)]
+
+    return await get_query_embedding_cache().aget_or_embed_many(queries, embedding_model(), embed_many)
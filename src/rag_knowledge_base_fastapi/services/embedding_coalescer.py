@@ -0,0 +1,144 @@
+"""
+Micro-batching of concurrent query embeddings (QUERY_EMBED_COALESCE_WINDOW_MS > 0).
+
+Requests that miss the query cache at about the same time would each send
+an embeddings request with one input; most of that time, and of the rate
+limit, is per-request overhead. Here their queries are collected into one
+batch and sent as a single `embed_texts` call, and every caller gets its
+own vector back.
+
+The window adapts to load. While no batch is in flight a query is sent at
+once, so an idle service pays no added latency. While one is in flight,
+new queries wait until it returns, QUERY_EMBED_COALESCE_WINDOW_MS pass
+or QUERY_EMBED_COALESCE_MAX_BATCH of them have arrived (whichever comes
+first) and go out together, so batches grow with the arrival rate.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Sequence
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.providers import get_async_embedder
+
+
+@dataclass(frozen=True)
+class CoalescerStats:
+    queries: int
+    batches: int
+    largest_batch: int
+    in_flight: int
+
+
+@dataclass(eq=False)
+class _Batch:
+    texts: list[str] = field(default_factory=list)
+    futures: list[asyncio.Future] = field(default_factory=list)
+    timer: asyncio.TimerHandle | None = None
+
+
+class EmbeddingCoalescer:
+    def __init__(
+        self,
+        embed_many: Callable[[list[str]], Awaitable[Sequence[np.ndarray]]],
+        *,
+        window_seconds: float,
+        max_batch: int,
+    ) -> None:
+        self._embed_many = embed_many
+        self._window = window_seconds
+        self._max_batch = max(1, max_batch)
+        self._open: _Batch | None = None  # collecting queries
+        self._in_flight = 0
+        self._tasks: set[asyncio.Task] = set()
+
+        self.queries = 0
+        self.batches = 0
+        self.largest_batch = 0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """The embedding of `text`, sent together with whatever queries arrive alongside it."""
+        loop = asyncio.get_running_loop()
+        batch = self._open
+        if batch is None:
+            batch = self._open = _Batch()
+        future = loop.create_future()
+        batch.texts.append(text)
+        batch.futures.append(future)
+
+        if len(batch.texts) >= self._max_batch or self._in_flight == 0:
+            self._dispatch(batch)
+        elif batch.timer is None:
+            batch.timer = loop.call_later(self._window, self._dispatch, batch)
+        # A cancelled caller only drops its own future; the batch still runs.
+        return await future
+
+    def _dispatch(self, batch: _Batch) -> None:
+        if self._open is batch:
+            self._open = None
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self._in_flight += 1
+        self.queries += len(batch.texts)
+        self.batches += 1
+        self.largest_batch = max(self.largest_batch, len(batch.texts))
+        task = asyncio.ensure_future(self._run(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: _Batch) -> None:
+        try:
+            vectors = await self._embed_many(batch.texts)
+            # Checked before any caller gets a result, so a short reply fails
+            # the whole batch instead of leaving some callers waiting.
+            if len(vectors) != len(batch.futures):
+                raise ValueError(f"Expected {len(batch.futures)} embeddings, got {len(vectors)}")
+            for future, vector in zip(batch.futures, vectors):
+                if not future.done():
+                    future.set_result(vector)
+        except BaseException as exc:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(exc)
+            if isinstance(exc, asyncio.CancelledError):
+                raise
+        finally:
+            self._in_flight -= 1
+            # Nothing left to overlap with: don't sit out the rest of the window.
+            if self._in_flight == 0 and self._open is not None:
+                self._dispatch(self._open)
+
+    def stats(self) -> CoalescerStats:
+        return CoalescerStats(
+            queries=self.queries,
+            batches=self.batches,
+            largest_batch=self.largest_batch,
+            in_flight=self._in_flight,
+        )
+
+
+async def _embed_queries(texts: list[str]) -> list[np.ndarray]:
+    return [r.vector for r in await get_async_embedder(lane="interactive").embed_texts(texts)]
+
+
+_coalescer: EmbeddingCoalescer | None = None
+_coalescer_lock = threading.Lock()
+
+
+def get_query_embedding_coalescer() -> EmbeddingCoalescer | None:
+    """The process-wide coalescer, or None when QUERY_EMBED_COALESCE_WINDOW_MS is 0."""
+    global _coalescer
+    if settings.query_embed_coalesce_window_ms <= 0:
+        return None
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = EmbeddingCoalescer(
+                _embed_queries,
+                window_seconds=settings.query_embed_coalesce_window_ms / 1000,
+                max_batch=settings.query_embed_coalesce_max_batch,
+            )
+        return _coalescer
@@ -0,0 +1,405 @@
+"""
+Background ingestion jobs (/ingest/text, /ingest/file).
+
+Submitting spools the document to INGEST_JOBS_DIR and records a job in a
+SQLite table next to it; the API answers right away with the job id. A
+pool of INGEST_JOB_WORKERS asyncio workers per process claims jobs and
+runs them through `aingest_stream`, saving progress after every batch.
+
+Crash safety: a claimed job holds a lease that its worker renews while it
+runs. If the process dies, the lease expires and any worker on the host
+picks the job up again from its last committed batch (`chunks_committed`);
+chunks after that which did make it to the DB are recognized by content
+hash and not embedded again. Jobs and payloads are per host, like the
+SQLite query cache.
+
+Jobs for the same (source, doc_id) run one at a time, in submission
+order: two concurrent ingests of one document would interleave their
+upserts and each prune the other's chunks.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Literal
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.streaming_ingest import StreamIngestResult, aingest_stream
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+
+# Progress fields copied from StreamIngestResult into the jobs table.
+_PROGRESS_FIELDS = tuple(StreamIngestResult.__dataclass_fields__)
+
+
+class QueueFullError(Exception):
+    """Too many unfinished jobs; the client should retry later."""
+
+    def __init__(self, pending: int, retry_after: float) -> None:
+        super().__init__(f"Ingestion queue is full ({pending} jobs pending)")
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class IngestJob:
+    id: str
+    status: JobStatus
+    source: str
+    doc_id: str | None
+    metadata: dict[str, Any]
+    bytes_total: int
+    created_at: float
+    started_at: float | None
+    finished_at: float | None
+    attempts: int
+    error: str | None
+    progress: dict[str, Any]
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class IngestJobStore:
+    """SQLite table of jobs plus a directory of spooled payloads."""
+
+    def __init__(self, directory: str | os.PathLike, *, lease_seconds: float) -> None:
+        self._dir = Path(directory)
+        (self._dir / "payloads").mkdir(parents=True, exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            self._dir / "jobs.sqlite", timeout=10.0, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        progress_columns = ",\n".join(
+            f"{name} {'REAL' if name.endswith('_seconds') else 'INTEGER'} NOT NULL DEFAULT 0"
+            for name in _PROGRESS_FIELDS
+        )
+        self._conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                source TEXT NOT NULL,
+                doc_id TEXT,
+                metadata TEXT NOT NULL,
+                bytes_total INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                {progress_columns}
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_status_idx ON ingest_jobs (status, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ingest_jobs_doc_idx ON ingest_jobs (source, doc_id, status)")
+
+    def payload_path(self, job_id: str) -> Path:
+        return self._dir / "payloads" / f"{job_id}.txt"
+
+    def _row_to_job(self, row: sqlite3.Row | tuple) -> IngestJob:
+        (id_, status, source, doc_id, metadata, bytes_total, created_at, started_at, finished_at,
+         attempts, error, *progress) = row
+        return IngestJob(
+            id=id_,
+            status=status,
+            source=source,
+            doc_id=doc_id,
+            metadata=json.loads(metadata),
+            bytes_total=bytes_total,
+            created_at=created_at,
+            started_at=started_at,
+            finished_at=finished_at,
+            attempts=attempts,
+            error=error,
+            progress=dict(zip(_PROGRESS_FIELDS, progress)),
+        )
+
+    _COLUMNS = (
+        "id, status, source, doc_id, metadata, bytes_total, created_at, started_at, finished_at, attempts, error, "
+        + ", ".join(_PROGRESS_FIELDS)
+    )
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT count(*) FROM ingest_jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+
+    def create(self, job_id: str, *, source: str, doc_id: str | None, metadata: dict[str, Any]) -> IngestJob:
+        """Record a queued job for the payload already spooled to payload_path(job_id)."""
+        size = self.payload_path(job_id).stat().st_size
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO ingest_jobs (id, status, source, doc_id, metadata, bytes_total, created_at)
+                VALUES (?, 'queued', ?, ?, ?, ?, ?)
+                """,
+                (job_id, source, doc_id, json.dumps(metadata), size, time.time()),
+            )
+        return self.get(job_id)  # type: ignore[return-value]
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS} FROM ingest_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def claim(self) -> IngestJob | None:
+        """
+        Take the oldest queued job, or a running one whose lease expired,
+        of a document that no other job is running for.
+        """
+        now = time.time()
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes
+            # can't claim the same row.
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    """
+                    SELECT id FROM ingest_jobs j
+                    WHERE (status = 'queued' OR (status = 'running' AND lease_until < :now))
+                      AND NOT EXISTS (
+                          SELECT 1 FROM ingest_jobs r
+                          WHERE r.source = j.source AND r.doc_id IS j.doc_id AND r.id != j.id
+                            AND r.status = 'running' AND r.lease_until >= :now
+                      )
+                    ORDER BY created_at
+                    LIMIT 1
+                    """,
+                    {"now": now},
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        """
+                        UPDATE ingest_jobs
+                        SET status = 'running', lease_until = ?, attempts = attempts + 1,
+                            started_at = coalesce(started_at, ?)
+                        WHERE id = ?
+                        """,
+                        (now + self.lease_seconds, now, row[0]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row else None
+
+    def save_progress(self, job_id: str, progress: StreamIngestResult) -> None:
+        values = asdict(progress)
+        with self._lock:
+            self._conn.execute(
+                f"""
+                UPDATE ingest_jobs SET {", ".join(f"{k} = ?" for k in values)}, lease_until = ?
+                WHERE id = ?
+                """,
+                (*values.values(), time.time() + self.lease_seconds, job_id),
+            )
+
+    def renew(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET lease_until = ? WHERE id = ? AND status = 'running'",
+                (time.time() + self.lease_seconds, job_id),
+            )
+
+    def release(self, job_id: str) -> None:
+        """Hand a running job back to the queue (worker shutting down)."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET status = 'queued', lease_until = NULL WHERE id = ? AND status = 'running'",
+                (job_id,),
+            )
+
+    def finish(self, job_id: str, *, error: str | None = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ingest_jobs SET status = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                ("failed" if error else "done", error, time.time(), job_id),
+            )
+        self.payload_path(job_id).unlink(missing_ok=True)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class IngestJobQueue:
+    """Admission control on top of the store plus the per-process worker pool."""
+
+    def __init__(self, store: IngestJobStore, *, workers: int, max_pending: int, poll_seconds: float) -> None:
+        self.store = store
+        self._workers = workers
+        self._max_pending = max_pending
+        self._poll = poll_seconds
+        self._wakeup = asyncio.Event()
+        self._tasks: list[asyncio.Task] = []
+
+    # -- submission ----------------------------------------------------------
+
+    def _admit(self) -> None:
+        pending = self.store.pending()
+        if pending >= self._max_pending:
+            raise QueueFullError(pending, retry_after=self._poll * 5)
+
+    async def submit_file(
+        self,
+        fileobj: BinaryIO,
+        *,
+        source: str,
+        doc_id: str | None,
+        metadata: dict[str, Any],
+    ) -> IngestJob:
+        """Spool `fileobj` to disk and queue it. Raises QueueFullError."""
+        await asyncio.to_thread(self._admit)
+        job_id = uuid.uuid4().hex
+        path = self.store.payload_path(job_id)
+
+        def spool() -> IngestJob:
+            with open(path, "wb") as out:
+                shutil.copyfileobj(fileobj, out, settings.ingest_stream_read_bytes)
+            return self.store.create(job_id, source=source, doc_id=doc_id, metadata=metadata)
+
+        try:
+            job = await asyncio.to_thread(spool)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        self._wakeup.set()
+        return job
+
+    async def submit_text(
+        self,
+        content: str,
+        *,
+        source: str,
+        doc_id: str | None,
+        metadata: dict[str, Any],
+    ) -> IngestJob:
+        """Queue `content` (already in memory, e.g. a JSON body). Raises QueueFullError."""
+        await asyncio.to_thread(self._admit)
+        job_id = uuid.uuid4().hex
+        path = self.store.payload_path(job_id)
+
+        def spool() -> IngestJob:
+            path.write_text(content, encoding="utf-8")
+            return self.store.create(job_id, source=source, doc_id=doc_id, metadata=metadata)
+
+        try:
+            job = await asyncio.to_thread(spool)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+        self._wakeup.set()
+        return job
+
+    # -- workers -------------------------------------------------------------
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self._workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _next_job(self) -> IngestJob:
+        while True:
+            job = await asyncio.to_thread(self.store.claim)
+            if job is not None:
+                return job
+            # Other processes' submissions and expired leases only show up
+            # in the table, so poll as well as waiting for local submits.
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._next_job()
+            await self._run(job)
+
+    async def _blocks(self, job: IngestJob) -> AsyncIterator[bytes]:
+        with open(self.store.payload_path(job.id), "rb") as f:
+            while block := await asyncio.to_thread(f.read, settings.ingest_stream_read_bytes):
+                yield block
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.store.lease_seconds / 3)
+            await asyncio.to_thread(self.store.renew, job_id)
+
+    async def _run(self, job: IngestJob) -> None:
+        async def save(progress: StreamIngestResult) -> None:
+            await asyncio.to_thread(self.store.save_progress, job.id, progress)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        error: str | None = None
+        try:
+            result = await aingest_stream(
+                self._blocks(job),
+                source=job.source,
+                doc_id=job.doc_id,
+                metadata=job.metadata,
+                resume_from=int(job.progress["chunks_committed"]),
+                on_progress=save,
+            )
+            await save(result)
+            if not result.chunks_created:
+                error = "Document is empty."
+        except asyncio.CancelledError:
+            # Shutdown: let the next worker resume it right away instead of
+            # waiting for the lease to run out.
+            await asyncio.shield(asyncio.to_thread(self.store.release, job.id))
+            raise
+        except UnicodeDecodeError:
+            error = "File must be UTF-8 encoded text."
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+        finally:
+            heartbeat.cancel()
+        await asyncio.to_thread(self.store.finish, job.id, error=error)
+        # A job queued behind this one for the same document can run now.
+        self._wakeup.set()
+
+
+_queue: IngestJobQueue | None = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_queue() -> IngestJobQueue:
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            store = IngestJobStore(settings.ingest_jobs_dir, lease_seconds=settings.ingest_job_lease_seconds)
+            _queue = IngestJobQueue(
+                store,
+                workers=settings.ingest_job_workers,
+                max_pending=settings.ingest_queue_max_jobs,
+                poll_seconds=settings.ingest_job_poll_seconds,
+            )
+        return _queue
+
+
+async def close_ingest_queue() -> None:
+    global _queue
+    with _queue_lock:
+        queue, _queue = _queue, None
+    if queue is not None:
+        await queue.stop()
+        queue.store.close()
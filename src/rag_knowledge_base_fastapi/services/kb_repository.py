@@ -1,139 +1,602 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
-
-from sqlalchemy import bindparam, text
-
+import time
 from dataclasses import dataclass
 from typing import Any
 
+import numpy as np
 from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
 
-from rag_knowledge_base_fastapi.services.db import create_db_engine
-from rag_knowledge_base_fastapi.services.openai_embeddings import OpenAIEmbeddingsClient
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.db import get_async_engine, get_engine
+from rag_knowledge_base_fastapi.services.metrics import CHUNKS, observe_stage
+from rag_knowledge_base_fastapi.services.numpy_index import get_numpy_index
+from rag_knowledge_base_fastapi.services.openai_embeddings import EmbeddingResult
+from rag_knowledge_base_fastapi.services.providers import (
+    AsyncEmbedder,
+    Embedder,
+    get_async_embedder,
+    get_embedder,
+)
+from rag_knowledge_base_fastapi.services.schema import _DOCUMENT_AGGREGATES
 
-EMBED_DIM = 1536  # matches text-embedding-3-small
+EMBED_DIM = settings.embed_dim  # 1536 matches text-embedding-3-small
 
 
 @dataclass(frozen=True)
 class InsertResult:
-    inserted: int
+    inserted: int  # rows written (new or changed chunks)
+    embedded: int = 0  # texts sent to the embedding provider
+    reused: int = 0  # rows written with a stored embedding of identical text
+    unchanged: int = 0  # already stored with the same text and model; skipped
+    deleted: int = 0  # stored chunks missing from the new version
+    embed_seconds: float = 0.0  # waiting on the embedding provider
+    db_seconds: float = 0.0  # everything else: lookups, planning, writes
+
+
+def content_hash(content: str) -> str:
+    """sha256 hex of the chunk text (same as the backfill in schema.init_db)."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def text_doc_id(content: str) -> str:
+    """
+    doc_id for a document ingested without one. Chunks are keyed by
+    (source, doc_id, chunk_index), so a shared default would make each such
+    ingest replace the previous one of its source; derived from the text,
+    the same text is the same document and different texts never collide.
+    """
+    return "text-" + content_hash(content)[:32]
 
 
-def _zero_vector_literal(dim: int) -> str:
+# :embedding is a float32 ndarray, sent as a binary pgvector value
+# (see db._register_pgvector) rather than a ~30 KB text literal.
+# (source, doc_id, chunk_index) is unique, so re-ingesting a document
+# overwrites its chunks in place.
+_UPSERT_CHUNK_SQL = text(
     """
-    Returns a pgvector literal representing a zero vector of the given dimension.
-    Example: '[0,0,0]' for dim=3
+    INSERT INTO kb_chunks (source, doc_id, chunk_index, content, content_hash, embedding_model, metadata, embedding)
+    VALUES (:source, :doc_id, :chunk_index, :content, :content_hash, :embedding_model,
+            CAST(:metadata AS jsonb),
+            :embedding)
+    ON CONFLICT (source, doc_id, chunk_index) DO UPDATE SET
+        content = EXCLUDED.content,
+        content_hash = EXCLUDED.content_hash,
+        embedding_model = EXCLUDED.embedding_model,
+        metadata = EXCLUDED.metadata,
+        embedding = EXCLUDED.embedding,
+        created_at = now()
     """
-    return "[" + ",".join(["0"] * dim) + "]"
+)
+
+_REUSABLE_SQL = text(
+    """
+    SELECT DISTINCT ON (content_hash) content_hash, embedding
+    FROM kb_chunks
+    WHERE content_hash = ANY(:hashes) AND embedding_model = :model
+    """
+)
+
+
+def _doc_filter(doc_id: str | None) -> str:
+    # "doc_id = NULL" matches nothing; IS NOT DISTINCT FROM can't use the index.
+    return "doc_id = :doc_id" if doc_id is not None else "doc_id IS NULL"
+
+
+def _stored_chunks_sql(doc_id: str | None, *, prune: bool) -> TextClause:
+    # Without pruning only the rows this call may overwrite matter.
+    window = "" if prune else " AND chunk_index BETWEEN :lo AND :hi"
+    return text(
+        f"""
+        SELECT chunk_index, content_hash, embedding_model
+        FROM kb_chunks
+        WHERE source = :source AND {_doc_filter(doc_id)}{window}
+        """
+    )
+
+
+def _delete_stale_sql(doc_id: str | None) -> TextClause:
+    return text(
+        f"""
+        DELETE FROM kb_chunks
+        WHERE source = :source AND {_doc_filter(doc_id)} AND chunk_index = ANY(:stale)
+        """
+    )
+
+
+def _sync_document_sqls(doc_id: str | None) -> list[TextClause]:
+    """
+    Statements that recompute one document's kb_documents row from its
+    chunks (one index range scan), or drop it once no chunk is left. Run
+    in the transaction that changed the chunks.
+    """
+    doc = _doc_filter(doc_id)
+    return [
+        text(
+            f"""
+            INSERT INTO kb_documents (source, doc_id, chunks, bytes, content_hash, embedding_model)
+            SELECT :source, :doc_id, {_DOCUMENT_AGGREGATES}
+            FROM kb_chunks
+            WHERE source = :source AND {doc}
+            HAVING count(*) > 0
+            ON CONFLICT (source, doc_id) DO UPDATE SET
+                chunks = EXCLUDED.chunks,
+                bytes = EXCLUDED.bytes,
+                content_hash = EXCLUDED.content_hash,
+                embedding_model = EXCLUDED.embedding_model,
+                updated_at = now()
+            """
+        ),
+        text(
+            f"""
+            DELETE FROM kb_documents
+            WHERE source = :source AND {doc}
+              AND NOT EXISTS (SELECT 1 FROM kb_chunks WHERE source = :source AND {doc})
+            """
+        ),
+    ]
+
+
+def _validate_insert(source: str) -> None:
+    if not source.strip():
+        raise ValueError("source is required")
+
+
+# chunk_index -> (row key, content_hash, embedding_model) of a stored chunk.
+# The key is what deletes address: chunk_index in Postgres, the row id in
+# the numpy index.
+StoredChunks = dict[int, tuple[Any, str | None, str | None]]
+
+
+@dataclass(frozen=True)
+class _IngestPlan:
+    pending: list[tuple[int, str, str]]  # (chunk_index, content, content_hash) to write
+    replaced: list[Any]  # keys of stored rows that `pending` overwrites
+    stale: list[Any]  # keys of stored rows missing from the new version
+    unchanged: int
+
+
+def _plan_ingest(chunks: list[tuple[int, str]], stored: StoredChunks, model: str, *, prune: bool) -> _IngestPlan:
+    pending: list[tuple[int, str, str]] = []
+    replaced: list[Any] = []
+    for chunk_index, content in chunks:
+        h = content_hash(content)
+        old = stored.get(int(chunk_index))
+        if old is not None and old[1] == h and old[2] == model:
+            continue
+        pending.append((int(chunk_index), content, h))
+        if old is not None:
+            replaced.append(old[0])
+    stale: list[Any] = []
+    if prune:
+        present = {int(i) for i, _ in chunks}
+        stale = [key for i, (key, _, _) in stored.items() if i not in present]
+    return _IngestPlan(pending=pending, replaced=replaced, stale=stale, unchanged=len(chunks) - len(pending))
+
+
+def _texts_to_embed(plan: _IngestPlan, reusable: dict[str, np.ndarray]) -> dict[str, str]:
+    """content_hash -> text for pending chunks without a stored embedding (each text once)."""
+    todo: dict[str, str] = {}
+    for _, content, h in plan.pending:
+        if h not in reusable:
+            todo.setdefault(h, content)
+    return todo
+
+
+def _pending_vectors(
+    plan: _IngestPlan,
+    reusable: dict[str, np.ndarray],
+    todo: dict[str, str],
+    embeddings: list[EmbeddingResult],
+) -> list[np.ndarray]:
+    fresh = {h: e.vector for h, e in zip(todo, embeddings)}
+    return [reusable[h] if h in reusable else fresh[h] for _, _, h in plan.pending]
+
+
+def _result(plan: _IngestPlan, embedded: int, *, started: float, embed_seconds: float) -> InsertResult:
+    result = InsertResult(
+        inserted=len(plan.pending),
+        embedded=embedded,
+        reused=len(plan.pending) - embedded,
+        unchanged=plan.unchanged,
+        deleted=len(plan.stale),
+        embed_seconds=embed_seconds,
+        db_seconds=time.perf_counter() - started - embed_seconds,
+    )
+    if embedded:
+        observe_stage("embed", result.embed_seconds)
+    observe_stage("insert", result.db_seconds)
+    for outcome in ("inserted", "embedded", "reused", "unchanged", "deleted"):
+        CHUNKS.inc(outcome, getattr(result, outcome))
+    return result
+
+
+def _chunk_rows(
+    *,
+    source: str,
+    doc_id: str | None,
+    plan: _IngestPlan,
+    vectors: list[np.ndarray],
+    model: str,
+    metadata: dict[str, Any] | None,
+) -> list[dict[str, Any]]:
+    meta_json = json.dumps(metadata or {})
+    return [
+        {
+            "source": source,
+            "doc_id": doc_id,
+            "chunk_index": chunk_index,
+            "content": content,
+            "content_hash": h,
+            "embedding_model": model,
+            "metadata": meta_json,
+            "embedding": vector,
+        }
+        for (chunk_index, content, h), vector in zip(plan.pending, vectors)
+    ]
+
+
+def _numpy_add_args(
+    source: str,
+    doc_id: str | None,
+    plan: _IngestPlan,
+    vectors: list[np.ndarray],
+    model: str,
+    metadata: dict[str, Any] | None,
+) -> dict[str, Any]:
+    matrix = np.stack(vectors).astype(np.float32, copy=False) if vectors else np.empty((0, EMBED_DIM), np.float32)
+    return {
+        "source": source,
+        "doc_id": doc_id,
+        "chunks": [(chunk_index, content) for chunk_index, content, _ in plan.pending],
+        "vectors": matrix,
+        "metadata": metadata,
+        "content_hashes": [h for _, _, h in plan.pending],
+        "embedding_model": model,
+        # Changed chunks are appended as new rows; their old versions go too.
+        "replace_ids": plan.replaced + plan.stale,
+    }
+
+
+def _numpy_prepare(
+    source: str, doc_id: str | None, chunks: list[tuple[int, str]], model: str, prune: bool
+) -> tuple[_IngestPlan, dict[str, np.ndarray]]:
+    index = get_numpy_index()
+    window = None if prune else (min(int(i) for i, _ in chunks), max(int(i) for i, _ in chunks))
+    stored = index.doc_chunks(source=source, doc_id=doc_id, index_range=window)
+    plan = _plan_ingest(chunks, stored, model, prune=prune)
+    reusable = index.vectors_by_hash([h for _, _, h in plan.pending], model=model) if plan.pending else {}
+    return plan, reusable
+
+
+def _stored_chunks(rows) -> StoredChunks:
+    # Postgres rows are addressed by chunk_index itself.
+    return {r[0]: (r[0], r[1], r[2]) for r in rows}
+
+
+def _stored_params(source: str, doc_id: str | None, chunks: list[tuple[int, str]] | None = None) -> dict[str, Any]:
+    params: dict[str, Any] = {"source": source, "doc_id": doc_id}
+    if chunks:
+        params["lo"] = min(int(i) for i, _ in chunks)
+        params["hi"] = max(int(i) for i, _ in chunks)
+    return params
+
 
+def _reusable_params(plan: _IngestPlan, model: str) -> dict[str, Any]:
+    return {"hashes": sorted({h for _, _, h in plan.pending}), "model": model}
 
-def insert_chunks_without_embeddings(
+
+def insert_chunks_with_embeddings(
     *,
     source: str,
     doc_id: str | None,
     chunks: list[tuple[int, str]],
     metadata: dict[str, Any] | None = None,
+    embedder: Embedder | None = None,
+    prune: bool = True,
 ) -> InsertResult:
     """
-    Insert chunks into kb_chunks using a placeholder zero-vector embedding.
-    This is a temporary step to validate ingestion end-to-end before OpenAI is wired in.
+    Ingest the current version of a document (source, doc_id) incrementally.
+
+    Chunks whose text (content hash) and embedding model match the stored
+    row at the same chunk_index are skipped. New and changed chunks are
+    upserted, reusing the stored embedding of any identical text (from any
+    document) before embedding the rest with batched API requests. Stored
+    chunks missing from `chunks` are deleted in the same transaction.
+
+    With `prune=False`, `chunks` is only part of the document (e.g. one batch
+    of a streamed upload) and other stored chunks are left alone; see
+    `adelete_chunks_from` for dropping the tail afterwards. The document's
+    kb_documents row is updated in the same transaction, or, without
+    pruning, by `adelete_chunks_from`.
 
     chunks: list of (chunk_index, content)
     """
-    if not source.strip():
-        raise ValueError("source is required")
+    _validate_insert(source)
     if not chunks:
         return InsertResult(inserted=0)
 
-    meta = metadata or {}
-    zero_vec = _zero_vector_literal(EMBED_DIM)
+    embedder = embedder or get_embedder(lane="bulk")
+    model = embedder.model
+    started = time.perf_counter()
 
-    engine = create_db_engine()
+    if settings.retrieval_backend == "numpy":
+        plan, reusable = _numpy_prepare(source, doc_id, chunks, model, prune)
+        todo = _texts_to_embed(plan, reusable)
+        t_embed = time.perf_counter()
+        embeddings = embedder.embed_texts(list(todo.values())) if todo else []
+        embed_seconds = time.perf_counter() - t_embed
+        vectors = _pending_vectors(plan, reusable, todo, embeddings)
+        if plan.pending or plan.stale:
+            get_numpy_index().add(**_numpy_add_args(source, doc_id, plan, vectors, model, metadata))
+        return _result(plan, embedded=len(todo), started=started, embed_seconds=embed_seconds)
 
-    sql = (
-        text(
-            """
-            INSERT INTO kb_chunks (source, doc_id, chunk_index, content, metadata, embedding)
-            VALUES (:source, :doc_id, :chunk_index, :content,
-                    CAST(:metadata AS jsonb),
-                    CAST(:embedding AS vector))
-            """
-        )
-        .bindparams(
-            bindparam("metadata"),
-            bindparam("embedding"),
-        )
-    )
+    engine = get_engine()
+    with engine.connect() as conn:
+        stored_sql = _stored_chunks_sql(doc_id, prune=prune)
+        stored = _stored_chunks(conn.execute(stored_sql, _stored_params(source, doc_id, chunks)))
+        plan = _plan_ingest(chunks, stored, model, prune=prune)
+        reusable = {}
+        if plan.pending:
+            reusable = dict(conn.execute(_REUSABLE_SQL, _reusable_params(plan, model)).fetchall())
 
+    # Embed before opening the write transaction so no connection is held
+    # while we wait on the embeddings API.
+    todo = _texts_to_embed(plan, reusable)
+    t_embed = time.perf_counter()
+    embeddings = embedder.embed_texts(list(todo.values())) if todo else []
+    embed_seconds = time.perf_counter() - t_embed
+    rows = _chunk_rows(
+        source=source,
+        doc_id=doc_id,
+        plan=plan,
+        vectors=_pending_vectors(plan, reusable, todo, embeddings),
+        model=model,
+        metadata=metadata,
+    )
 
     with engine.begin() as conn:
-        for chunk_index, content in chunks:
-            conn.execute(
-                sql,
-                {
-                    "source": source,
-                    "doc_id": doc_id,
-                    "chunk_index": int(chunk_index),
-                    "content": content,
-                    "metadata": json.dumps(meta),
-                    "embedding": zero_vec,
-                },
-            )
+        if rows:
+            # A list of parameter sets makes SQLAlchemy use executemany, which
+            # psycopg pipelines instead of paying one round trip per row.
+            conn.execute(_UPSERT_CHUNK_SQL, rows)
+        if plan.stale:
+            conn.execute(_delete_stale_sql(doc_id), {**_stored_params(source, doc_id), "stale": plan.stale})
+        if prune:
+            for sql in _sync_document_sqls(doc_id):
+                conn.execute(sql, _stored_params(source, doc_id))
 
-    return InsertResult(inserted=len(chunks))
+    return _result(plan, embedded=len(todo), started=started, embed_seconds=embed_seconds)
 
-def insert_chunks_with_embeddings(
+
+async def ainsert_chunks_with_embeddings(
     *,
     source: str,
     doc_id: str | None,
     chunks: list[tuple[int, str]],
     metadata: dict[str, Any] | None = None,
+    embedder: AsyncEmbedder | None = None,
+    prune: bool = True,
 ) -> InsertResult:
+    """Async variant of `insert_chunks_with_embeddings` used by the API."""
+    _validate_insert(source)
+    if not chunks:
+        return InsertResult(inserted=0)
+
+    embedder = embedder or get_async_embedder(lane="bulk")
+    model = embedder.model
+    started = time.perf_counter()
+
+    if settings.retrieval_backend == "numpy":
+        plan, reusable = await asyncio.to_thread(_numpy_prepare, source, doc_id, chunks, model, prune)
+        todo = _texts_to_embed(plan, reusable)
+        t_embed = time.perf_counter()
+        embeddings = await embedder.embed_texts(list(todo.values())) if todo else []
+        embed_seconds = time.perf_counter() - t_embed
+        vectors = _pending_vectors(plan, reusable, todo, embeddings)
+        if plan.pending or plan.stale:
+            add_args = _numpy_add_args(source, doc_id, plan, vectors, model, metadata)
+            await asyncio.to_thread(get_numpy_index().add, **add_args)
+        return _result(plan, embedded=len(todo), started=started, embed_seconds=embed_seconds)
+
+    engine = get_async_engine()
+    async with engine.connect() as conn:
+        result = await conn.execute(_stored_chunks_sql(doc_id, prune=prune), _stored_params(source, doc_id, chunks))
+        stored = _stored_chunks(result)
+        plan = _plan_ingest(chunks, stored, model, prune=prune)
+        reusable = {}
+        if plan.pending:
+            reusable = dict((await conn.execute(_REUSABLE_SQL, _reusable_params(plan, model))).fetchall())
+
+    todo = _texts_to_embed(plan, reusable)
+    t_embed = time.perf_counter()
+    embeddings = await embedder.embed_texts(list(todo.values())) if todo else []
+    embed_seconds = time.perf_counter() - t_embed
+    rows = _chunk_rows(
+        source=source,
+        doc_id=doc_id,
+        plan=plan,
+        vectors=_pending_vectors(plan, reusable, todo, embeddings),
+        model=model,
+        metadata=metadata,
+    )
+
+    async with engine.begin() as conn:
+        if rows:
+            await conn.execute(_UPSERT_CHUNK_SQL, rows)
+        if plan.stale:
+            await conn.execute(_delete_stale_sql(doc_id), {**_stored_params(source, doc_id), "stale": plan.stale})
+        if prune:
+            for sql in _sync_document_sqls(doc_id):
+                await conn.execute(sql, _stored_params(source, doc_id))
+
+    return _result(plan, embedded=len(todo), started=started, embed_seconds=embed_seconds)
+
+
+async def adelete_chunks_from(*, source: str, doc_id: str | None, first_index: int) -> int:
     """
-    Insert chunks into kb_chunks using real OpenAI embeddings.
+    Delete the chunks of a document with chunk_index >= first_index.
 
-    chunks: list of (chunk_index, content)
+    Finishes an ingest done in parts (`prune=False`): a new version with
+    fewer chunks leaves the old tail behind, and the kb_documents row is
+    brought up to date. Returns the number deleted.
     """
-    if not source.strip():
-        raise ValueError("source is required")
-    if not chunks:
-        return InsertResult(inserted=0)
+    _validate_insert(source)
+    if settings.retrieval_backend == "numpy":
+        index = get_numpy_index()
+        tail = (first_index, 2**63 - 1)
+        stored = await asyncio.to_thread(index.doc_chunks, source=source, doc_id=doc_id, index_range=tail)
+        stale = [id_ for id_, _, _ in stored.values()]
+        if stale:
+            empty = np.empty((0, EMBED_DIM), np.float32)
+            await asyncio.to_thread(
+                index.add, source=source, doc_id=doc_id, chunks=[], vectors=empty, replace_ids=stale
+            )
+        return len(stale)
 
-    meta = metadata or {}
-    engine = create_db_engine()
+    sql = text(
+        f"""
+        DELETE FROM kb_chunks
+        WHERE source = :source AND {_doc_filter(doc_id)} AND chunk_index >= :first_index
+        """
+    )
+    async with get_async_engine().begin() as conn:
+        result = await conn.execute(sql, {**_stored_params(source, doc_id), "first_index": first_index})
+        for sync in _sync_document_sqls(doc_id):
+            await conn.execute(sync, _stored_params(source, doc_id))
+    return result.rowcount
 
-    embedder = OpenAIEmbeddingsClient()
 
-    sql = (
-        text(
-            """
-            INSERT INTO kb_chunks (source, doc_id, chunk_index, content, metadata, embedding)
-            VALUES (:source, :doc_id, :chunk_index, :content,
-                    CAST(:metadata AS jsonb),
-                    CAST(:embedding AS vector))
-            """
-        )
-        .bindparams(
-            bindparam("metadata"),
-            bindparam("embedding"),
+# ---------------------------------------------------------------------------
+# Document catalog
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class DocumentPage:
+    docs: list[dict[str, Any]]
+    next_cursor: int | None  # pass as `cursor` for the next page; None on the last one
+
+
+def _page(rows: list[dict[str, Any]], limit: int) -> DocumentPage:
+    """`rows` holds up to limit + 1 documents with their cursor key in "id"."""
+    docs = rows[:limit]
+    next_cursor = docs[-1]["id"] if len(rows) > limit else None
+    for d in docs:
+        del d["id"]
+    return DocumentPage(docs=docs, next_cursor=next_cursor)
+
+
+def _like_prefix(prefix: str) -> str:
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+async def alist_documents(
+    *,
+    limit: int,
+    cursor: int | None = None,
+    source: str | None = None,
+    prefix: str | None = None,
+) -> DocumentPage:
+    """
+    One page of documents, most recently added first, from the kb_documents
+    catalog (keyset pagination on its id, so every page is an index range
+    scan however deep it is). `prefix` matches the start of doc_id.
+    """
+    if settings.retrieval_backend == "numpy":
+        rows = await asyncio.to_thread(
+            get_numpy_index().list_docs, limit=limit + 1, cursor=cursor, source=source, prefix=prefix
         )
+        return _page(rows, limit)
+
+    filters, params = "", {"limit": limit + 1}
+    if cursor is not None:
+        filters += " AND id < :cursor"
+        params["cursor"] = cursor
+    if source:
+        filters += " AND source = :source"
+        params["source"] = source
+    if prefix:
+        filters += " AND doc_id LIKE :prefix"
+        params["prefix"] = _like_prefix(prefix)
+    sql = text(
+        f"""
+        SELECT id, source, doc_id, chunks, bytes, content_hash, embedding_model, created_at, updated_at
+        FROM kb_documents
+        WHERE 1=1{filters}
+        ORDER BY id DESC
+        LIMIT :limit
+        """
     )
+    async with get_async_engine().connect() as conn:
+        rows = (await conn.execute(sql, params)).mappings().all()
+    return _page([dict(r) for r in rows], limit)
 
-    with engine.begin() as conn:
-        for chunk_index, content in chunks:
-            emb = embedder.embed_text(content)
-            conn.execute(
-                sql,
-                {
-                    "source": source,
-                    "doc_id": doc_id,
-                    "chunk_index": int(chunk_index),
-                    "content": content,
-                    "metadata": json.dumps(meta),
-                    "embedding": "[" + ",".join(map(str, emb.vector)) + "]",
-                },
-            )
 
-    return InsertResult(inserted=len(chunks))
+_DELETE_DOCUMENT_BATCH_SQL = """
+WITH gone AS (
+    DELETE FROM kb_chunks
+    WHERE id IN (SELECT id FROM kb_chunks WHERE doc_id = :doc_id{filters} LIMIT :batch_rows)
+    RETURNING source, octet_length(content) AS bytes
+),
+per_source AS (
+    SELECT source, count(*) AS chunks, sum(bytes) AS bytes FROM gone GROUP BY source
+),
+catalog AS (
+    UPDATE kb_documents d
+    SET chunks = d.chunks - p.chunks, bytes = d.bytes - p.bytes, updated_at = now()
+    FROM per_source p
+    WHERE d.source = p.source AND d.doc_id = :doc_id
+)
+SELECT coalesce(sum(chunks), 0) FROM per_source
+"""
+
 
+async def adelete_document(*, doc_id: str, source: str | None = None) -> int:
+    """
+    Delete every chunk of `doc_id` (in `source`, or in any source) and its
+    catalog row. Returns the number of chunks deleted.
+
+    Chunks go KB_DELETE_BATCH_ROWS at a time, one transaction per batch, so
+    a large document neither holds its row locks until the end nor writes
+    its whole WAL volume at once; the catalog row is adjusted in each batch.
+    Searches stop seeing the document gradually.
+    """
+    if settings.retrieval_backend == "numpy":
+        return await asyncio.to_thread(get_numpy_index().delete, doc_id=doc_id, source=source)
+
+    params: dict[str, Any] = {"doc_id": doc_id, "batch_rows": settings.kb_delete_batch_rows}
+    filters = ""
+    if source:
+        filters = " AND source = :source"
+        params["source"] = source
+    batch_sql = text(_DELETE_DOCUMENT_BATCH_SQL.format(filters=filters))
+
+    engine = get_async_engine()
+    deleted = 0
+    while True:
+        async with engine.begin() as conn:
+            n = int((await conn.execute(batch_sql, params)).scalar_one())
+        deleted += n
+        if n < params["batch_rows"]:
+            break
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            text(
+                f"""
+                DELETE FROM kb_documents
+                WHERE doc_id = :doc_id{filters}
+                  AND NOT EXISTS (
+                      SELECT 1 FROM kb_chunks c
+                      WHERE c.source = kb_documents.source AND c.doc_id = :doc_id
+                  )
+                """
+            ),
+            params,
+        )
+    return deleted
@@ -0,0 +1,204 @@
+"""
+Process-local metrics, rendered in the Prometheus text format on /metrics.
+
+Pipeline stages (embed, db_query, llm, chunk, insert, pool_wait, ...)
+record their duration with `timed(stage)`, or `observe_stage` when it is
+already known, into the rag_stage_seconds histogram. Inside an HTTP request
+the durations are also summed per stage for the response's Server-Timing
+header (see `MetricsMiddleware`). Recording is a bisect and an uncontended
+lock; everything is formatted on scrape only.
+
+Each worker process has its own registry, so scrape workers individually
+(or sum over instances).
+"""
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Literal
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.slow_requests import get_slow_request_sampler
+
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(pairs: Iterable[tuple[str, str]]) -> str:
+    body = ",".join(f'{k}="{_escape(v)}"' for k, v in pairs)
+    return f"{{{body}}}" if body else ""
+
+
+class Counter:
+    """Monotonic counter with one label."""
+
+    def __init__(self, name: str, help: str, *, label: str) -> None:
+        self.name, self.help, self.label = name, help, label
+        self._lock = threading.Lock()
+        self._values: dict[str, float] = {}
+
+    def inc(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in values:
+            yield f"{self.name}{_labels([(self.label, key)])} {_number(value)}"
+
+
+class Histogram:
+    """Histogram with one label and fixed buckets."""
+
+    def __init__(self, name: str, help: str, *, label: str, buckets: tuple[float, ...] = _LATENCY_BUCKETS) -> None:
+        self.name, self.help, self.label = name, help, label
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        # key -> per-bucket counts (last one is +Inf, not cumulative), sum
+        self._series: dict[str, tuple[list[int], list[float]]] = {}
+
+    def observe(self, key: str, value: float) -> None:
+        i = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self._buckets) + 1), [0.0])
+            series[0][i] += 1
+            series[1][0] += value
+
+    def render(self) -> Iterator[str]:
+        with self._lock:
+            series = sorted((k, list(counts), total[0]) for k, (counts, total) in self._series.items())
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self._buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                yield f"{self.name}_bucket{_labels([(self.label, key), ('le', le)])} {cumulative}"
+            yield f"{self.name}_sum{_labels([(self.label, key)])} {_number(total)}"
+            yield f"{self.name}_count{_labels([(self.label, key)])} {cumulative}"
+
+
+@dataclass(frozen=True)
+class Sample:
+    """A value read at scrape time (pool sizes, cache counters) by a collector."""
+
+    name: str
+    help: str
+    value: float
+    labels: tuple[tuple[str, str], ...] = ()
+    kind: Literal["gauge", "counter"] = "gauge"
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent per pipeline stage.", label="stage")
+HTTP_SECONDS = Histogram("rag_http_request_seconds", "HTTP request duration by route.", label="route")
+TOKENS = Counter("rag_tokens_total", "Tokens processed, by kind.", label="kind")
+CHUNKS = Counter("rag_chunks_total", "Chunks processed by ingestion, by outcome.", label="outcome")
+
+_collectors: list[Callable[[], Iterable[Sample]]] = []
+_request_timings: ContextVar[dict[str, float] | None] = ContextVar("request_timings", default=None)
+
+
+def register_collector(collect: Callable[[], Iterable[Sample]]) -> Callable[[], Iterable[Sample]]:
+    """Add a function called on every scrape; usable as a decorator."""
+    _collectors.append(collect)
+    return collect
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(stage, seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    for metric in (STAGE_SECONDS, HTTP_SECONDS, TOKENS, CHUNKS):
+        lines.extend(metric.render())
+
+    samples: dict[str, list[Sample]] = {}
+    for collect in _collectors:
+        for sample in collect():
+            samples.setdefault(sample.name, []).append(sample)
+    for name, group in samples.items():
+        lines.append(f"# HELP {name} {group[0].help}")
+        lines.append(f"# TYPE {name} {group[0].kind}")
+        lines.extend(f"{name}{_labels(s.labels)} {_number(s.value)}" for s in group)
+    return "\n".join(lines) + "\n"
+
+
+def _server_timing(timings: dict[str, float], total: float) -> bytes:
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    parts.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+def _route(scope: dict) -> str:
+    route = scope.get("route")
+    return f"{scope['method']} {getattr(route, 'path', None) or 'unmatched'}"
+
+
+class MetricsMiddleware:
+    """
+    Times each HTTP request by route, adds a Server-Timing header with its
+    per-stage durations, and reports slow requests to the sampler.
+
+    Streaming responses send their headers once the first event is ready,
+    so their Server-Timing covers retrieval but not the answer.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, float] = {}
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        sampler = get_slow_request_sampler()
+        tracked = sampler.track() if sampler is not None else None
+
+        async def send_with_timing(message) -> None:
+            if message["type"] == "http.response.start" and settings.server_timing:
+                header = _server_timing(timings, time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", ()), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_SECONDS.observe(_route(scope), elapsed)
+            _request_timings.reset(token)
+            if tracked is not None:
+                sampler.finish(tracked, route=_route(scope), seconds=elapsed, timings=timings)
@@ -0,0 +1,90 @@
+"""
+Maximal marginal relevance (MMR) over over-fetched search candidates.
+
+The nearest chunks to a query are often near-duplicates of each other (the
+same paragraph in several documents, overlapping chunks of one document),
+which spends the prompt on one fact. With MMR_FETCH_MULTIPLIER > 1 a search
+fetches top_k * multiplier candidates together with their embeddings, and
+`mmr` keeps top_k of them, each pick maximising
+
+    lambda * rel(c) - (1 - lambda) * max(sim(c, s) for s already picked)
+
+where rel is the candidate's own search score (negated for vector
+distances, the fused RRF score in hybrid mode) scaled to [0, 1] over the
+candidates, so the search's ranking is what MMR trades off, and sim is
+the cosine similarity of two candidates. All pairwise similarities come
+from one matrix product; each of the top_k greedy steps is then a few
+vector operations over the candidates.
+"""
+from __future__ import annotations
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+MAX_FETCH_MULTIPLIER = 25
+
+
+def mmr_params(mode: str, mmr_lambda: float | None, fetch_multiplier: int | None) -> tuple[float, int] | None:
+    """
+    (lambda, fetch multiplier) of a search, defaults from MMR_LAMBDA /
+    MMR_FETCH_MULTIPLIER; None when it is not diversified (multiplier 1, or
+    lexical mode, which has no query embedding to compare against).
+    """
+    mmr_lambda = mmr_lambda if mmr_lambda is not None else settings.mmr_lambda
+    fetch_multiplier = fetch_multiplier if fetch_multiplier is not None else settings.mmr_fetch_multiplier
+    if not 0.0 <= mmr_lambda <= 1.0:
+        raise ValueError("mmr_lambda must be between 0 and 1")
+    if fetch_multiplier < 1 or fetch_multiplier > MAX_FETCH_MULTIPLIER:
+        raise ValueError(f"fetch_multiplier must be between 1 and {MAX_FETCH_MULTIPLIER}")
+    if fetch_multiplier == 1 or mode == "lexical":
+        return None
+    return float(mmr_lambda), int(fetch_multiplier)
+
+
+def _unit_rows(x: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return np.divide(x, norms, out=np.zeros_like(x), where=norms > 0)
+
+
+def _scaled(relevance: np.ndarray) -> np.ndarray:
+    """`relevance` mapped onto [0, 1] (all ones if the candidates tie)."""
+    lo, hi = float(relevance.min()), float(relevance.max())
+    if hi <= lo:
+        return np.ones_like(relevance)
+    return (relevance - lo) / (hi - lo)
+
+
+def mmr(candidates: np.ndarray, relevance: np.ndarray, *, top_k: int, lambda_: float) -> np.ndarray:
+    """
+    Positions in `candidates` (one embedding per row) of the top_k MMR
+    picks, in pick order. `relevance` has one score per candidate, higher
+    is better. Ties go to the earlier candidate, so for candidates ranked
+    by `relevance`, lambda_=1 returns the first top_k unchanged, and the
+    first pick is always the most relevant one.
+    """
+    cand = _unit_rows(np.asarray(candidates, dtype=np.float32))
+    n = len(cand)
+    if len(relevance) != n:
+        raise ValueError("relevance must have one entry per candidate")
+    k = min(top_k, n)
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    scaled = _scaled(np.asarray(relevance, dtype=np.float32))
+    relevance = lambda_ * scaled
+    redundancy = (1.0 - lambda_) * (cand @ cand.T)
+
+    picked = np.empty(k, dtype=np.int64)
+    picked[0] = int(np.argmax(scaled))
+    # Highest (weighted) similarity of each candidate to the picks so far.
+    closest = redundancy[picked[0]].copy()
+    taken = np.zeros(n, dtype=bool)
+    taken[picked[0]] = True
+    for step in range(1, k):
+        gain = relevance - closest
+        gain[taken] = -np.inf
+        j = int(np.argmax(gain))
+        picked[step] = j
+        taken[j] = True
+        np.maximum(closest, redundancy[j], out=closest)
+    return picked
@@ -0,0 +1,625 @@
+"""
+In-process brute-force vector index (RETRIEVAL_BACKEND=numpy).
+
+Embeddings live in a contiguous float32/float16 matrix in a memory-mapped
+file, so startup is an mmap rather than a load. Chunk metadata, ids and
+tombstones live in a SQLite file next to it. Search is exact: one GEMM
+per block of rows for all queries at once, then argpartition for top-k.
+
+Layout of NUMPY_INDEX_DIR:
+    meta.sqlite         chunk rows (id, pos, source, doc_id, ...), their FTS5 index + settings
+    vectors.<gen>.bin   (capacity, dim) matrix; rows [0, count) are in use
+    norms.<gen>.bin     float32 L2 norm per row
+Compaction writes generation gen+1 and switches to it in one SQLite commit.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Literal, Sequence
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+IndexDtype = Literal["float32", "float16"]
+
+# Rows scored per GEMM; bounds the float32 scratch for float16 storage.
+_BLOCK_BYTES = 64 * 1024 * 1024
+_MIN_CAPACITY = 1024
+_WORD = re.compile(r"\w+")
+
+# (id, source, doc_id, chunk_index, content, score), like retrieval's SQL rows.
+Row = tuple[int, str, str | None, int, str, float]
+
+
+class NumpyVectorIndex:
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        *,
+        dim: int,
+        dtype: IndexDtype = "float32",
+        metric: str = "l2",
+        compact_ratio: float = 0.25,
+    ) -> None:
+        if metric not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unknown vector metric: {metric!r}")
+        self._dir = Path(path)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._dim = dim
+        self._dtype = np.dtype(dtype)
+        self._metric = metric
+        self._compact_ratio = compact_ratio
+
+        self._lock = threading.RLock()  # writers (append / delete / compact)
+        self._db_lock = threading.Lock()  # the sqlite connection
+        self._db = sqlite3.connect(self._dir / "meta.sqlite", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                pos INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                doc_id TEXT,
+                chunk_index INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        )
+        # Added after the first release; older files get them on open.
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(chunks)")}
+        for column in ("content_hash", "embedding_model"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE chunks ADD COLUMN {column} TEXT")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_pos_idx ON chunks (pos)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_doc_idx ON chunks (source, doc_id, chunk_index)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_hash_idx ON chunks (content_hash)")
+        self._create_fts()
+        self._db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._check_info()
+        self._load()
+
+    # -- setup -------------------------------------------------------------
+
+    def _create_fts(self) -> None:
+        """Full-text index over chunks.content (lexical/hybrid search), kept in sync by triggers."""
+        exists = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'").fetchone()
+        self._db.execute(
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
+            USING fts5(content, content='chunks', content_rowid='id', tokenize='porter unicode61')
+            """
+        )
+        # Tombstoning leaves a row's terms in place (searches join on
+        # deleted = 0); compaction's DELETE removes them.
+        self._db.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, content) VALUES (new.id, new.content);
+            END
+            """
+        )
+        self._db.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END
+            """
+        )
+        if not exists:
+            # Index files from before full-text search.
+            self._db.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+
+    def _info(self, key: str) -> str | None:
+        row = self._db.execute("SELECT value FROM info WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _check_info(self) -> None:
+        for key, value in (("dim", str(self._dim)), ("dtype", self._dtype.name)):
+            stored = self._info(key)
+            if stored is None:
+                self._db.execute("INSERT INTO info (key, value) VALUES (?, ?)", (key, value))
+            elif stored != value:
+                raise ValueError(f"Index at {self._dir} has {key}={stored}, configured {value}")
+        if self._info("generation") is None:
+            self._db.execute("INSERT INTO info (key, value) VALUES ('generation', '0')")
+
+    def _files(self, gen: int) -> tuple[Path, Path]:
+        return self._dir / f"vectors.{gen}.bin", self._dir / f"norms.{gen}.bin"
+
+    def _map(self, gen: int, capacity: int) -> tuple[np.memmap, np.memmap]:
+        vec_path, norm_path = self._files(gen)
+        for path, itemsize, width in ((vec_path, self._dtype.itemsize, self._dim), (norm_path, 4, 1)):
+            size = capacity * itemsize * width
+            with open(path, "ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+        matrix = np.memmap(vec_path, dtype=self._dtype, mode="r+", shape=(capacity, self._dim))
+        norms = np.memmap(norm_path, dtype=np.float32, mode="r+", shape=(capacity,))
+        return matrix, norms
+
+    def _load(self) -> None:
+        self._gen = int(self._info("generation") or 0)
+        # Files from an interrupted compaction (or a finished one) are stale.
+        keep = {p.name for p in self._files(self._gen)}
+        for p in self._dir.glob("*.bin"):
+            if p.name not in keep:
+                p.unlink()
+
+        rows = self._db.execute("SELECT id, source, doc_id, deleted FROM chunks ORDER BY pos").fetchall()
+        count = len(rows)
+        vec_path, _ = self._files(self._gen)
+        on_disk = vec_path.stat().st_size // (self._dtype.itemsize * self._dim) if vec_path.exists() else 0
+        self._matrix, self._norms = self._map(self._gen, max(_MIN_CAPACITY, on_disk, count))
+
+        self._count = count
+        self._ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=count)
+        self._alive = np.fromiter((not r[3] for r in rows), dtype=bool, count=count)
+        self._by_source: dict[str, list[int]] = {}
+        self._by_doc: dict[str, list[int]] = {}
+        for pos, r in enumerate(rows):
+            self._by_source.setdefault(r[1], []).append(pos)
+            if r[2] is not None:
+                self._by_doc.setdefault(r[2], []).append(pos)
+        self._masks: dict[tuple[str, str], np.ndarray] = {}
+        row = self._db.execute("SELECT max(id) FROM chunks").fetchone()
+        self._next_id = (row[0] or 0) + 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._matrix.flush()
+            self._norms.flush()
+            with self._db_lock:
+                self._db.close()
+
+    # -- introspection -----------------------------------------------------
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "rows": self._count,
+                "live_rows": int(self._alive.sum()),
+                "capacity": self._matrix.shape[0],
+                "dim": self._dim,
+                "dtype": self._dtype.name,
+                "generation": self._gen,
+            }
+
+    def list_docs(
+        self,
+        *,
+        limit: int,
+        cursor: int | None = None,
+        source: str | None = None,
+        prefix: str | None = None,
+    ) -> list[dict]:
+        """
+        Up to `limit` documents with live chunks, most recently written first,
+        with the catalog fields of Postgres' kb_documents (no timestamps).
+        "id" is the keyset cursor: pass the last one back as `cursor`.
+        """
+        filters, params = "", []
+        if source:
+            filters += " AND source = ?"
+            params.append(source)
+        if prefix:
+            filters += " AND substr(doc_id, 1, ?) = ?"
+            params += [len(prefix), prefix]
+        having = ""
+        if cursor is not None:
+            having = " HAVING max(id) < ?"
+            params.append(cursor)
+        with self._db_lock:
+            rows = self._db.execute(
+                f"""
+                SELECT max(id), source, doc_id, count(*), sum(length(CAST(content AS BLOB))),
+                       CASE WHEN min(embedding_model) = max(embedding_model) THEN min(embedding_model) END
+                FROM chunks
+                WHERE deleted = 0{filters}
+                GROUP BY source, doc_id{having}
+                ORDER BY max(id) DESC
+                LIMIT ?
+                """,
+                [*params, limit],
+            ).fetchall()
+            docs = []
+            for id_, src, doc_id, chunks, size, model in rows:
+                hashes = self._db.execute(
+                    "SELECT content_hash FROM chunks WHERE source = ? AND doc_id IS ? AND deleted = 0 "
+                    "ORDER BY chunk_index",
+                    (src, doc_id),
+                ).fetchall()
+                # Same as Postgres: sha256 of the chunk hashes in order.
+                doc_hash = hashlib.sha256("".join(h or "" for (h,) in hashes).encode("utf-8")).hexdigest()
+                docs.append(
+                    {
+                        "id": id_,
+                        "source": src,
+                        "doc_id": doc_id,
+                        "chunks": chunks,
+                        "bytes": size,
+                        "content_hash": doc_hash,
+                        "embedding_model": model,
+                    }
+                )
+        return docs
+
+    def doc_chunks(
+        self,
+        *,
+        source: str,
+        doc_id: str | None,
+        index_range: tuple[int, int] | None = None,
+    ) -> dict[int, tuple[int, str | None, str | None]]:
+        """
+        chunk_index -> (id, content_hash, embedding_model) for the live chunks
+        of one document, optionally only those with chunk_index in [lo, hi].
+        """
+        lo, hi = index_range or (-(2**63), 2**63 - 1)
+        with self._db_lock:
+            rows = self._db.execute(
+                """
+                SELECT chunk_index, id, content_hash, embedding_model FROM chunks
+                WHERE deleted = 0 AND source = ? AND doc_id IS ? AND chunk_index BETWEEN ? AND ?
+                """,
+                (source, doc_id, lo, hi),
+            ).fetchall()
+        return {r[0]: (r[1], r[2], r[3]) for r in rows}
+
+    def live_count(self, ids: Sequence[int]) -> int:
+        """How many of `ids` are live (not deleted or replaced) chunks."""
+        ids_arr, alive, count = self._ids, self._alive, self._count
+        mask = np.isin(ids_arr[:count], np.asarray(ids, dtype=np.int64))
+        return int(np.count_nonzero(mask & alive[:count]))
+
+    def vectors_by_hash(self, hashes: Sequence[str], *, model: str) -> dict[str, np.ndarray]:
+        """Stored float32 embeddings of live chunks with these content hashes (one per hash)."""
+        hashes = list(dict.fromkeys(hashes))
+        found: dict[str, np.ndarray] = {}
+        # The writer lock keeps positions stable (compaction moves rows).
+        with self._lock:
+            for i in range(0, len(hashes), 500):  # SQLite bound-parameter limit
+                batch = hashes[i : i + 500]
+                with self._db_lock:
+                    rows = self._db.execute(
+                        f"""
+                        SELECT content_hash, pos FROM chunks
+                        WHERE deleted = 0 AND embedding_model = ?
+                          AND content_hash IN ({",".join("?" * len(batch))})
+                        """,
+                        (model, *batch),
+                    ).fetchall()
+                for h, pos in rows:
+                    if h not in found:
+                        found[h] = np.asarray(self._matrix[pos], dtype=np.float32)
+        return found
+
+    def vectors_by_id(self, ids: Sequence[int]) -> dict[int, np.ndarray]:
+        """Stored float32 embeddings of the live chunks among `ids`."""
+        wanted = np.asarray(ids, dtype=np.int64)
+        with self._lock:
+            count = self._count
+            pos = np.flatnonzero(np.isin(self._ids[:count], wanted) & self._alive[:count])
+            vectors = np.asarray(self._matrix[pos], dtype=np.float32)
+            return dict(zip(self._ids[pos].tolist(), vectors))
+
+    # -- writes ------------------------------------------------------------
+
+    def add(
+        self,
+        *,
+        source: str,
+        doc_id: str | None,
+        chunks: Sequence[tuple[int, str]],
+        vectors: np.ndarray,
+        metadata: dict[str, Any] | None = None,
+        content_hashes: Sequence[str] | None = None,
+        embedding_model: str | None = None,
+        replace_ids: Sequence[int] = (),
+    ) -> list[int]:
+        """
+        Append chunks (chunk_index, content) with their embeddings; returns new ids.
+
+        Rows in `replace_ids` (older versions of the chunks, or chunks gone
+        from the document) are tombstoned in the same SQLite transaction.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(chunks), self._dim):
+            raise ValueError(f"Expected vectors of shape ({len(chunks)}, {self._dim}), got {vectors.shape}")
+        if content_hashes is not None and len(content_hashes) != len(chunks):
+            raise ValueError("content_hashes must have one entry per chunk")
+        if not chunks and not replace_ids:
+            return []
+        hashes = content_hashes if content_hashes is not None else [None] * len(chunks)
+
+        with self._lock:
+            start, end = self._count, self._count + len(chunks)
+            if end > self._matrix.shape[0]:
+                self._matrix.flush()
+                self._norms.flush()
+                self._matrix, self._norms = self._map(self._gen, max(end, 2 * self._matrix.shape[0]))
+
+            # Vectors first: rows past the committed count are ignored on load.
+            self._matrix[start:end] = vectors
+            self._norms[start:end] = np.linalg.norm(vectors, axis=1)
+            self._matrix.flush()
+            self._norms.flush()
+
+            ids = list(range(self._next_id, self._next_id + len(chunks)))
+            meta = json.dumps(metadata or {})
+            with self._db_lock:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        """
+                        INSERT INTO chunks
+                            (id, pos, source, doc_id, chunk_index, content, metadata, content_hash, embedding_model)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        [
+                            (id_, start + i, source, doc_id, chunk_index, content, meta, h, embedding_model)
+                            for i, (id_, (chunk_index, content), h) in enumerate(zip(ids, chunks, hashes))
+                        ],
+                    )
+                    self._db.executemany(
+                        "UPDATE chunks SET deleted = 1 WHERE id = ?", [(int(i),) for i in replace_ids]
+                    )
+
+            # Readers take snapshots of these arrays, so replace, don't mutate.
+            self._ids = np.concatenate([self._ids[:start], np.asarray(ids, dtype=np.int64)])
+            alive = np.concatenate([self._alive[:start], np.ones(len(chunks), dtype=bool)])
+            if len(replace_ids):
+                alive[np.isin(self._ids, np.asarray(replace_ids, dtype=np.int64))] = False
+            self._alive = alive
+            new_rows = list(range(start, end))
+            self._by_source.setdefault(source, []).extend(new_rows)
+            if doc_id is not None:
+                self._by_doc.setdefault(doc_id, []).extend(new_rows)
+            self._masks = {}
+            self._count = end
+            self._next_id += len(chunks)
+            if len(replace_ids):
+                self._maybe_compact()
+            return ids
+
+    def delete(self, *, doc_id: str | None = None, source: str | None = None) -> int:
+        """Tombstone every chunk matching the filters; compacts past COMPACT_RATIO."""
+        if doc_id is None and source is None:
+            raise ValueError("delete needs doc_id and/or source")
+        with self._lock:
+            rows = self._candidates(doc_id, source, self._alive, self._count)
+            if rows is None or not len(rows):
+                return 0
+            with self._db_lock:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.executemany(
+                        "UPDATE chunks SET deleted = 1 WHERE id = ?",
+                        [(int(i),) for i in self._ids[rows]],
+                    )
+            alive = self._alive.copy()
+            alive[rows] = False
+            self._alive = alive
+            self._maybe_compact()
+            return len(rows)
+
+    def _maybe_compact(self) -> None:
+        dead = self._count - int(self._alive.sum())
+        if self._count and dead / self._count >= self._compact_ratio:
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the matrix without tombstoned rows (new generation)."""
+        with self._lock:
+            keep = np.flatnonzero(self._alive[: self._count])
+            gen = self._gen + 1
+            matrix, norms = self._map(gen, max(_MIN_CAPACITY, len(keep)))
+            block = self._block_rows()
+            for i in range(0, len(keep), block):
+                sel = keep[i : i + block]
+                matrix[i : i + len(sel)] = self._matrix[sel]
+                norms[i : i + len(sel)] = self._norms[sel]
+            matrix.flush()
+            norms.flush()
+
+            with self._db_lock:
+                with self._db:
+                    self._db.execute("BEGIN")
+                    self._db.execute("DELETE FROM chunks WHERE deleted = 1")
+                    self._db.executemany(
+                        "UPDATE chunks SET pos = ? WHERE id = ?",
+                        [(new, int(id_)) for new, id_ in enumerate(self._ids[keep])],
+                    )
+                    self._db.execute("UPDATE info SET value = ? WHERE key = 'generation'", (str(gen),))
+
+            old = self._files(self._gen)
+            self._gen = gen
+            # Live searches keep their own mapping of the old files (POSIX).
+            self._load()
+            for p in old:
+                p.unlink(missing_ok=True)
+
+    # -- search ------------------------------------------------------------
+
+    def _block_rows(self) -> int:
+        return max(1024, _BLOCK_BYTES // (self._dim * 4))
+
+    def _rows_for(self, key: str, value: str) -> np.ndarray:
+        mask = self._masks.get((key, value))
+        if mask is None:
+            index = self._by_source if key == "source" else self._by_doc
+            mask = np.asarray(index.get(value, ()), dtype=np.int64)
+            self._masks[(key, value)] = mask
+        return mask
+
+    def _candidates(self, doc_id: str | None, source: str | None, alive: np.ndarray, count: int) -> np.ndarray | None:
+        """Row positions passing the filters, or None for "every row"."""
+        rows = None
+        if source:
+            rows = self._rows_for("source", source)
+        if doc_id:
+            by_doc = self._rows_for("doc_id", doc_id)
+            rows = by_doc if rows is None else np.intersect1d(rows, by_doc, assume_unique=True)
+        if rows is None:
+            return None if alive[:count].all() else np.flatnonzero(alive[:count])
+        rows = rows[rows < count]
+        return rows[alive[rows]]
+
+    def _scores(self, q: np.ndarray, qn: np.ndarray, block: np.ndarray, norms: np.ndarray) -> np.ndarray:
+        """Ranking key per (query, row); lower is better, monotonic in the distance."""
+        dots = q @ block.astype(np.float32, copy=False).T
+        if self._metric == "ip":
+            return -dots
+        if self._metric == "cosine":
+            denom = qn[:, None] * norms[None, :]
+            return 1.0 - np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+        # ||q - x||^2 without the per-query constant ||q||^2.
+        return norms[None, :] ** 2 - 2.0 * dots
+
+    def search(
+        self,
+        queries: np.ndarray,
+        *,
+        top_k: int,
+        doc_id: str | None = None,
+        source: str | None = None,
+    ) -> list[list[Row]]:
+        """
+        Exact top_k for each query vector (one row of `queries`, or a single
+        vector). Returns one list of rows per query, best first.
+        """
+        q = np.asarray(queries, dtype=np.float32)
+        if q.ndim == 1:
+            q = q[None, :]
+        if q.shape[1] != self._dim:
+            raise ValueError(f"Expected query dim {self._dim}, got {q.shape[1]}")
+        qn = np.linalg.norm(q, axis=1)
+
+        # Snapshot under the lock; the GEMMs run without it.
+        with self._lock:
+            matrix, norms, ids, count = self._matrix, self._norms, self._ids, self._count
+            rows = self._candidates(doc_id, source, self._alive, count)
+
+        total = count if rows is None else len(rows)
+        k = min(top_k, total)
+        if k == 0:
+            return [[] for _ in range(len(q))]
+
+        best_keys = np.full((len(q), 0), np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(q), 0), dtype=np.int64)
+        step = self._block_rows()
+        for i in range(0, total, step):
+            if rows is None:
+                j = min(i + step, total)
+                pos = np.arange(i, j)
+                keys = self._scores(q, qn, matrix[i:j], norms[i:j])
+            else:
+                pos = rows[i : i + step]
+                keys = self._scores(q, qn, matrix[pos], norms[pos])
+            keys = np.concatenate([best_keys, keys], axis=1)
+            cand = np.concatenate([best_rows, np.broadcast_to(pos, (len(q), len(pos)))], axis=1)
+            if keys.shape[1] > k:
+                part = np.argpartition(keys, k - 1, axis=1)[:, :k]
+                keys = np.take_along_axis(keys, part, axis=1)
+                cand = np.take_along_axis(cand, part, axis=1)
+            best_keys, best_rows = keys, cand
+
+        order = np.argsort(best_keys, axis=1)
+        best_keys = np.take_along_axis(best_keys, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        if self._metric == "l2":
+            best_keys = np.sqrt(np.maximum(best_keys + (qn**2)[:, None], 0.0))
+
+        return self._fetch(ids[best_rows], best_keys)
+
+    def lexical_search(
+        self,
+        query: str,
+        *,
+        top_k: int,
+        doc_id: str | None = None,
+        source: str | None = None,
+    ) -> list[Row]:
+        """
+        Full-text top_k for `query`: chunks containing all of its words
+        (stemmed), ranked by BM25. Scores are higher-is-better.
+        """
+        words = _WORD.findall(query)
+        if not words:
+            return []
+        filters, params = "", []
+        if source:
+            filters += " AND c.source = ?"
+            params.append(source)
+        if doc_id:
+            filters += " AND c.doc_id = ?"
+            params.append(doc_id)
+        # Quoted words: user input never reaches the FTS5 query syntax.
+        match = " ".join('"' + w.replace('"', '""') + '"' for w in words)
+        with self._db_lock:
+            rows = self._db.execute(
+                f"""
+                SELECT c.id, c.source, c.doc_id, c.chunk_index, c.content, -bm25(chunks_fts) AS score
+                FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid
+                WHERE chunks_fts MATCH ? AND c.deleted = 0{filters}
+                ORDER BY bm25(chunks_fts)
+                LIMIT ?
+                """,
+                (match, *params, top_k),
+            ).fetchall()
+        return [tuple(r) for r in rows]
+
+    def _fetch(self, hit_ids: np.ndarray, scores: np.ndarray) -> list[list[Row]]:
+        wanted = sorted({int(i) for i in hit_ids.ravel()})
+        with self._db_lock:
+            found = {
+                r[0]: r
+                for r in self._db.execute(
+                    f"SELECT id, source, doc_id, chunk_index, content FROM chunks WHERE id IN ({','.join('?' * len(wanted))})",
+                    wanted,
+                )
+            }
+        return [
+            [(*found[int(i)], float(s)) for i, s in zip(qi, qs) if int(i) in found]
+            for qi, qs in zip(hit_ids, scores)
+        ]
+
+
+_index: NumpyVectorIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_numpy_index() -> NumpyVectorIndex:
+    """Process-wide index opened from settings (mmap, so cheap at startup)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = NumpyVectorIndex(
+                settings.numpy_index_dir,
+                dim=settings.embed_dim,
+                dtype=settings.numpy_index_dtype,
+                metric=settings.vector_metric,
+                compact_ratio=settings.numpy_index_compact_ratio,
+            )
+        return _index
+
+
+def close_numpy_index() -> None:
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+            _index = None
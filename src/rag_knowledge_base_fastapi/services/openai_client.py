@@ -0,0 +1,402 @@
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timezone
+from typing import Awaitable, Callable, Literal, TypeVar
+
+import httpx
+from openai import (
+    APIConnectionError,
+    AsyncOpenAI,
+    InternalServerError,
+    OpenAI,
+    RateLimitError,
+)
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+T = TypeVar("T")
+
+# "interactive" serves /search and /chat; "bulk" serves ingestion. Bulk work
+# may only use part of the shared concurrency budget and always yields to
+# waiting interactive calls.
+Lane = Literal["interactive", "bulk"]
+
+_RETRYABLE = (RateLimitError, APIConnectionError, InternalServerError)
+
+
+class UpstreamUnavailableError(RuntimeError):
+    """
+    The upstream API stayed rate-limited/unavailable for the whole deadline.
+
+    Surfaced by the API as 503 with a Retry-After hint instead of a 500.
+    """
+
+    def __init__(self, message: str, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class LimiterStats:
+    limit: float
+    in_flight_interactive: int
+    in_flight_bulk: int
+    waiting_interactive: int
+    waiting_bulk: int
+    paused_for_seconds: float
+    rate_limited: int
+    retries: int
+    deadline_exceeded: int
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD concurrency limiter shared by all OpenAI calls in the process.
+
+    - Each success grows the limit by roughly one slot per "window" of
+      calls (additive increase); a 429 halves it (multiplicative decrease),
+      at most once per `decrease_cooldown` seconds so one burst of 429s
+      only counts once.
+    - A Retry-After hint pauses all new calls until it has elapsed.
+    - The bulk lane is capped at `bulk_share` of the limit and never takes a
+      slot while interactive callers are waiting.
+
+    Sync callers block on a condition variable; async callers poll with
+    short sleeps so the event loop is never blocked.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        bulk_share: float,
+        decrease_cooldown: float = 1.0,
+    ) -> None:
+        self._min = max(1, minimum)
+        self._max = max(self._min, maximum)
+        self._limit = float(min(max(initial, self._min), self._max))
+        self._bulk_share = min(max(bulk_share, 0.0), 1.0)
+        self._decrease_cooldown = decrease_cooldown
+
+        self._cond = threading.Condition()
+        self._in_flight: dict[str, int] = {"interactive": 0, "bulk": 0}
+        self._waiting: dict[str, int] = {"interactive": 0, "bulk": 0}
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+
+        self.rate_limited = 0
+        self.retries = 0
+        self.deadline_exceeded = 0
+
+    def _can_acquire(self, lane: Lane, now: float) -> bool:
+        if now < self._paused_until:
+            return False
+        limit = int(self._limit)
+        total = self._in_flight["interactive"] + self._in_flight["bulk"]
+        if total >= limit:
+            return False
+        if lane == "bulk":
+            if self._waiting["interactive"]:
+                return False
+            return self._in_flight["bulk"] < max(1, int(limit * self._bulk_share))
+        return True
+
+    def try_acquire(self, lane: Lane) -> bool:
+        with self._cond:
+            if self._can_acquire(lane, time.monotonic()):
+                self._in_flight[lane] += 1
+                return True
+            return False
+
+    def acquire(self, lane: Lane, deadline: float) -> bool:
+        """Block until a slot is free or `deadline` (monotonic) passes."""
+        with self._cond:
+            self._waiting[lane] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._can_acquire(lane, now):
+                        self._in_flight[lane] += 1
+                        return True
+                    if now >= deadline:
+                        return False
+                    wait = deadline - now
+                    if now < self._paused_until:
+                        wait = min(wait, self._paused_until - now)
+                    self._cond.wait(timeout=wait)
+            finally:
+                self._waiting[lane] -= 1
+
+    async def acquire_async(self, lane: Lane, deadline: float) -> bool:
+        with self._cond:
+            self._waiting[lane] += 1
+        try:
+            delay = 0.002
+            while True:
+                if self.try_acquire(lane):
+                    return True
+                now = time.monotonic()
+                if now >= deadline:
+                    return False
+                await asyncio.sleep(min(delay, deadline - now))
+                delay = min(delay * 2, 0.05)
+        finally:
+            with self._cond:
+                self._waiting[lane] -= 1
+
+    def release(self, lane: Lane) -> None:
+        with self._cond:
+            self._in_flight[lane] -= 1
+            self._cond.notify_all()
+
+    def on_success(self) -> None:
+        with self._cond:
+            self._limit = min(self._max, self._limit + 1.0 / self._limit)
+            self._cond.notify_all()
+
+    def on_rate_limited(self, retry_after: float | None) -> None:
+        with self._cond:
+            now = time.monotonic()
+            self.rate_limited += 1
+            if now - self._last_decrease >= self._decrease_cooldown:
+                self._limit = max(float(self._min), self._limit / 2)
+                self._last_decrease = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def on_retry(self) -> None:
+        with self._cond:
+            self.retries += 1
+
+    def on_deadline_exceeded(self) -> None:
+        with self._cond:
+            self.deadline_exceeded += 1
+
+    def stats(self) -> LimiterStats:
+        with self._cond:
+            return LimiterStats(
+                limit=self._limit,
+                in_flight_interactive=self._in_flight["interactive"],
+                in_flight_bulk=self._in_flight["bulk"],
+                waiting_interactive=self._waiting["interactive"],
+                waiting_bulk=self._waiting["bulk"],
+                paused_for_seconds=max(0.0, self._paused_until - time.monotonic()),
+                rate_limited=self.rate_limited,
+                retries=self.retries,
+                deadline_exceeded=self.deadline_exceeded,
+            )
+
+
+def _retry_after_seconds(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if (ms := headers.get("retry-after-ms")) is not None:
+        try:
+            return max(0.0, float(ms) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # An HTTP date; anything unparseable falls back to plain backoff.
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:  # "-0000": UTC without a zone
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def _backoff_delay(attempt: int, retry_after: float | None) -> float:
+    # Full jitter, but never sooner than the server asked us to wait.
+    cap = settings.openai_backoff_max_seconds
+    delay = random.uniform(0, min(cap, settings.openai_backoff_base_seconds * 2 ** attempt))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, settings.openai_backoff_base_seconds)
+    return delay
+
+
+def _deadline_for(lane: Lane, deadline_seconds: float | None) -> float:
+    if deadline_seconds is None:
+        deadline_seconds = (
+            settings.openai_bulk_deadline_seconds
+            if lane == "bulk"
+            else settings.openai_interactive_deadline_seconds
+        )
+    return time.monotonic() + deadline_seconds
+
+
+def _give_up(limiter: AdaptiveConcurrencyLimiter, what: str, retry_after: float | None) -> UpstreamUnavailableError:
+    limiter.on_deadline_exceeded()
+    return UpstreamUnavailableError(f"OpenAI API unavailable: {what}", retry_after=retry_after)
+
+
+def call_with_retries(
+    fn: Callable[[float], T],
+    *,
+    lane: Lane = "interactive",
+    deadline_seconds: float | None = None,
+) -> T:
+    """
+    Run `fn(timeout)` under the shared limiter, retrying 429/5xx/connection
+    errors with jittered backoff until the lane's deadline budget runs out.
+
+    `fn` receives the remaining budget in seconds to use as its HTTP timeout.
+    """
+    limiter = get_limiter()
+    deadline = _deadline_for(lane, deadline_seconds)
+    attempt = 0
+
+    while True:
+        if not limiter.acquire(lane, deadline):
+            raise _give_up(limiter, "concurrency limit saturated", limiter.stats().paused_for_seconds or None)
+
+        retry_after: float | None = None
+        try:
+            result = fn(max(0.001, deadline - time.monotonic()))
+        except _RETRYABLE as exc:
+            if isinstance(exc, RateLimitError):
+                retry_after = _retry_after_seconds(exc)
+                limiter.on_rate_limited(retry_after)
+            error = exc
+        else:
+            limiter.on_success()
+            return result
+        finally:
+            limiter.release(lane)
+
+        delay = _backoff_delay(attempt, retry_after)
+        if time.monotonic() + delay >= deadline:
+            raise _give_up(limiter, str(error), retry_after) from error
+        limiter.on_retry()
+        attempt += 1
+        time.sleep(delay)
+
+
+async def acall_with_retries(
+    fn: Callable[[float], Awaitable[T]],
+    *,
+    lane: Lane = "interactive",
+    deadline_seconds: float | None = None,
+) -> T:
+    """Async twin of `call_with_retries`; shares the same limiter."""
+    limiter = get_limiter()
+    deadline = _deadline_for(lane, deadline_seconds)
+    attempt = 0
+
+    while True:
+        if not await limiter.acquire_async(lane, deadline):
+            raise _give_up(limiter, "concurrency limit saturated", limiter.stats().paused_for_seconds or None)
+
+        retry_after: float | None = None
+        try:
+            result = await fn(max(0.001, deadline - time.monotonic()))
+        except _RETRYABLE as exc:
+            if isinstance(exc, RateLimitError):
+                retry_after = _retry_after_seconds(exc)
+                limiter.on_rate_limited(retry_after)
+            error = exc
+        else:
+            limiter.on_success()
+            return result
+        finally:
+            limiter.release(lane)
+
+        delay = _backoff_delay(attempt, retry_after)
+        if time.monotonic() + delay >= deadline:
+            raise _give_up(limiter, str(error), retry_after) from error
+        limiter.on_retry()
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+_lock = threading.Lock()
+_limiter: AdaptiveConcurrencyLimiter | None = None
+_client: OpenAI | None = None
+_async_client: AsyncOpenAI | None = None
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_keepalive_connections,
+        keepalive_expiry=settings.openai_keepalive_expiry_seconds,
+    )
+
+
+def get_limiter() -> AdaptiveConcurrencyLimiter:
+    global _limiter
+    with _lock:
+        if _limiter is None:
+            _limiter = AdaptiveConcurrencyLimiter(
+                initial=settings.openai_concurrency_initial,
+                minimum=settings.openai_concurrency_min,
+                maximum=settings.openai_concurrency_max,
+                bulk_share=settings.openai_bulk_lane_share,
+            )
+        return _limiter
+
+
+def get_openai_client() -> OpenAI:
+    """
+    Process-wide sync OpenAI client with a keep-alive connection pool.
+
+    SDK-level retries are disabled; `call_with_retries` owns retry policy.
+    """
+    global _client
+    if not settings.openai_api_key:
+        raise ValueError("OPENAI_API_KEY is not configured.")
+    with _lock:
+        if _client is None:
+            _client = OpenAI(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url or None,
+                timeout=settings.openai_timeout_seconds,
+                max_retries=0,
+                http_client=httpx.Client(limits=_http_limits()),
+            )
+        return _client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Process-wide async OpenAI client; see `get_openai_client`."""
+    global _async_client
+    if not settings.openai_api_key:
+        raise ValueError("OPENAI_API_KEY is not configured.")
+    with _lock:
+        if _async_client is None:
+            _async_client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                base_url=settings.openai_base_url or None,
+                timeout=settings.openai_timeout_seconds,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=_http_limits()),
+            )
+        return _async_client
+
+
+async def close_openai_clients() -> None:
+    """Close pooled HTTP connections. Called on app shutdown."""
+    global _client, _async_client
+    with _lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
@@ -1,12 +1,85 @@
 from __future__ import annotations
+import base64
 from dataclasses import dataclass
-from openai import OpenAI
+from typing import Any
+
+import numpy as np
+from openai import BadRequestError
 from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.metrics import TOKENS
+from rag_knowledge_base_fastapi.services.openai_client import (
+    Lane,
+    acall_with_retries,
+    call_with_retries,
+    get_async_openai_client,
+    get_openai_client,
+)
 
 @dataclass
 class EmbeddingResult:
     model: str
-    vector: list[float]
+    vector: np.ndarray  # float32, shape (dim,)
+
+
+def _to_vector(embedding: str | list[float]) -> np.ndarray:
+    """
+    Decode one `data[i].embedding`: a base64 string of little-endian float32
+    when we asked for encoding_format="base64", or a list of floats.
+    """
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def _estimate_tokens(text: str) -> int:
+    # Cheap upper-bound estimate (~3 chars/token) used only for request packing.
+    return len(text) // 3 + 1
+
+
+def _count_usage(resp: Any) -> None:
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        TOKENS.inc("embedding", usage.total_tokens or 0)
+
+
+def _clean_inputs(texts: list[str]) -> list[str]:
+    cleaned = [(t or "").strip() for t in texts]
+    if any(not t for t in cleaned):
+        raise ValueError("Cannot embed empty text.")
+    return cleaned
+
+
+def _pack_batches(texts: list[str], max_items: int, max_tokens: int) -> list[list[str]]:
+    """Greedily pack texts into requests bounded by item count and token estimate."""
+    batches: list[list[str]] = []
+    current: list[str] = []
+    current_tokens = 0
+
+    for t in texts:
+        tokens = _estimate_tokens(t)
+        if current and (
+            len(current) >= max_items
+            or current_tokens + tokens > max_tokens
+        ):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(t)
+        current_tokens += tokens
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _batch_results(resp, model: str, expected: int) -> list[EmbeddingResult]:
+    # The API returns one item per input with an explicit index.
+    data = sorted(resp.data, key=lambda d: d.index)
+    if len(data) != expected:
+        raise RuntimeError(
+            f"Embedding response size mismatch: expected {expected}, got {len(data)}"
+        )
+    return [EmbeddingResult(model=model, vector=_to_vector(d.embedding)) for d in data]
+
 
 class OpenAIEmbeddingsClient:
     """
@@ -15,13 +88,20 @@ class OpenAIEmbeddingsClient:
     Uses:
     - OPENAI_API_KEY
     - OPENAI_EMBED_MODEL
+    - EMBED_BATCH_MAX_ITEMS / EMBED_BATCH_MAX_TOKENS (batch packing limits)
     from settings.
+
+    `client` may be any object exposing
+    `embeddings.create(model=, input=, encoding_format=, timeout=)`;
+    it defaults to the shared process-wide OpenAI client. Calls go through the
+    shared limiter on the given `lane` ("bulk" for ingestion).
     """
-    def __init__(self) -> None:
-        if not settings.openai_api_key:
-            raise ValueError("OPENAI_API_KEY is not configured.")
-        self._client = OpenAI(api_key=settings.openai_api_key)
+    def __init__(self, client: Any | None = None, lane: Lane = "interactive") -> None:
+        self._client = client if client is not None else get_openai_client()
+        self._lane = lane
         self._model = settings.openai_embed_model
+        self._max_items = max(1, settings.embed_batch_max_items)
+        self._max_tokens = max(1, settings.embed_batch_max_tokens)
 
     @property
     def model(self) -> str:
@@ -32,9 +112,102 @@ class OpenAIEmbeddingsClient:
         if not text:
             raise ValueError("Cannot embed empty text.")
 
-        resp = self._client.embeddings.create(
-            model=self._model,
-            input=text,
+        resp = self._create(text)
+        return EmbeddingResult(model=self._model, vector=_to_vector(resp.data[0].embedding))
+
+    def embed_texts(self, texts: list[str]) -> list[EmbeddingResult]:
+        """
+        Embed many texts with as few API requests as possible.
+
+        Inputs are packed into requests bounded by item count and estimated
+        token count. Results are returned in the same order as `texts`.
+        A request rejected as too large is split in half and retried.
+        """
+        results: list[EmbeddingResult] = []
+        for batch in _pack_batches(_clean_inputs(texts), self._max_items, self._max_tokens):
+            results.extend(self._embed_batch(batch))
+        return results
+
+    def _create(self, inputs: str | list[str]):
+        resp = call_with_retries(
+            lambda timeout: self._client.embeddings.create(
+                model=self._model,
+                input=inputs,
+                # Explicit base64 makes the SDK hand us the raw string (~4x
+                # smaller than JSON floats) instead of decoding it to a list.
+                encoding_format="base64",
+                timeout=timeout,
+            ),
+            lane=self._lane,
         )
-        vector = resp.data[0].embedding
-        return EmbeddingResult(model=self._model, vector=vector)
\ No newline at end of file
+        _count_usage(resp)
+        return resp
+
+    def _embed_batch(self, batch: list[str]) -> list[EmbeddingResult]:
+        try:
+            resp = self._create(batch)
+        except BadRequestError:
+            # Most often the request exceeded the per-request token limit
+            # because our estimate was too optimistic; split and retry.
+            if len(batch) == 1:
+                raise
+            mid = len(batch) // 2
+            return self._embed_batch(batch[:mid]) + self._embed_batch(batch[mid:])
+        return _batch_results(resp, self._model, len(batch))
+
+
+class AsyncOpenAIEmbeddingsClient:
+    """
+    Async twin of OpenAIEmbeddingsClient for the request path.
+
+    Uses the shared AsyncOpenAI client and the same limiter lanes, packing
+    rules and settings.
+    """
+    def __init__(self, client: Any | None = None, lane: Lane = "interactive") -> None:
+        self._client = client if client is not None else get_async_openai_client()
+        self._lane = lane
+        self._model = settings.openai_embed_model
+        self._max_items = max(1, settings.embed_batch_max_items)
+        self._max_tokens = max(1, settings.embed_batch_max_tokens)
+
+    @property
+    def model(self) -> str:
+        return self._model
+
+    async def embed_text(self, text: str) -> EmbeddingResult:
+        text = (text or "").strip()
+        if not text:
+            raise ValueError("Cannot embed empty text.")
+
+        resp = await self._create(text)
+        return EmbeddingResult(model=self._model, vector=_to_vector(resp.data[0].embedding))
+
+    async def embed_texts(self, texts: list[str]) -> list[EmbeddingResult]:
+        """See OpenAIEmbeddingsClient.embed_texts."""
+        results: list[EmbeddingResult] = []
+        for batch in _pack_batches(_clean_inputs(texts), self._max_items, self._max_tokens):
+            results.extend(await self._embed_batch(batch))
+        return results
+
+    async def _create(self, inputs: str | list[str]):
+        resp = await acall_with_retries(
+            lambda timeout: self._client.embeddings.create(
+                model=self._model,
+                input=inputs,
+                encoding_format="base64",
+                timeout=timeout,
+            ),
+            lane=self._lane,
+        )
+        _count_usage(resp)
+        return resp
+
+    async def _embed_batch(self, batch: list[str]) -> list[EmbeddingResult]:
+        try:
+            resp = await self._create(batch)
+        except BadRequestError:
+            if len(batch) == 1:
+                raise
+            mid = len(batch) // 2
+            return await self._embed_batch(batch[:mid]) + await self._embed_batch(batch[mid:])
+        return _batch_results(resp, self._model, len(batch))
@@ -0,0 +1,269 @@
+"""
+Embedding and chat providers, selected by EMBEDDING_PROVIDER / CHAT_PROVIDER.
+
+"openai" is the real thing. "hashing" and "echo" are deterministic offline
+backends for benchmarks, load tests and local development without an API key.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import time
+import zlib
+from typing import Any, AsyncIterator, Protocol
+
+import numpy as np
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.metrics import TOKENS
+from rag_knowledge_base_fastapi.services.openai_client import (
+    Lane,
+    acall_with_retries,
+    call_with_retries,
+    get_async_openai_client,
+    get_openai_client,
+)
+from rag_knowledge_base_fastapi.services.openai_embeddings import (
+    AsyncOpenAIEmbeddingsClient,
+    EmbeddingResult,
+    OpenAIEmbeddingsClient,
+)
+
+Messages = list[dict[str, str]]
+
+
+class Embedder(Protocol):
+    @property
+    def model(self) -> str: ...
+
+    def embed_text(self, text: str) -> EmbeddingResult: ...
+
+    def embed_texts(self, texts: list[str]) -> list[EmbeddingResult]: ...
+
+
+class AsyncEmbedder(Protocol):
+    @property
+    def model(self) -> str: ...
+
+    async def embed_text(self, text: str) -> EmbeddingResult: ...
+
+    async def embed_texts(self, texts: list[str]) -> list[EmbeddingResult]: ...
+
+
+class ChatProvider(Protocol):
+    def complete(self, messages: Messages) -> str: ...
+
+    async def acomplete(self, messages: Messages) -> str: ...
+
+    def astream(self, messages: Messages) -> AsyncIterator[str]:
+        """Async generator of answer deltas; closing it cancels the upstream call."""
+        ...
+
+
+# ---------------------------------------------------------------------------
+# Offline embeddings
+# ---------------------------------------------------------------------------
+
+_WORD = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Deterministic embeddings from hashed word and character n-gram features.
+
+    Each feature is hashed (CRC32) to one of `dim` buckets with a hashed
+    sign, and the result is L2-normalized. Texts sharing words/trigrams end
+    up close together, which is enough for retrieval to behave plausibly in
+    benchmarks. Implements both the sync and async embedder interfaces.
+    """
+
+    model = "hashing-ngram-v1"
+
+    def __init__(self, dim: int | None = None, char_ngram: int = 3) -> None:
+        self._dim = dim or settings.embed_dim
+        self._n = char_ngram
+
+    def _features(self, text: str) -> list[str]:
+        words = _WORD.findall(text.lower())
+        feats = [f"w:{w}" for w in words]
+        for w in words:
+            padded = f" {w} "
+            feats.extend(f"c:{padded[i:i + self._n]}" for i in range(max(1, len(padded) - self._n + 1)))
+        return feats
+
+    def _vector(self, text: str) -> np.ndarray:
+        feats = self._features(text) or [text]
+        hashes = np.fromiter((zlib.crc32(f.encode("utf-8")) for f in feats), dtype=np.uint64, count=len(feats))
+        # Independent hash for the sign so bucket collisions tend to cancel.
+        signs = np.fromiter(
+            (zlib.crc32(f.encode("utf-8"), 0x9E3779B9) & 1 for f in feats), dtype=np.float32, count=len(feats)
+        )
+        vec = np.bincount(hashes % self._dim, weights=signs * 2 - 1, minlength=self._dim)
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).astype(np.float32)
+
+    def _embed(self, text: str) -> EmbeddingResult:
+        text = (text or "").strip()
+        if not text:
+            raise ValueError("Cannot embed empty text.")
+        return EmbeddingResult(model=self.model, vector=self._vector(text))
+
+    def embed_text(self, text: str) -> EmbeddingResult:
+        return self._embed(text)
+
+    def embed_texts(self, texts: list[str]) -> list[EmbeddingResult]:
+        return [self._embed(t) for t in texts]
+
+
+class AsyncHashingEmbedder(HashingEmbedder):
+    """Async interface over HashingEmbedder (CPU only, so it runs inline)."""
+
+    async def embed_text(self, text: str) -> EmbeddingResult:  # type: ignore[override]
+        return self._embed(text)
+
+    async def embed_texts(self, texts: list[str]) -> list[EmbeddingResult]:  # type: ignore[override]
+        return [self._embed(t) for t in texts]
+
+
+def get_embedder(lane: Lane = "interactive") -> Embedder:
+    if settings.embedding_provider == "hashing":
+        return HashingEmbedder()
+    return OpenAIEmbeddingsClient(lane=lane)
+
+
+def get_async_embedder(lane: Lane = "interactive") -> AsyncEmbedder:
+    if settings.embedding_provider == "hashing":
+        return AsyncHashingEmbedder()
+    return AsyncOpenAIEmbeddingsClient(lane=lane)
+
+
+def embedding_model() -> str:
+    """Model id of the configured embedding provider (used in cache keys)."""
+    return HashingEmbedder.model if settings.embedding_provider == "hashing" else settings.openai_embed_model
+
+
+# ---------------------------------------------------------------------------
+# Chat
+# ---------------------------------------------------------------------------
+
+
+def _chat_model() -> str:
+    # If you don't have chat model in settings yet, default here.
+    return getattr(settings, "openai_chat_model", None) or "gpt-4o-mini"
+
+
+def _count_usage(resp: Any) -> None:
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        TOKENS.inc("prompt", usage.prompt_tokens or 0)
+        TOKENS.inc("completion", usage.completion_tokens or 0)
+
+
+class OpenAIChatProvider:
+    """Chat completions through the shared OpenAI clients and limiter."""
+
+    def __init__(self, temperature: float = 0.2) -> None:
+        self._temperature = temperature
+
+    def complete(self, messages: Messages) -> str:
+        client = get_openai_client()
+        resp = call_with_retries(
+            lambda timeout: client.chat.completions.create(
+                model=_chat_model(),
+                messages=messages,
+                temperature=self._temperature,
+                timeout=timeout,
+            ),
+            lane="interactive",
+        )
+        _count_usage(resp)
+        return resp.choices[0].message.content or ""
+
+    async def acomplete(self, messages: Messages) -> str:
+        client = get_async_openai_client()
+        resp = await acall_with_retries(
+            lambda timeout: client.chat.completions.create(
+                model=_chat_model(),
+                messages=messages,
+                temperature=self._temperature,
+                timeout=timeout,
+            ),
+            lane="interactive",
+        )
+        _count_usage(resp)
+        return resp.choices[0].message.content or ""
+
+    async def astream(self, messages: Messages) -> AsyncIterator[str]:
+        client = get_async_openai_client()
+        # Retries cover opening the stream; once tokens flow a failure is final.
+        stream = await acall_with_retries(
+            lambda timeout: client.chat.completions.create(
+                model=_chat_model(),
+                messages=messages,
+                temperature=self._temperature,
+                stream=True,
+                # Adds a final chunk (no choices) with the token usage.
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            ),
+            lane="interactive",
+        )
+        try:
+            async for chunk in stream:
+                _count_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+
+
+class EchoChatProvider:
+    """
+    Canned answers with artificial latency, for offline benchmarks.
+
+    The answer echoes the user question and cites every context chunk
+    ("[1] [2] ..."), so citation handling is exercised too. `latency_ms` is
+    the total per answer: the first token arrives after `ttft_ms`, the
+    rest is spread evenly across the remaining words.
+    """
+
+    _CONTEXT_MARKER = re.compile(r"^\[(\d+)\] ", re.MULTILINE)
+
+    def __init__(self, latency_ms: float | None = None, ttft_ms: float | None = None) -> None:
+        self._latency_s = (settings.echo_chat_latency_ms if latency_ms is None else latency_ms) / 1000
+        self._ttft_s = min(self._latency_s, (settings.echo_chat_ttft_ms if ttft_ms is None else ttft_ms) / 1000)
+
+    def _answer(self, messages: Messages) -> str:
+        prompt = messages[-1]["content"] if messages else ""
+        question = prompt.rsplit("User question:\n", 1)[-1].split("\n\nAnswer:", 1)[0].strip()
+        cited = " ".join(f"[{n}]" for n in self._CONTEXT_MARKER.findall(prompt))
+        return f"Echo: {question} {cited}".strip()
+
+    def _delays(self, words: list[str]) -> list[float]:
+        rest = (self._latency_s - self._ttft_s) / max(1, len(words) - 1)
+        return [self._ttft_s] + [rest] * (len(words) - 1)
+
+    def complete(self, messages: Messages) -> str:
+        time.sleep(self._latency_s)
+        return self._answer(messages)
+
+    async def acomplete(self, messages: Messages) -> str:
+        await asyncio.sleep(self._latency_s)
+        return self._answer(messages)
+
+    async def astream(self, messages: Messages) -> AsyncIterator[str]:
+        words = self._answer(messages).split(" ")
+        for i, (word, delay) in enumerate(zip(words, self._delays(words))):
+            await asyncio.sleep(delay)
+            yield word if i == 0 else " " + word
+
+
+def chat_model() -> str:
+    """Model id of the configured chat provider (used in cache keys)."""
+    return "echo" if settings.chat_provider == "echo" else _chat_model()
+
+
+def get_chat_provider() -> ChatProvider:
+    if settings.chat_provider == "echo":
+        return EchoChatProvider()
+    return OpenAIChatProvider()
@@ -1,12 +1,33 @@
 from __future__ import annotations
 
-import json
-from dataclasses import dataclass
+import asyncio
+from dataclasses import dataclass, replace
+from typing import Literal, Sequence
 
+import numpy as np
 from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
 
-from rag_knowledge_base_fastapi.services.db import create_db_engine
-from rag_knowledge_base_fastapi.services.openai_embeddings import OpenAIEmbeddingsClient
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.db import get_async_engine, get_engine
+from rag_knowledge_base_fastapi.services.embedding_cache import (
+    aembed_queries,
+    aembed_query,
+    embed_queries,
+    embed_query,
+)
+from rag_knowledge_base_fastapi.services.metrics import timed
+from rag_knowledge_base_fastapi.services.mmr import mmr, mmr_params
+from rag_knowledge_base_fastapi.services.numpy_index import Row, get_numpy_index
+from rag_knowledge_base_fastapi.services.vector_index import (
+    aapply_search_params,
+    apply_search_params,
+    distance_operator,
+    quantized_distance,
+)
+
+
+SearchMode = Literal["vector", "lexical", "hybrid"]
 
 
 @dataclass(frozen=True)
@@ -16,75 +37,628 @@ class RetrievalHit:
     doc_id: str | None
     chunk_index: int
     content: str
-    score: float  # pgvector distance (lower is better)
+    # vector: distance for VECTOR_METRIC (lower is better); lexical: text
+    # rank, hybrid: fused RRF score (both higher is better).
+    score: float
 
 
-def _vec_literal(vec: list[float]) -> str:
-    # pgvector expects: '[0.1,0.2,...]'
-    return "[" + ",".join(map(str, vec)) + "]"
+@dataclass(frozen=True)
+class SearchQuery:
+    """One query of a batch search; the fields are the arguments of `search_chunks`."""
 
+    query: str
+    top_k: int = 5
+    doc_id: str | None = None
+    source: str | None = None
+    ef_search: int | None = None
+    probes: int | None = None
+    oversample: int | None = None
+    mode: SearchMode | None = None
+    mmr_lambda: float | None = None
+    fetch_multiplier: int | None = None
 
-def search_chunks(
-    *,
-    query: str,
-    top_k: int = 5,
-    doc_id: str | None = None,
-    source: str | None = None,
-) -> list[RetrievalHit]:
+
+def _validate(query: str, top_k: int, mode: SearchMode | None) -> tuple[str, SearchMode]:
     query = (query or "").strip()
     if not query:
         raise ValueError("query is required")
     if top_k < 1 or top_k > 20:
         raise ValueError("top_k must be between 1 and 20")
+    mode = mode or settings.search_mode
+    if mode not in ("vector", "lexical", "hybrid"):
+        raise ValueError(f"Unknown search mode: {mode!r}")
+    return query, mode
 
-    embedder = OpenAIEmbeddingsClient()
-    q = embedder.embed_text(query)
-    qvec = _vec_literal(q.vector)
-
-    engine = create_db_engine()
-
-    # Note: <-> is Euclidean distance for vector type; lower is better.
-    # We'll keep it as "score" for now.
-    base_sql = """
-        SELECT
-            id,
-            source,
-            doc_id,
-            chunk_index,
-            content,
-            (embedding <-> CAST(:qvec AS vector)) AS score
-        FROM kb_chunks
-        WHERE 1=1
-    """
-
-    params: dict[str, object] = {"qvec": qvec, "limit": top_k}
 
+def _filters(doc_id: str | None, source: str | None, params: dict[str, object]) -> str:
+    filters = ""
     if doc_id:
-        base_sql += " AND doc_id = :doc_id"
+        filters += " AND doc_id = :doc_id"
         params["doc_id"] = doc_id
-
     if source:
-        base_sql += " AND source = :source"
+        filters += " AND source = :source"
         params["source"] = source
+    return filters
 
-    base_sql += " ORDER BY embedding <-> CAST(:qvec AS vector) LIMIT :limit"
 
-    sql = text(base_sql)
+_HIT_COLUMNS = "id, source, doc_id, chunk_index, content"
 
-    hits: list[RetrievalHit] = []
-    with engine.connect() as conn:
-        rows = conn.execute(sql, params).fetchall()
 
-    for r in rows:
-        hits.append(
-            RetrievalHit(
-                id=int(r[0]),
-                source=str(r[1]),
-                doc_id=r[2],
-                chunk_index=int(r[3]),
-                content=str(r[4]),
-                score=float(r[5]),
+def _vector_sql(
+    filters: str,
+    *,
+    limit: str,
+    columns: str = _HIT_COLUMNS,
+    qvec: str = ":qvec",
+    shortlist: str = ":shortlist",
+    embeddings: bool = False,
+) -> str:
+    """`columns` + score (+ embedding) of the `limit` rows nearest to `qvec`, best first."""
+    # The operator must match the ANN index opclass (see vector_index) for the
+    # planner to use the index; every metric's operator is "lower is better".
+    # The query vector is bound once, as a binary pgvector parameter (see
+    # db._register_pgvector); ORDER BY the alias reuses the same expression.
+    op = distance_operator(settings.vector_metric)
+    embedding = ", embedding" if embeddings else ""
+    if settings.vector_quantization == "none":
+        return f"""
+            SELECT {columns}, (embedding {op} {qvec}) AS score{embedding}
+            FROM kb_chunks
+            WHERE 1=1{filters}
+            ORDER BY score LIMIT {limit}
+        """
+
+    # Two stages: the quantized index yields a shortlist, which is re-ranked
+    # by exact distance on the full-precision column (read for those rows only).
+    shortlist_order = quantized_distance(
+        settings.vector_quantization,
+        metric=settings.vector_metric,
+        dim=settings.embed_dim,
+        param=qvec,
+    )
+    return f"""
+        WITH shortlist AS (
+            SELECT {columns}, embedding
+            FROM kb_chunks
+            WHERE 1=1{filters}
+            ORDER BY {shortlist_order}
+            LIMIT {shortlist}
+        )
+        SELECT {columns}, (embedding {op} {qvec}) AS score{embedding}
+        FROM shortlist
+        ORDER BY score LIMIT {limit}
+    """
+
+
+def _lexical_sql(filters: str, *, limit: str, columns: str = _HIT_COLUMNS, query: str = ":query") -> str:
+    """`columns` + ts_rank_cd of the `limit` best full-text matches for `query` (GIN on content_tsv)."""
+    # websearch_to_tsquery accepts any user input ("quoted phrases", -not, or).
+    return f"""
+        SELECT {columns}, ts_rank_cd(content_tsv, tsq) AS score
+        FROM kb_chunks, websearch_to_tsquery(CAST(:ts_config AS regconfig), {query}) AS tsq
+        WHERE content_tsv @@ tsq{filters}
+        ORDER BY score DESC, id LIMIT {limit}
+    """
+
+
+def _hybrid_sql(
+    filters: str,
+    *,
+    limit: str,
+    qvec: str = ":qvec",
+    query: str = ":query",
+    shortlist: str = ":shortlist",
+    embeddings: bool = False,
+) -> str:
+    """Both candidate lists in one statement, fused by reciprocal rank (weight / (RRF_K + rank) per list)."""
+    vector = _vector_sql(filters, limit=":candidates", columns="id", qvec=qvec, shortlist=shortlist)
+    lexical = _lexical_sql(filters, limit=":candidates", columns="id", query=query)
+    embedding = ", c.embedding" if embeddings else ""
+    return f"""
+        WITH vector_hits AS (
+            SELECT id, row_number() OVER (ORDER BY score, id) AS rank
+            FROM ({vector}) v
+        ),
+        lexical_hits AS (
+            SELECT id, row_number() OVER (ORDER BY score DESC, id) AS rank
+            FROM ({lexical}) l
+        ),
+        fused AS (
+            SELECT id, sum(weight / (:rrf_k + rank)) AS score
+            FROM (
+                SELECT id, rank, 1.0 AS weight FROM vector_hits
+                UNION ALL
+                SELECT id, rank, CAST(:lexical_weight AS float8) AS weight FROM lexical_hits
+            ) ranked
+            GROUP BY id
+        )
+        SELECT c.id, c.source, c.doc_id, c.chunk_index, c.content, f.score{embedding}
+        FROM fused f JOIN kb_chunks c ON c.id = f.id
+        ORDER BY f.score DESC, c.id
+        LIMIT {limit}
+    """
+
+
+def _mode_sql(
+    mode: SearchMode,
+    filters: str,
+    *,
+    limit: str,
+    qvec: str = ":qvec",
+    query: str = ":query",
+    shortlist: str = ":shortlist",
+    embeddings: bool = False,
+) -> str:
+    """
+    The search statement of `mode`, reading its inputs from the given
+    parameters (or columns); `embeddings` adds each hit's vector after the
+    score (vector and hybrid modes).
+    """
+    if mode == "vector":
+        return _vector_sql(filters, limit=limit, qvec=qvec, shortlist=shortlist, embeddings=embeddings)
+    if mode == "lexical":
+        return _lexical_sql(filters, limit=limit, query=query)
+    return _hybrid_sql(filters, limit=limit, qvec=qvec, query=query, shortlist=shortlist, embeddings=embeddings)
+
+
+def _mode_params(mode: SearchMode) -> dict[str, object]:
+    """Parameters of `_mode_sql` that come from settings."""
+    params: dict[str, object] = {}
+    if mode != "vector":
+        params["ts_config"] = settings.text_search_config
+    if mode == "hybrid":
+        params.update(
+            candidates=settings.hybrid_candidates,
+            rrf_k=settings.rrf_k,
+            lexical_weight=settings.hybrid_lexical_weight,
+        )
+    return params
+
+
+def _build_search_sql(
+    qvec: np.ndarray | None,
+    *,
+    query: str,
+    mode: SearchMode,
+    top_k: int,
+    doc_id: str | None,
+    source: str | None,
+    oversample: int | None = None,
+    embeddings: bool = False,
+) -> tuple[TextClause, dict[str, object]]:
+    params: dict[str, object] = {"limit": top_k, **_mode_params(mode)}
+    filters = _filters(doc_id, source, params)
+    if mode != "lexical":
+        params["qvec"] = np.asarray(qvec, dtype=np.float32)
+        if settings.vector_quantization != "none":
+            params["shortlist"] = _shortlist_size(_vector_rows(mode, top_k), oversample)
+    if mode != "vector":
+        params["query"] = query
+    return text(_mode_sql(mode, filters, limit=":limit", embeddings=embeddings)), params
+
+
+def _shortlist_size(top_k: int, oversample: int | None) -> int:
+    return top_k * (oversample if oversample is not None else settings.rerank_oversample)
+
+
+def _search_knobs(
+    ef_search: int | None,
+    probes: int | None,
+    *,
+    rows: int,
+    oversample: int | None,
+) -> dict[str, int | str | None]:
+    """ANN settings for a query that needs the `rows` nearest vectors."""
+    ef_search = ef_search if ef_search is not None else settings.hnsw_ef_search
+    if settings.vector_quantization != "none":
+        rows = _shortlist_size(rows, oversample)
+    # An HNSW scan returns at most ef_search rows (server default 40), which
+    # would silently cap a shortlist or a hybrid candidate list.
+    if rows > (ef_search or 40):
+        ef_search = rows
+    return {
+        "ef_search": ef_search,
+        "probes": probes if probes is not None else settings.ivfflat_probes,
+        "iterative_scan": None if settings.hnsw_iterative_scan == "off" else settings.hnsw_iterative_scan,
+    }
+
+
+def _vector_rows(mode: SearchMode, top_k: int) -> int:
+    return settings.hybrid_candidates if mode == "hybrid" else top_k
+
+
+def _fuse(vector_rows: list[Row], lexical_rows: list[Row], *, top_k: int) -> list[Row]:
+    """Reciprocal rank fusion of two ranked lists (the numpy counterpart of the hybrid SQL)."""
+    scores: dict[int, float] = {}
+    rows: dict[int, Row] = {}
+    for ranked, weight in ((vector_rows, 1.0), (lexical_rows, settings.hybrid_lexical_weight)):
+        for rank, row in enumerate(ranked, start=1):
+            scores[row[0]] = scores.get(row[0], 0.0) + weight / (settings.rrf_k + rank)
+            rows[row[0]] = row
+    best = sorted(scores, key=lambda i: (-scores[i], i))[:top_k]
+    return [(*rows[i][:5], scores[i]) for i in best]
+
+
+def _fetch_rows(top_k: int, diversity: tuple[float, int] | None) -> int:
+    """Candidates a search fetches: top_k, or top_k * the fetch multiplier for MMR to pick from."""
+    return top_k * diversity[1] if diversity is not None else top_k
+
+
+def _diversify(rows, mode: SearchMode, *, top_k: int, diversity: tuple[float, int] | None) -> list:
+    """The top_k of over-fetched `rows` (embedding last) picked by MMR, without the embedding."""
+    if diversity is None:
+        return rows
+    if not rows:
+        return []
+    # MMR weighs the search's own ranking: vector rows carry a distance,
+    # hybrid rows their fused score.
+    scores = np.array([r[5] for r in rows], dtype=np.float32)
+    relevance = -scores if mode == "vector" else scores
+    picked = mmr(np.stack([r[6] for r in rows]), relevance, top_k=top_k, lambda_=diversity[0])
+    return [tuple(rows[i][:6]) for i in picked]
+
+
+def _with_vectors(rows: list[Row]) -> list[tuple]:
+    """numpy rows + their embedding (the column the SQL adds for MMR); rows deleted meanwhile drop out."""
+    vectors = get_numpy_index().vectors_by_id([r[0] for r in rows])
+    return [(*r, vectors[r[0]]) for r in rows if r[0] in vectors]
+
+
+def _numpy_search(
+    qvec: np.ndarray | None,
+    *,
+    query: str,
+    mode: SearchMode,
+    top_k: int,
+    doc_id: str | None,
+    source: str | None,
+    embeddings: bool = False,
+) -> list[Row]:
+    index = get_numpy_index()
+    if mode == "lexical":
+        return index.lexical_search(query, top_k=top_k, doc_id=doc_id, source=source)
+    vector_rows = index.search(qvec, top_k=_vector_rows(mode, top_k), doc_id=doc_id, source=source)[0]
+    if mode == "hybrid":
+        lexical_rows = index.lexical_search(query, top_k=settings.hybrid_candidates, doc_id=doc_id, source=source)
+        vector_rows = _fuse(vector_rows, lexical_rows, top_k=top_k)
+    return _with_vectors(vector_rows) if embeddings else vector_rows
+
+
+def _rows_to_hits(rows) -> list[RetrievalHit]:
+    return [
+        RetrievalHit(
+            id=int(r[0]),
+            source=str(r[1]),
+            doc_id=r[2],
+            chunk_index=int(r[3]),
+            content=str(r[4]),
+            score=float(r[5]),
+        )
+        for r in rows
+    ]
+
+
+def search_chunks(
+    *,
+    query: str,
+    top_k: int = 5,
+    doc_id: str | None = None,
+    source: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    oversample: int | None = None,
+    mode: SearchMode | None = None,
+    mmr_lambda: float | None = None,
+    fetch_multiplier: int | None = None,
+) -> list[RetrievalHit]:
+    """
+    Return the top_k chunks for `query`.
+
+    `mode` (default SEARCH_MODE) picks vector search, full-text search
+    (no embedding call) or both fused by reciprocal rank ("hybrid").
+
+    ef_search / probes override the HNSW / IVFFlat search breadth for this
+    query only (falling back to HNSW_EF_SEARCH / IVFFLAT_PROBES). With
+    VECTOR_QUANTIZATION set, `oversample` (default RERANK_OVERSAMPLE) sizes
+    the shortlist re-ranked at full precision. All three are ignored by the
+    exact numpy backend.
+
+    A `fetch_multiplier` above 1 (default MMR_FETCH_MULTIPLIER) diversifies
+    a vector or hybrid search: top_k * fetch_multiplier candidates come back
+    with their embeddings, and the top_k picked by maximal marginal
+    relevance (`mmr_lambda`, default MMR_LAMBDA) are returned in pick order
+    with their original scores.
+    """
+    query, mode = _validate(query, top_k, mode)
+    diversity = mmr_params(mode, mmr_lambda, fetch_multiplier)
+    fetch = _fetch_rows(top_k, diversity)
+    qvec = embed_query(query) if mode != "lexical" else None
+
+    if settings.retrieval_backend == "numpy":
+        with timed("db_query"):
+            rows = _numpy_search(
+                qvec, query=query, mode=mode, top_k=fetch, doc_id=doc_id, source=source, embeddings=bool(diversity)
             )
+    else:
+        sql, params = _build_search_sql(
+            qvec,
+            query=query,
+            mode=mode,
+            top_k=fetch,
+            doc_id=doc_id,
+            source=source,
+            oversample=oversample,
+            embeddings=bool(diversity),
         )
+        with get_engine().connect() as conn:
+            if mode != "lexical":
+                # The connection's implicit transaction scopes these SET LOCALs.
+                knobs = _search_knobs(ef_search, probes, rows=_vector_rows(mode, fetch), oversample=oversample)
+                apply_search_params(conn, **knobs)
+            with timed("db_query"):
+                rows = conn.execute(sql, params).fetchall()
+
+    if diversity is not None:
+        with timed("mmr"):
+            rows = _diversify(rows, mode, top_k=top_k, diversity=diversity)
+    return _rows_to_hits(rows)
+
+
+async def asearch_chunks(
+    *,
+    query: str,
+    top_k: int = 5,
+    doc_id: str | None = None,
+    source: str | None = None,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    oversample: int | None = None,
+    mode: SearchMode | None = None,
+    mmr_lambda: float | None = None,
+    fetch_multiplier: int | None = None,
+) -> list[RetrievalHit]:
+    """Async variant of `search_chunks` (async embedding client + async engine)."""
+    query, mode = _validate(query, top_k, mode)
+    diversity = mmr_params(mode, mmr_lambda, fetch_multiplier)
+    fetch = _fetch_rows(top_k, diversity)
+    qvec = await aembed_query(query) if mode != "lexical" else None
+
+    if settings.retrieval_backend == "numpy":
+        # NumPy releases the GIL in the GEMM, so a worker thread keeps the loop free.
+        with timed("db_query"):
+            rows = await asyncio.to_thread(
+                _numpy_search,
+                qvec,
+                query=query,
+                mode=mode,
+                top_k=fetch,
+                doc_id=doc_id,
+                source=source,
+                embeddings=bool(diversity),
+            )
+    else:
+        sql, params = _build_search_sql(
+            qvec,
+            query=query,
+            mode=mode,
+            top_k=fetch,
+            doc_id=doc_id,
+            source=source,
+            oversample=oversample,
+            embeddings=bool(diversity),
+        )
+        async with get_async_engine().connect() as conn:
+            if mode != "lexical":
+                knobs = _search_knobs(ef_search, probes, rows=_vector_rows(mode, fetch), oversample=oversample)
+                await aapply_search_params(conn, **knobs)
+            with timed("db_query"):
+                rows = (await conn.execute(sql, params)).fetchall()
+
+    if diversity is not None:
+        # Same as the numpy search: the candidate similarity GEMM runs off the loop.
+        with timed("mmr"):
+            rows = await asyncio.to_thread(_diversify, rows, mode, top_k=top_k, diversity=diversity)
+    return _rows_to_hits(rows)
+
+
+def _validate_batch(queries: Sequence[SearchQuery]) -> list[SearchQuery]:
+    validated = []
+    for q in queries:
+        query, mode = _validate(q.query, q.top_k, q.mode)
+        mmr_params(mode, q.mmr_lambda, q.fetch_multiplier)
+        validated.append(replace(q, query=query, mode=mode))
+    return validated
+
+
+def _diversity(q: SearchQuery) -> tuple[float, int] | None:
+    return mmr_params(q.mode, q.mmr_lambda, q.fetch_multiplier)
+
+
+def _embedded_positions(queries: list[SearchQuery]) -> list[int]:
+    return [i for i, q in enumerate(queries) if q.mode != "lexical"]
+
+
+def _batch_groups(queries: list[SearchQuery]) -> dict[tuple, list[int]]:
+    """
+    Positions of the queries that can run as one statement: same mode,
+    same filter columns, same ANN settings (SET LOCAL is per transaction,
+    not per row) and whether embeddings are fetched for MMR.
+    """
+    groups: dict[tuple, list[int]] = {}
+    for i, q in enumerate(queries):
+        diversity = _diversity(q)
+        knobs = None
+        if q.mode != "lexical":
+            rows = _vector_rows(q.mode, _fetch_rows(q.top_k, diversity))
+            knobs = tuple(_search_knobs(q.ef_search, q.probes, rows=rows, oversample=q.oversample).items())
+        groups.setdefault((q.mode, bool(q.doc_id), bool(q.source), diversity is not None, knobs), []).append(i)
+    return groups
+
+
+def _build_batch_sql(
+    queries: list[SearchQuery],
+    qvecs: list[np.ndarray | None],
+    group: list[int],
+    *,
+    mode: SearchMode,
+    embeddings: bool = False,
+) -> tuple[TextClause, dict[str, object]]:
+    """
+    The single-query statement of `mode`, LATERAL-joined to one row per
+    query in `group` (its inputs unnested from array parameters), so every
+    query keeps its own filters, LIMIT and index scan.
+    """
+    members = [queries[i] for i in group]
+    fetch = [_fetch_rows(q.top_k, _diversity(q)) for q in members]
+    arrays: dict[str, tuple[str, list]] = {
+        "ord": ("int", list(group)),
+        "lim": ("int", fetch),
+    }
+    filters = ""
+    if members[0].doc_id:
+        arrays["doc_id"] = ("text", [q.doc_id for q in members])
+        filters += " AND doc_id = q.doc_id"
+    if members[0].source:
+        arrays["source"] = ("text", [q.source for q in members])
+        filters += " AND source = q.source"
+    if mode != "lexical":
+        # pgvector registers vector[] too, so a list of arrays binds as one parameter.
+        arrays["qvec"] = ("vector", [np.asarray(qvecs[i], dtype=np.float32) for i in group])
+        if settings.vector_quantization != "none":
+            shortlists = [_shortlist_size(_vector_rows(mode, n), q.oversample) for q, n in zip(members, fetch)]
+            arrays["shortlist"] = ("int", shortlists)
+    if mode != "vector":
+        arrays["query"] = ("text", [q.query for q in members])
+
+    inner = _mode_sql(
+        mode,
+        filters,
+        limit="q.lim",
+        qvec="q.qvec",
+        query="q.query",
+        shortlist="q.shortlist",
+        embeddings=embeddings,
+    )
+    unnest = ", ".join(f"CAST(:{name} AS {type_}[])" for name, (type_, _) in arrays.items())
+    order = "h.score" if mode == "vector" else "h.score DESC, h.id"
+    embedding = ", h.embedding" if embeddings else ""
+    sql = f"""
+        SELECT q.ord, h.id, h.source, h.doc_id, h.chunk_index, h.content, h.score{embedding}
+        FROM unnest({unnest}) AS q({", ".join(arrays)})
+        CROSS JOIN LATERAL ({inner}) h
+        ORDER BY q.ord, {order}
+    """
+    params = {name: values for name, (_, values) in arrays.items()}
+    params.update(_mode_params(mode))
+    return text(sql), params
+
+
+def _split_rows(rows, results: list[list]) -> None:
+    """Distribute (ord, *hit) rows to `results[ord]`, keeping their order."""
+    by_ord: dict[int, list] = {}
+    for r in rows:
+        by_ord.setdefault(int(r[0]), []).append(r[1:])
+    for i, hit_rows in by_ord.items():
+        results[i] = hit_rows
+
+
+def _diversify_batch(queries: list[SearchQuery], results: list[list]) -> list[list]:
+    """`_diversify` for each query of a batch (a no-op for the ones without MMR)."""
+    return [_diversify(rows, q.mode, top_k=q.top_k, diversity=_diversity(q)) for q, rows in zip(queries, results)]
+
+
+def _numpy_search_many(queries: list[SearchQuery], qvecs: list[np.ndarray | None]) -> list[list[Row]]:
+    """`_numpy_search` for a batch: one GEMM for the query vectors sharing a filter."""
+    index = get_numpy_index()
+    results: list[list[Row]] = [[] for _ in queries]
+    by_filter: dict[tuple[str | None, str | None], list[int]] = {}
+    for i, q in enumerate(queries):
+        if q.mode == "lexical":
+            results[i] = index.lexical_search(q.query, top_k=q.top_k, doc_id=q.doc_id, source=q.source)
+        else:
+            by_filter.setdefault((q.doc_id or None, q.source or None), []).append(i)
+
+    for (doc_id, source), group in by_filter.items():
+        fetch = [_fetch_rows(queries[i].top_k, _diversity(queries[i])) for i in group]
+        rows = [_vector_rows(queries[i].mode, n) for i, n in zip(group, fetch)]
+        stacked = np.stack([qvecs[i] for i in group])
+        found = index.search(stacked, top_k=max(rows), doc_id=doc_id, source=source)
+        for i, n, k, vector_rows in zip(group, rows, fetch, found):
+            q, vector_rows = queries[i], vector_rows[:n]
+            if q.mode == "hybrid":
+                lexical_rows = index.lexical_search(
+                    q.query, top_k=settings.hybrid_candidates, doc_id=doc_id, source=source
+                )
+                vector_rows = _fuse(vector_rows, lexical_rows, top_k=k)
+            results[i] = _with_vectors(vector_rows) if _diversity(q) else vector_rows
+    return results
+
+
+def search_chunks_batch(queries: Sequence[SearchQuery]) -> list[list[RetrievalHit]]:
+    """
+    `search_chunks` for many queries at once, with the same hits as one
+    call per query.
+
+    The queries that need an embedding are embedded together (uncached ones
+    in as few requests as EMBED_BATCH_* allow). Queries sharing a mode,
+    filter columns and ANN settings then run as one statement, each in its
+    own transaction on one connection; the numpy backend scores them with
+    one GEMM.
+    """
+    queries = _validate_batch(queries)
+    qvecs: list[np.ndarray | None] = [None] * len(queries)
+    positions = _embedded_positions(queries)
+    if positions:
+        for i, qvec in zip(positions, embed_queries([queries[i].query for i in positions])):
+            qvecs[i] = qvec
+
+    results: list[list] = [[] for _ in queries]
+    if settings.retrieval_backend == "numpy":
+        with timed("db_query"):
+            results = _numpy_search_many(queries, qvecs)
+    elif queries:
+        with get_engine().connect() as conn:
+            for (mode, _, _, embeddings, knobs), group in _batch_groups(queries).items():
+                # One transaction per group: SET LOCAL lasts until it ends, and a
+                # group that leaves a knob unset must get the server default, not
+                # the previous group's value.
+                with conn.begin():
+                    if knobs is not None:
+                        apply_search_params(conn, **dict(knobs))
+                    sql, params = _build_batch_sql(queries, qvecs, group, mode=mode, embeddings=embeddings)
+                    with timed("db_query"):
+                        _split_rows(conn.execute(sql, params).fetchall(), results)
+
+    if any(_diversity(q) for q in queries):
+        with timed("mmr"):
+            results = _diversify_batch(queries, results)
+    return [_rows_to_hits(r) for r in results]
+
+
+async def asearch_chunks_batch(queries: Sequence[SearchQuery]) -> list[list[RetrievalHit]]:
+    """Async variant of `search_chunks_batch`."""
+    queries = _validate_batch(queries)
+    qvecs: list[np.ndarray | None] = [None] * len(queries)
+    positions = _embedded_positions(queries)
+    if positions:
+        for i, qvec in zip(positions, await aembed_queries([queries[i].query for i in positions])):
+            qvecs[i] = qvec
+
+    results: list[list] = [[] for _ in queries]
+    if settings.retrieval_backend == "numpy":
+        with timed("db_query"):
+            results = await asyncio.to_thread(_numpy_search_many, queries, qvecs)
+    elif queries:
+        async with get_async_engine().connect() as conn:
+            for (mode, _, _, embeddings, knobs), group in _batch_groups(queries).items():
+                async with conn.begin():  # scopes the group's SET LOCALs (see search_chunks_batch)
+                    if knobs is not None:
+                        await aapply_search_params(conn, **dict(knobs))
+                    sql, params = _build_batch_sql(queries, qvecs, group, mode=mode, embeddings=embeddings)
+                    with timed("db_query"):
+                        _split_rows((await conn.execute(sql, params)).fetchall(), results)
 
-    return hits
+    if any(_diversity(q) for q in queries):
+        with timed("mmr"):
+            results = await asyncio.to_thread(_diversify_batch, queries, results)
+    return [_rows_to_hits(r) for r in results]
@@ -1,53 +1,381 @@
 from __future__ import annotations
 
+import argparse
+import json
+import time
+from typing import Any
+
 from sqlalchemy import text
 
-from rag_knowledge_base_fastapi.services.db import create_db_engine
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.db import get_engine
 
 
-# NOTE: text-embedding-3-small produces 1536-dim vectors.
-# We'll make this configurable later once the embedding pipeline is implemented.
-EMBED_DIM = 1536
+# NOTE: text-embedding-3-small produces 1536-dim vectors (EMBED_DIM).
+EMBED_DIM = settings.embed_dim
 
 
-def init_db() -> None:
-    """
-    Initializes pgvector extension + creates the embeddings table (idempotent).
-    Safe to run multiple times.
-    """
-    engine = create_db_engine()
+def _regconfig() -> str:
+    # A generated column needs an immutable expression, i.e. a literal config.
+    config = settings.text_search_config
+    if not config.replace("_", "").isalnum():
+        raise ValueError(f"Invalid TEXT_SEARCH_CONFIG: {config!r}")
+    return f"'{config}'::regconfig"
 
-    ddl = f"""
-    -- Enable pgvector
-    CREATE EXTENSION IF NOT EXISTS vector;
 
-    -- Store chunked documents with embeddings for similarity search
+# Before the unique chunk key every ingest appended, and chunks without a
+# doc_id were told apart by nothing but the ingest. The rows of one ingest
+# were written in one transaction, so they share created_at: each such
+# group becomes its own document, "legacy-<id of its first chunk>".
+_LEGACY_DOC_IDS_SQL = """
+UPDATE kb_chunks c
+SET doc_id = 'legacy-' || g.first_id
+FROM (
+    SELECT source, created_at, min(id) AS first_id
+    FROM kb_chunks
+    WHERE doc_id IS NULL
+    GROUP BY source, created_at
+) g
+WHERE c.doc_id IS NULL AND c.source = g.source AND c.created_at = g.created_at
+"""
+
+_DUPLICATE_KEYS_SQL = """
+SELECT count(*) FROM (
+    SELECT 1 FROM kb_chunks GROUP BY source, doc_id, chunk_index HAVING count(*) > 1
+) d
+"""
+
+# Re-ingests of a document under the same doc_id: keep its newest ingest
+# whole (not the newest row per chunk_index, which would mix versions).
+_DEDUPE_SQL = """
+DELETE FROM kb_chunks c
+USING (
+    SELECT source, doc_id, max(created_at) AS newest
+    FROM kb_chunks
+    WHERE doc_id IS NOT NULL
+    GROUP BY source, doc_id
+    HAVING count(DISTINCT created_at) > 1
+) d
+WHERE c.source = d.source AND c.doc_id = d.doc_id AND c.created_at < d.newest
+"""
+
+# NULLS NOT DISTINCT (Postgres 15+): chunks without a doc_id are keyed by source.
+_UNIQUE_CHUNK_SQL = """
+CREATE UNIQUE INDEX kb_chunks_doc_chunk_key
+ON kb_chunks (source, doc_id, chunk_index) NULLS NOT DISTINCT
+"""
+
+_UNIQUE_DOCUMENT_SQL = """
+CREATE UNIQUE INDEX kb_documents_key
+ON kb_documents (source, doc_id) NULLS NOT DISTINCT
+"""
+
+
+# Per-document aggregates of kb_chunks, for the kb_documents catalog. The
+# document hash is the sha256 of its chunk hashes in chunk_index order.
+_DOCUMENT_AGGREGATES = """
+    count(*) AS chunks,
+    sum(octet_length(content)) AS bytes,
+    encode(sha256(convert_to(string_agg(content_hash, '' ORDER BY chunk_index), 'UTF8')), 'hex') AS content_hash,
+    CASE WHEN min(embedding_model) = max(embedding_model) THEN min(embedding_model) END AS embedding_model
+"""
+
+# Rebuild the catalog from kb_chunks in one pass (first run, bulk loads).
+_REFRESH_DOCUMENTS_SQL = f"""
+INSERT INTO kb_documents AS d (source, doc_id, chunks, bytes, content_hash, embedding_model, created_at, updated_at)
+SELECT source, doc_id, {_DOCUMENT_AGGREGATES}, min(created_at), max(created_at)
+FROM kb_chunks
+GROUP BY source, doc_id
+ORDER BY min(id)
+ON CONFLICT (source, doc_id) DO UPDATE SET
+    chunks = EXCLUDED.chunks,
+    bytes = EXCLUDED.bytes,
+    content_hash = EXCLUDED.content_hash,
+    embedding_model = EXCLUDED.embedding_model,
+    updated_at = greatest(d.updated_at, EXCLUDED.updated_at)
+WHERE (d.chunks, d.bytes, d.content_hash, d.embedding_model)
+    IS DISTINCT FROM (EXCLUDED.chunks, EXCLUDED.bytes, EXCLUDED.content_hash, EXCLUDED.embedding_model)
+"""
+
+_PRUNE_DOCUMENTS_SQL = """
+DELETE FROM kb_documents d
+WHERE CASE
+    -- One probe of the chunk key each (IS NOT DISTINCT FROM can't use it).
+    WHEN d.doc_id IS NULL THEN NOT EXISTS (SELECT 1 FROM kb_chunks c WHERE c.source = d.source AND c.doc_id IS NULL)
+    ELSE NOT EXISTS (SELECT 1 FROM kb_chunks c WHERE c.source = d.source AND c.doc_id = d.doc_id)
+END
+"""
+
+
+def refresh_documents(conn) -> None:
+    """Make the kb_documents catalog match kb_chunks again (one scan of each)."""
+    conn.execute(text(_REFRESH_DOCUMENTS_SQL))
+    conn.execute(text(_PRUNE_DOCUMENTS_SQL))
+
+
+# Every index on kb_chunks but the primary key: btree indexes, the unique
+# chunk key and ANN indexes (listed last, they take longest to build).
+_INDEXES_SQL = """
+SELECT c.relname, pg_get_indexdef(c.oid)
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_class t ON t.oid = i.indrelid
+JOIN pg_am am ON am.oid = c.relam
+WHERE t.relname = 'kb_chunks' AND NOT i.indisprimary
+ORDER BY am.amname IN ('hnsw', 'ivfflat'), c.relname
+"""
+
+
+def chunk_indexes(conn) -> list[tuple[str, str]]:
+    """(name, CREATE INDEX statement) for every index on kb_chunks but the primary key."""
+    # On a partitioned table the definitions read "ON ONLY kb_chunks", which
+    # would re-create the parent index alone (invalid, no partition indexes).
+    return [(r[0], r[1].replace(" ON ONLY ", " ON ", 1)) for r in conn.execute(text(_INDEXES_SQL))]
+
+
+def _chunks_table_ddl(partitions: int) -> str:
+    """kb_chunks itself; with `partitions`, hash-partitioned by source into kb_chunks_p0, p1, ..."""
+    # A partitioned table's primary key must include the partition key.
+    id_key, table_key, partition_by = " PRIMARY KEY", "", ""
+    if partitions:
+        id_key, table_key, partition_by = "", ",\n        PRIMARY KEY (id, source)", " PARTITION BY HASH (source)"
+    ddl = f"""
     CREATE TABLE IF NOT EXISTS kb_chunks (
-        id BIGSERIAL PRIMARY KEY,
+        id BIGSERIAL{id_key},
         source TEXT NOT NULL,               -- e.g., filename/url
         doc_id TEXT NULL,                   -- logical document id (optional)
         chunk_index INT NOT NULL DEFAULT 0, -- chunk number within doc
         content TEXT NOT NULL,              -- chunk text
+        content_hash TEXT NULL,             -- sha256 hex of content (incremental re-ingest)
+        embedding_model TEXT NULL,          -- model that produced embedding (NULL: unknown)
         metadata JSONB NOT NULL DEFAULT '{{}}'::jsonb,
         embedding VECTOR({EMBED_DIM}) NOT NULL,
-        created_at TIMESTAMPTZ NOT NULL DEFAULT now()
-    );
+        created_at TIMESTAMPTZ NOT NULL DEFAULT now(){table_key}
+    ){partition_by};
+    """
+    for i in range(partitions):
+        ddl += f"""
+    CREATE TABLE IF NOT EXISTS kb_chunks_p{i} PARTITION OF kb_chunks
+        FOR VALUES WITH (MODULUS {partitions}, REMAINDER {i});
+    """
+    return ddl
+
 
-    -- Helpful indexes (non-vector)
-    CREATE INDEX IF NOT EXISTS kb_chunks_source_idx ON kb_chunks (source);
-    CREATE INDEX IF NOT EXISTS kb_chunks_doc_id_idx ON kb_chunks (doc_id);
+def _chunks_columns_ddl() -> str:
+    return f"""
+    -- Columns added after the first release
+    ALTER TABLE kb_chunks ADD COLUMN IF NOT EXISTS content_hash TEXT NULL;
+    ALTER TABLE kb_chunks ADD COLUMN IF NOT EXISTS embedding_model TEXT NULL;
+    UPDATE kb_chunks
+    SET content_hash = encode(sha256(convert_to(content, 'UTF8')), 'hex')
+    WHERE content_hash IS NULL;
 
-    -- Vector index will be added after we ingest data (best practice).
-    -- (We will choose HNSW vs IVFFLAT based on your installed pgvector version and dataset size.)
+    -- Full-text search (SEARCH_MODE=lexical|hybrid); adding it rewrites the table once
+    ALTER TABLE kb_chunks ADD COLUMN IF NOT EXISTS content_tsv TSVECTOR
+        GENERATED ALWAYS AS (to_tsvector({_regconfig()}, content)) STORED;
     """
 
+
+# On a partitioned kb_chunks these cascade: each partition gets its own.
+_CHUNKS_INDEXES_DDL = """
+-- Helpful indexes (non-vector)
+CREATE INDEX IF NOT EXISTS kb_chunks_source_idx ON kb_chunks (source);
+CREATE INDEX IF NOT EXISTS kb_chunks_doc_id_idx ON kb_chunks (doc_id);
+CREATE INDEX IF NOT EXISTS kb_chunks_content_hash_idx ON kb_chunks (content_hash);
+CREATE INDEX IF NOT EXISTS kb_chunks_content_tsv_idx ON kb_chunks USING gin (content_tsv);
+"""
+
+_DOCUMENTS_DDL = """
+-- Document catalog for /kb/docs, kept in step with kb_chunks by the
+-- ingest path (kb_repository) and the bulk loader. id orders documents
+-- by first ingest and is the pagination cursor.
+CREATE TABLE IF NOT EXISTS kb_documents (
+    id BIGSERIAL PRIMARY KEY,
+    source TEXT NOT NULL,
+    doc_id TEXT NULL,
+    chunks INT NOT NULL,
+    bytes BIGINT NOT NULL,              -- UTF-8 size of the chunk texts
+    content_hash TEXT NULL,             -- sha256 of the chunk hashes in order
+    embedding_model TEXT NULL,          -- NULL when chunks disagree
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS kb_documents_source_idx ON kb_documents (source, id);
+CREATE INDEX IF NOT EXISTS kb_documents_doc_id_idx ON kb_documents (doc_id text_pattern_ops);
+
+-- The ANN vector index is managed separately (build it after the initial load):
+--   python -m rag_knowledge_base_fastapi.services.vector_index create
+"""
+
+
+def _execute_ddl(conn, ddl: str) -> None:
+    # Execute each statement safely (split on ';' but ignore empties)
+    for stmt in (s.strip() for s in ddl.split(";")):
+        if stmt:
+            conn.execute(text(stmt))
+
+
+def _is_partitioned(conn) -> bool:
+    return bool(conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('kb_chunks')")).scalar())
+
+
+def init_db() -> None:
+    """
+    Initializes pgvector extension + creates the embeddings table (idempotent).
+    Safe to run multiple times.
+
+    A new kb_chunks is created with KB_PARTITIONS hash partitions; an
+    existing table is kept as it is (see `partition_chunks`).
+    """
+    engine = get_engine()
+
     with engine.begin() as conn:
-        # Execute each statement safely (split on ';' but ignore empties)
-        for stmt in (s.strip() for s in ddl.split(";")):
-            if stmt:
-                conn.execute(text(stmt))
+        # Store chunked documents with embeddings for similarity search
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        # KB_PARTITIONS only shapes a new table; changing it later would
+        # add partitions that overlap the existing ones.
+        if conn.execute(text("SELECT to_regclass('kb_chunks')")).scalar() is None:
+            _execute_ddl(conn, _chunks_table_ddl(settings.kb_partitions))
+        _execute_ddl(conn, _chunks_columns_ddl())
+        _execute_ddl(conn, _CHUNKS_INDEXES_DDL)
+        _execute_ddl(conn, _DOCUMENTS_DDL)
 
+        # One row per chunk of a document, so re-ingesting upserts instead of
+        # appending (see kb_repository). Tables from before this key may hold
+        # several ingests of a document; nothing is deleted here.
+        if conn.execute(text("SELECT to_regclass('kb_chunks_doc_chunk_key')")).scalar() is None:
+            conn.execute(text(_LEGACY_DOC_IDS_SQL))
+            duplicates = conn.execute(text(_DUPLICATE_KEYS_SQL)).scalar()
+            if duplicates:
+                raise RuntimeError(
+                    f"kb_chunks has {duplicates} (source, doc_id, chunk_index) keys stored more than once, "
+                    "left by re-ingesting documents before they were upserted. Run "
+                    "`python -m rag_knowledge_base_fastapi.services.schema dedupe` to keep the newest "
+                    "ingest of each document (older ones are deleted), then run `schema` again."
+                )
+            conn.execute(text(_UNIQUE_CHUNK_SQL))
 
-if __name__ == "__main__":
+        # Created with its key, so a catalog without the key is new: fill it.
+        if conn.execute(text("SELECT to_regclass('kb_documents_key')")).scalar() is None:
+            conn.execute(text(_UNIQUE_DOCUMENT_SQL))
+            refresh_documents(conn)
+
+    # Pooled connections opened before the extension existed have no vector
+    # type adapters (see db._register_pgvector); start with fresh ones.
+    engine.dispose()
+
+
+def dedupe_chunks() -> dict[str, int]:
+    """
+    Delete all but the newest ingest of each document from a kb_chunks
+    without the unique chunk key (see init_db), in one transaction. Chunks
+    without a doc_id get legacy doc_ids first, so separate documents of a
+    source are kept. Returns the rows deleted and the duplicate keys left
+    (rows written twice by one ingest; init_db still refuses those).
+    """
+    with get_engine().begin() as conn:
+        if conn.execute(text("SELECT to_regclass('kb_chunks_doc_chunk_key')")).scalar() is not None:
+            return {"deleted": 0, "duplicate_keys": 0}
+        conn.execute(text(_LEGACY_DOC_IDS_SQL))
+        deleted = conn.execute(text(_DEDUPE_SQL)).rowcount
+        return {"deleted": deleted, "duplicate_keys": conn.execute(text(_DUPLICATE_KEYS_SQL)).scalar()}
+
+
+_COPY_CHUNKS_SQL = """
+INSERT INTO kb_chunks
+    (id, source, doc_id, chunk_index, content, content_hash, embedding_model, metadata, embedding, created_at)
+SELECT id, source, doc_id, chunk_index, content, content_hash, embedding_model, metadata, embedding, created_at
+FROM kb_chunks_unpartitioned
+"""
+
+
+def partition_chunks(
+    partitions: int,
+    *,
+    keep_old: bool = False,
+    maintenance_work_mem: str | None = None,
+) -> dict[str, Any]:
+    """
+    Migrate an unpartitioned kb_chunks to `partitions` hash partitions by
+    source, in one transaction.
+
+    The table is renamed to kb_chunks_unpartitioned and its rows copied into
+    a new, partitioned kb_chunks with the same ids (the id sequence carries
+    over, so chunk ids held elsewhere stay valid). Its indexes, ANN indexes
+    included, are re-created from their definitions on the new table, where
+    each partition gets its own. kb_chunks is locked against reads and
+    writes until the end, so run it in a maintenance window. The old table
+    is dropped unless `keep_old`. Returns the row count and timings.
+    """
+    if partitions < 1:
+        raise ValueError("partitions must be >= 1")
+    init_db()  # bring the old table up to date first (columns, unique key)
+
+    engine = get_engine()
+    stats: dict[str, Any] = {"partitions": partitions, "index_seconds": {}}
+    with engine.begin() as conn:
+        if _is_partitioned(conn):
+            raise ValueError("kb_chunks is already partitioned")
+        if maintenance_work_mem:
+            conn.execute(text("SELECT set_config('maintenance_work_mem', :v, true)"), {"v": maintenance_work_mem})
+        conn.execute(text("LOCK TABLE kb_chunks IN ACCESS EXCLUSIVE MODE"))
+
+        # Index names are per schema: free them for the new table.
+        indexes = chunk_indexes(conn)
+        for name, _ in indexes:
+            conn.execute(text(f"DROP INDEX {name}"))
+        conn.execute(text("ALTER TABLE kb_chunks RENAME TO kb_chunks_unpartitioned"))
+        conn.execute(text("ALTER INDEX IF EXISTS kb_chunks_pkey RENAME TO kb_chunks_unpartitioned_pkey"))
+        conn.execute(text("ALTER SEQUENCE IF EXISTS kb_chunks_id_seq RENAME TO kb_chunks_unpartitioned_id_seq"))
+
+        _execute_ddl(conn, _chunks_table_ddl(partitions))
+        _execute_ddl(conn, _chunks_columns_ddl())
+        t0 = time.perf_counter()
+        stats["rows"] = conn.execute(text(_COPY_CHUNKS_SQL)).rowcount
+        stats["copy_seconds"] = time.perf_counter() - t0
+        conn.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('kb_chunks', 'id'), last_value, is_called) "
+                "FROM kb_chunks_unpartitioned_id_seq"
+            )
+        )
+
+        for name, definition in indexes:
+            t0 = time.perf_counter()
+            conn.execute(text(definition))
+            stats["index_seconds"][name] = time.perf_counter() - t0
+        _execute_ddl(conn, _CHUNKS_INDEXES_DDL)  # any that were missing
+        if not keep_old:
+            conn.execute(text("DROP TABLE kb_chunks_unpartitioned"))
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE kb_chunks"))
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create or migrate the knowledge base tables.")
+    sub = parser.add_subparsers(dest="command")
+    partition = sub.add_parser("partition", help="hash-partition an existing kb_chunks by source")
+    partition.add_argument("--partitions", type=int, default=settings.kb_partitions or 16)
+    partition.add_argument("--keep-old", action="store_true", help="keep the old table as kb_chunks_unpartitioned")
+    partition.add_argument("--maintenance-work-mem", default=None, help="e.g. 2GB, for the index rebuilds")
+    sub.add_parser("dedupe", help="delete all but the newest ingest of each document (before the unique key)")
+    args = parser.parse_args()
+
+    if args.command == "dedupe":
+        print(json.dumps(dedupe_chunks(), indent=2))
+        return
+
+    if args.command == "partition":
+        stats = partition_chunks(
+            args.partitions, keep_old=args.keep_old, maintenance_work_mem=args.maintenance_work_mem
+        )
+        print(json.dumps(stats, indent=2))
+        return
     init_db()
-    print("DB initialized: pgvector extension + kb_chunks table ensured.")
+    print("DB initialized: pgvector extension + kb_chunks and kb_documents tables ensured.")
+
+
+if __name__ == "__main__":
+    main()
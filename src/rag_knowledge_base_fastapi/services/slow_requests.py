@@ -0,0 +1,191 @@
+"""
+Opt-in sampling profiler for slow requests (SLOW_REQUEST_SECONDS > 0).
+
+A daemon thread wakes every SLOW_REQUEST_SAMPLE_INTERVAL_MS. While some
+request has run longer than the threshold, it records where that request's
+task is suspended (its coroutine await chain) and what every thread is
+executing, and charges the sample to the request. When the request ends,
+the same thread writes its samples to SLOW_REQUEST_DUMP_DIR as folded
+stacks (one "frame;frame;... count" line per distinct stack: the input of
+flamegraph.pl and speedscope), headed by its route, duration and stage
+timings. The file I/O stays off the event loop, which is likely loaded
+already when requests are slow. Requests under the threshold are never sampled, and with the
+setting at 0 nothing runs at all.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+
+# Samples kept per request (at 10 ms, the first ~100 s).
+_MAX_SAMPLES = 10_000
+
+
+@dataclass(eq=False)
+class _Tracked:
+    started: float
+    task: asyncio.Task | None
+    stacks: Counter[str] = field(default_factory=Counter)
+    samples: int = 0
+
+
+@dataclass(frozen=True)
+class _Dump:
+    route: str
+    seconds: float
+    timings: dict[str, float]
+    stacks: list[tuple[str, int]]
+    samples: int
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+def _thread_stack(frame) -> list[str]:
+    labels: list[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return labels[::-1]
+
+
+def _task_stack(task: asyncio.Task) -> list[str]:
+    """Outermost-first await chain of a suspended task."""
+    labels: list[str] = []
+    coro = task.get_coro()
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "ag_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        labels.append(_frame_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "ag_await", None) or getattr(coro, "gi_yieldfrom", None)
+    return labels
+
+
+class SlowRequestSampler:
+    def __init__(self, *, threshold_seconds: float, interval_seconds: float, dump_dir: str) -> None:
+        self._threshold = threshold_seconds
+        self._interval = interval_seconds
+        self._dump_dir = Path(dump_dir)
+        self._lock = threading.Lock()  # _active; held briefly by every request
+        self._sample_lock = threading.Lock()  # the stacks; only slow requests wait for it
+        self._active: set[_Tracked] = set()
+        self._dumps: list[_Dump] = []  # finished slow requests, written by the thread
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="slow-request-sampler", daemon=True)
+        self._thread.start()
+
+    def track(self) -> _Tracked:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        tracked = _Tracked(started=time.perf_counter(), task=task)
+        with self._lock:
+            self._active.add(tracked)
+        return tracked
+
+    def finish(self, tracked: _Tracked, *, route: str, seconds: float, timings: dict[str, float]) -> None:
+        """Stop sampling `tracked`; if it was slow, queue its stacks for the sampler thread to write."""
+        with self._lock:
+            self._active.discard(tracked)
+        if seconds < self._threshold:
+            return
+        with self._sample_lock:
+            stacks = tracked.stacks.most_common()
+            samples = tracked.samples
+        if not stacks:
+            return
+        dump = _Dump(route=route, seconds=seconds, timings=dict(timings), stacks=stacks, samples=samples)
+        with self._lock:
+            self._dumps.append(dump)
+
+    def _write(self, dump: _Dump) -> Path:
+        self._dump_dir.mkdir(parents=True, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9]+", "_", dump.route).strip("_")
+        path = self._dump_dir / f"{time.time_ns()}-{name}.folded"
+        lines = [
+            f"# {dump.route} {dump.seconds:.3f}s, {dump.samples} samples every {self._interval * 1000:g} ms",
+            "# " + ", ".join(f"{stage}={s * 1000:.1f}ms" for stage, s in dump.timings.items()),
+        ]
+        lines.extend(f"{stack} {count}" for stack, count in dump.stacks)
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        return path
+
+    def _write_dumps(self) -> None:
+        with self._lock:
+            dumps, self._dumps = self._dumps, []
+        for dump in dumps:
+            try:
+                self._write(dump)
+            except OSError:
+                pass  # a full or read-only disk must not stop the sampling
+
+    def _sample(self, slow: list[_Tracked]) -> None:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        threads = [
+            ";".join([f"thread:{names.get(ident, ident)}", *_thread_stack(frame)])
+            for ident, frame in sys._current_frames().items()
+            if ident != me
+        ]
+        for tracked in slow:
+            if tracked.samples >= _MAX_SAMPLES:
+                continue
+            tracked.samples += 1
+            if tracked.task is not None and not tracked.task.done():
+                tracked.stacks[";".join(["task", *_task_stack(tracked.task)])] += 1
+            tracked.stacks.update(threads)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            cutoff = time.perf_counter() - self._threshold
+            with self._lock:
+                slow = [t for t in self._active if t.started <= cutoff]
+            if slow:
+                with self._sample_lock:
+                    self._sample(slow)
+            self._write_dumps()
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._write_dumps()
+
+
+_sampler: SlowRequestSampler | None = None
+_sampler_lock = threading.Lock()
+
+
+def get_slow_request_sampler() -> SlowRequestSampler | None:
+    """The process-wide sampler, or None when SLOW_REQUEST_SECONDS is 0."""
+    global _sampler
+    if settings.slow_request_seconds <= 0:
+        return None
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = SlowRequestSampler(
+                threshold_seconds=settings.slow_request_seconds,
+                interval_seconds=settings.slow_request_sample_interval_ms / 1000,
+                dump_dir=settings.slow_request_dump_dir,
+            )
+        return _sampler
+
+
+def close_slow_request_sampler() -> None:
+    global _sampler
+    with _sampler_lock:
+        sampler, _sampler = _sampler, None
+    if sampler is not None:
+        sampler.close()
@@ -0,0 +1,178 @@
+"""
+Streaming ingestion: bytes -> text -> chunks -> embedding batches -> DB.
+
+Used by the ingestion job workers (services.ingest_jobs) so memory stays
+O(batch) rather than O(file). The document is decoded incrementally,
+chunked by `StreamingChunker`, and batches of chunks go through a bounded
+queue to a few workers that embed and upsert them while the next batches
+are being read.
+"""
+from __future__ import annotations
+
+import asyncio
+import codecs
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.chunking import aiter_chunks, chunking_options
+from rag_knowledge_base_fastapi.services.kb_repository import (
+    adelete_chunks_from,
+    ainsert_chunks_with_embeddings,
+)
+from rag_knowledge_base_fastapi.services.providers import AsyncEmbedder
+
+Batch = list[tuple[int, str]]
+
+
+@dataclass(frozen=True)
+class StreamIngestResult:
+    bytes_read: int
+    chunks_created: int
+    # Every chunk below this index is written (batches can finish out of
+    # order); resuming from it skips only work that is known to be done.
+    chunks_committed: int
+    inserted: int
+    embedded: int
+    reused: int
+    unchanged: int
+    deleted: int
+    # Per stage: reading + decoding + chunking, the embedding provider, the DB.
+    read_seconds: float
+    embed_seconds: float
+    db_seconds: float
+
+
+ProgressCallback = Callable[[StreamIngestResult], Awaitable[None]]
+
+
+async def adecode_utf8(blocks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """
+    Decode UTF-8 incrementally; a character split across blocks is carried
+    over to the next one. Raises UnicodeDecodeError on invalid input.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    async for block in blocks:
+        text = decoder.decode(block)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+async def aingest_stream(
+    blocks: AsyncIterable[bytes],
+    *,
+    source: str,
+    doc_id: str | None,
+    metadata: dict[str, Any] | None = None,
+    embedder: AsyncEmbedder | None = None,
+    batch_chunks: int | None = None,
+    queue_depth: int | None = None,
+    workers: int | None = None,
+    resume_from: int = 0,
+    on_progress: ProgressCallback | None = None,
+) -> StreamIngestResult:
+    """
+    Ingest a UTF-8 byte stream as the new version of (source, doc_id).
+
+    Produces the same chunks as `chunk_text` on the whole text and the same
+    end state as `ainsert_chunks_with_embeddings`: batches are upserted
+    incrementally (`prune=False`) and the old tail beyond the last chunk is
+    deleted at the end. The ingest is not atomic: if decoding fails halfway
+    the batches already written stay, and re-sending the file converges.
+
+    `resume_from` skips chunks below that index (a previous run's
+    `chunks_committed`); they are still read, since chunk boundaries depend
+    on everything before them, but not embedded or written. `on_progress`
+    is awaited after every written batch.
+
+    An empty (or whitespace-only) stream writes and deletes nothing; the
+    result then has chunks_created == 0.
+    """
+    batch_chunks = batch_chunks or settings.ingest_stream_batch_chunks
+    workers = workers or settings.ingest_stream_workers
+    # Bounds what is read ahead of the workers: at most queue_depth + workers
+    # batches are in memory at once.
+    queue: asyncio.Queue[Batch | None] = asyncio.Queue(maxsize=queue_depth or settings.ingest_stream_queue_depth)
+    totals: dict[str, Any] = {
+        "bytes_read": 0,
+        "chunks_created": 0,
+        "chunks_committed": resume_from,
+        "inserted": 0,
+        "embedded": 0,
+        "reused": 0,
+        "unchanged": 0,
+        "deleted": 0,
+        "read_seconds": 0.0,
+        "embed_seconds": 0.0,
+        "db_seconds": 0.0,
+    }
+    done: dict[int, int] = {}  # first chunk_index of a written batch -> one past its last
+
+    async def counted() -> AsyncIterator[bytes]:
+        async for block in blocks:
+            totals["bytes_read"] += len(block)
+            yield block
+
+    async def put(batch: Batch | None) -> None:
+        # Time blocked on a full queue is backpressure, not reading.
+        t = time.perf_counter()
+        await queue.put(batch)
+        totals["read_seconds"] -= time.perf_counter() - t
+
+    async def produce() -> None:
+        t0 = time.perf_counter()
+        batch: Batch = []
+        chunks = aiter_chunks(adecode_utf8(counted()), **chunking_options())
+        async for chunk in chunks:
+            totals["chunks_created"] += 1
+            if chunk.chunk_index < resume_from:
+                continue
+            batch.append((chunk.chunk_index, chunk.content))
+            if len(batch) >= batch_chunks:
+                await put(batch)
+                batch = []
+        if batch:
+            await put(batch)
+        totals["read_seconds"] += time.perf_counter() - t0
+        for _ in range(workers):
+            await queue.put(None)
+
+    async def consume() -> None:
+        while (batch := await queue.get()) is not None:
+            result = await ainsert_chunks_with_embeddings(
+                source=source,
+                doc_id=doc_id,
+                chunks=batch,
+                metadata=metadata,
+                embedder=embedder,
+                prune=False,
+            )
+            for key in ("inserted", "embedded", "reused", "unchanged", "embed_seconds", "db_seconds"):
+                totals[key] += getattr(result, key)
+            done[batch[0][0]] = batch[-1][0] + 1
+            while totals["chunks_committed"] in done:
+                totals["chunks_committed"] = done.pop(totals["chunks_committed"])
+            if on_progress is not None:
+                await on_progress(StreamIngestResult(**totals))
+
+    try:
+        # A failing task cancels the others (no worker left blocked on the queue).
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(workers):
+                tg.create_task(consume())
+            tg.create_task(produce())
+    except ExceptionGroup as eg:
+        raise eg.exceptions[0] from None
+
+    if totals["chunks_created"]:
+        t0 = time.perf_counter()
+        totals["deleted"] = await adelete_chunks_from(
+            source=source, doc_id=doc_id, first_index=totals["chunks_created"]
+        )
+        totals["db_seconds"] += time.perf_counter() - t0
+    totals["chunks_committed"] = totals["chunks_created"]
+    return StreamIngestResult(**totals)
@@ -0,0 +1,92 @@
+"""
+Local token counting for prompt budgets.
+
+Uses tiktoken (optional: `poetry install -E tokenizer`) with
+TOKENIZER_ENCODING when it is installed and the encoding can be loaded;
+otherwise a regex estimate that errs on the high side, so budgets hold
+either way.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from typing import Protocol
+
+from rag_knowledge_base_fastapi.config.settings import settings
+
+
+class Tokenizer(Protocol):
+    name: str
+
+    def count(self, text: str) -> int: ...
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` that is at most `max_tokens` tokens."""
+        ...
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding: str) -> None:
+        import tiktoken
+
+        self._enc = tiktoken.get_encoding(encoding)
+        self.name = encoding
+
+    def count(self, text: str) -> int:
+        return len(self._enc.encode_ordinary(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self._enc.encode_ordinary(text)
+        if len(tokens) <= max_tokens:
+            return text
+        # A cut inside a multi-byte character decodes to U+FFFD; drop it.
+        return self._enc.decode(tokens[: max(0, max_tokens)]).rstrip("�")
+
+
+# BPE vocabularies merge whitespace into the following word and have most
+# short words as one token; longer words split into pieces of ~4-6 chars.
+_PIECE = re.compile(r"\w+|[^\w\s]")
+# One match per estimated token: words in runs of up to five characters.
+_TOKEN = re.compile(r"\w{1,5}|[^\w\s]")
+
+
+def _piece_tokens(piece: str) -> int:
+    return 1 + (len(piece) - 1) // 5
+
+
+class ApproxTokenizer:
+    """Word/punctuation estimate; a few percent above tiktoken on English prose."""
+
+    name = "approx"
+
+    def count(self, text: str) -> int:
+        return len(_TOKEN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        used = 0
+        for m in _PIECE.finditer(text):
+            used += _piece_tokens(m.group())
+            if used > max_tokens:
+                return text[: m.start()].rstrip()
+        return text
+
+
+_tokenizer: Tokenizer | None = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer() -> Tokenizer:
+    global _tokenizer
+    with _tokenizer_lock:
+        if _tokenizer is None:
+            try:
+                _tokenizer = TiktokenTokenizer(settings.tokenizer_encoding)
+            except Exception:
+                # Not installed, unknown encoding, or its BPE file could not be
+                # fetched (tiktoken downloads it on first use).
+                _tokenizer = ApproxTokenizer()
+        return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import argparse
+from dataclasses import dataclass, replace
+from typing import Literal
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.db import get_engine
+
+VectorMetric = Literal["l2", "cosine", "ip"]
+IndexMethod = Literal["hnsw", "ivfflat"]
+Quantization = Literal["none", "halfvec", "binary"]
+
+# Distance operator used in ORDER BY for each metric; lower is always better
+# (<#> is the *negative* inner product).
+_OPERATORS: dict[str, str] = {"l2": "<->", "cosine": "<=>", "ip": "<#>"}
+
+# The index opclass must match the operator or the planner won't use it.
+_OPCLASSES: dict[str, str] = {"l2": "vector_l2_ops", "cosine": "vector_cosine_ops", "ip": "vector_ip_ops"}
+_HALFVEC_OPCLASSES: dict[str, str] = {"l2": "halfvec_l2_ops", "cosine": "halfvec_cosine_ops", "ip": "halfvec_ip_ops"}
+
+
+def distance_operator(metric: str) -> str:
+    try:
+        return _OPERATORS[metric]
+    except KeyError:
+        raise ValueError(f"Unknown vector metric: {metric!r}") from None
+
+
+def quantized_expression(quantization: str, *, dim: int, column: str = "embedding") -> str:
+    """
+    SQL expression a quantized index is built on.
+
+    Quantized indexes are expression indexes over the full-precision column,
+    so no extra column has to be kept in sync; queries must repeat the
+    expression verbatim for the planner to match the index.
+    """
+    if quantization == "halfvec":
+        return f"({column}::halfvec({int(dim)}))"
+    if quantization == "binary":
+        return f"(binary_quantize({column})::bit({int(dim)}))"
+    raise ValueError(f"Unknown vector quantization: {quantization!r}")
+
+
+def quantized_distance(quantization: str, *, metric: str, dim: int, param: str, column: str = "embedding") -> str:
+    """
+    Shortlist ORDER BY expression: quantized column vs the quantized query
+    vector bound as `param` (e.g. ":qvec"). Binary codes are compared by
+    Hamming distance whatever the metric; halfvec keeps the metric.
+    """
+    expr = quantized_expression(quantization, dim=dim, column=column)
+    if quantization == "halfvec":
+        return f"{expr} {distance_operator(metric)} CAST({param} AS halfvec({int(dim)}))"
+    return f"{expr} <~> binary_quantize(CAST({param} AS vector({int(dim)})))"
+
+
+@dataclass(frozen=True)
+class VectorIndexSpec:
+    method: IndexMethod = "hnsw"
+    metric: VectorMetric = "l2"
+    m: int = 16
+    ef_construction: int = 64
+    lists: int = 100
+    table: str = "kb_chunks"
+    column: str = "embedding"
+    # "halfvec" (2x smaller) / "binary" (32x smaller) index a quantized copy
+    # of the column for a shortlist that is re-ranked at full precision.
+    quantization: Quantization = "none"
+    dim: int = settings.embed_dim
+
+    @property
+    def name(self) -> str:
+        if self.quantization == "binary":
+            return f"{self.table}_{self.column}_{self.method}_bit_hamming_idx"
+        if self.quantization == "halfvec":
+            return f"{self.table}_{self.column}_{self.method}_halfvec_{self.metric}_idx"
+        return f"{self.table}_{self.column}_{self.method}_{self.metric}_idx"
+
+    @property
+    def opclass(self) -> str:
+        distance_operator(self.metric)  # validates metric
+        if self.quantization == "binary":
+            return "bit_hamming_ops"
+        if self.quantization == "halfvec":
+            return _HALFVEC_OPCLASSES[self.metric]
+        return _OPCLASSES[self.metric]
+
+    @property
+    def target(self) -> str:
+        if self.quantization == "none":
+            return self.column
+        return quantized_expression(self.quantization, dim=self.dim, column=self.column)
+
+    def create_sql(self, *, concurrently: bool, only: bool = False) -> str:
+        """`only`: on a partitioned table, create the parent index without building the partitions'."""
+        if self.method == "hnsw":
+            with_clause = f"(m = {int(self.m)}, ef_construction = {int(self.ef_construction)})"
+        elif self.method == "ivfflat":
+            with_clause = f"(lists = {int(self.lists)})"
+        else:
+            raise ValueError(f"Unknown index method: {self.method!r}")
+        return (
+            f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {self.name} "
+            f"ON {'ONLY ' if only else ''}{self.table} USING {self.method} ({self.target} {self.opclass}) "
+            f"WITH {with_clause}"
+        )
+
+
+def spec_from_settings() -> VectorIndexSpec:
+    return VectorIndexSpec(
+        method=settings.vector_index_method,
+        metric=settings.vector_metric,
+        m=settings.hnsw_m,
+        ef_construction=settings.hnsw_ef_construction,
+        lists=settings.ivfflat_lists,
+        quantization=settings.vector_quantization,
+    )
+
+
+def _index_is_valid(conn: Connection, name: str) -> bool | None:
+    """True/False for an existing index, None if it doesn't exist."""
+    return conn.execute(
+        text(
+            """
+            SELECT i.indisvalid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name
+            """
+        ),
+        {"name": name},
+    ).scalar_one_or_none()
+
+
+def _partitions(conn: Connection, table: str) -> list[str]:
+    """Partitions of `table` (none for a plain table)."""
+    return list(
+        conn.execute(
+            text(
+                """
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass(:table)
+                ORDER BY c.relname
+                """
+            ),
+            {"table": table},
+        ).scalars()
+    )
+
+
+def _is_partitioned_index(conn: Connection, name: str) -> bool:
+    sql = text("SELECT relkind = 'I' FROM pg_class WHERE oid = to_regclass(:name)")
+    return bool(conn.execute(sql, {"name": name}).scalar())
+
+
+def create_vector_index(
+    spec: VectorIndexSpec | None = None,
+    *,
+    concurrently: bool = True,
+    maintenance_work_mem: str | None = None,
+) -> str:
+    """
+    Build the ANN index described by `spec` (defaults from settings).
+
+    With `concurrently=True` the build does not block writes to the table,
+    so it is safe on a live database. A previous concurrent build that
+    failed leaves an INVALID index behind; it is dropped and rebuilt.
+
+    On a partitioned table (KB_PARTITIONS) each partition gets its own
+    index, attached to one on the table that the planner uses once all are
+    built. Postgres can't build that concurrently in one statement, so the
+    partitions' indexes are built one at a time; an interrupted build
+    resumes with the partitions that are missing.
+    Returns the index name.
+    """
+    spec = spec or spec_from_settings()
+    engine = get_engine()
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block.
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if maintenance_work_mem:
+            conn.execute(text("SELECT set_config('maintenance_work_mem', :v, false)"), {"v": maintenance_work_mem})
+        partitions = _partitions(conn, spec.table) if concurrently else []
+        if not partitions:
+            if _index_is_valid(conn, spec.name) is False:
+                conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {spec.name}"))
+            conn.execute(text(spec.create_sql(concurrently=concurrently)))
+            return spec.name
+
+        # Invalid until every partition's index is attached.
+        conn.execute(text(spec.create_sql(concurrently=False, only=True)))
+        for partition in partitions:
+            part = replace(spec, table=partition)
+            if _index_is_valid(conn, part.name) is False:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {part.name}"))
+            conn.execute(text(part.create_sql(concurrently=True)))
+            # A no-op if it is attached already.
+            conn.execute(text(f"ALTER INDEX {spec.name} ATTACH PARTITION {part.name}"))
+
+    return spec.name
+
+
+def drop_vector_index(name: str, *, concurrently: bool = True) -> None:
+    engine = get_engine()
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        # An index on a partitioned table (with its partitions') can only be dropped in one go.
+        if _is_partitioned_index(conn, name):
+            concurrently = False
+        conn.execute(text(f"DROP INDEX {'CONCURRENTLY ' if concurrently else ''}IF EXISTS {name}"))
+
+
+def list_vector_indexes(table: str = "kb_chunks") -> list[dict]:
+    engine = get_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """
+                SELECT c.relname, i.indisvalid, pg_get_indexdef(c.oid),
+                       -- on a partitioned table, the sum of its partitions' indexes
+                       (SELECT coalesce(sum(pg_relation_size(p.relid)), 0) FROM pg_partition_tree(c.oid) p)
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_class t ON t.oid = i.indrelid
+                JOIN pg_am am ON am.oid = c.relam
+                WHERE t.relname = :table AND am.amname IN ('hnsw', 'ivfflat')
+                ORDER BY c.relname
+                """
+            ),
+            {"table": table},
+        ).fetchall()
+    return [{"name": r[0], "valid": r[1], "size_bytes": r[3], "definition": r[2]} for r in rows]
+
+
+def _search_settings(ef_search: int | None, probes: int | None, iterative_scan: str | None) -> list[tuple[str, str]]:
+    gucs = []
+    if ef_search is not None:
+        gucs.append(("hnsw.ef_search", str(int(ef_search))))
+    if probes is not None:
+        gucs.append(("ivfflat.probes", str(int(probes))))
+    if iterative_scan is not None:
+        gucs.append(("hnsw.iterative_scan", iterative_scan))
+    return gucs
+
+
+# set_config(..., true) is SET LOCAL but accepts bind parameters.
+_SET_LOCAL = text("SELECT set_config(:name, :v, true)")
+
+
+def apply_search_params(
+    conn: Connection,
+    *,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    iterative_scan: str | None = None,
+) -> None:
+    """
+    Set per-query ANN knobs for the current transaction only (SET LOCAL).
+
+    Higher ef_search (HNSW) / probes (IVFFlat) trade latency for recall.
+    `iterative_scan` (pgvector 0.8+) lets an HNSW scan continue past
+    ef_search rows when filters discard too many of them.
+    """
+    for name, value in _search_settings(ef_search, probes, iterative_scan):
+        conn.execute(_SET_LOCAL, {"name": name, "v": value})
+
+
+async def aapply_search_params(
+    conn: AsyncConnection,
+    *,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    iterative_scan: str | None = None,
+) -> None:
+    """Async variant of `apply_search_params`."""
+    for name, value in _search_settings(ef_search, probes, iterative_scan):
+        await conn.execute(_SET_LOCAL, {"name": name, "v": value})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Manage ANN indexes on kb_chunks.embedding.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    create = sub.add_parser("create", help="build an index (defaults from settings)")
+    create.add_argument("--method", choices=["hnsw", "ivfflat"], default=settings.vector_index_method)
+    create.add_argument("--metric", choices=sorted(_OPERATORS), default=settings.vector_metric)
+    create.add_argument("--m", type=int, default=settings.hnsw_m)
+    create.add_argument("--ef-construction", type=int, default=settings.hnsw_ef_construction)
+    create.add_argument("--lists", type=int, default=settings.ivfflat_lists)
+    create.add_argument(
+        "--quantization", choices=["none", "halfvec", "binary"], default=settings.vector_quantization
+    )
+    create.add_argument("--no-concurrently", action="store_true", help="faster, but blocks writes")
+    create.add_argument("--maintenance-work-mem", default=None, help="e.g. 2GB")
+
+    drop = sub.add_parser("drop", help="drop an index by name")
+    drop.add_argument("name")
+
+    sub.add_parser("list", help="list ANN indexes on kb_chunks")
+
+    args = parser.parse_args()
+    if args.command == "create":
+        spec = VectorIndexSpec(
+            method=args.method,
+            metric=args.metric,
+            m=args.m,
+            ef_construction=args.ef_construction,
+            lists=args.lists,
+            quantization=args.quantization,
+        )
+        name = create_vector_index(
+            spec,
+            concurrently=not args.no_concurrently,
+            maintenance_work_mem=args.maintenance_work_mem,
+        )
+        print(f"Index ready: {name}")
+    elif args.command == "drop":
+        drop_vector_index(args.name)
+        print(f"Dropped: {args.name}")
+    else:
+        for idx in list_vector_indexes():
+            print(f"{idx['name']}  valid={idx['valid']}  size={idx['size_bytes']}  {idx['definition']}")
+
+
+if __name__ == "__main__":
+    main()
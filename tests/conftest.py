@@ -0,0 +1,70 @@
+"""
+Shared fixtures. Settings are read once at import, so the offline providers
+are selected here, before any test imports the app.
+
+Tests using `pg_backend` need a disposable Postgres with pgvector: set
+TEST_DATABASE_URL (its kb_* tables are dropped and re-created), otherwise
+they are skipped.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+
+import pytest
+
+os.environ.update(
+    EMBEDDING_PROVIDER="hashing",
+    CHAT_PROVIDER="echo",
+    EMBED_DIM="64",
+    QUERY_CACHE_SQLITE_PATH="",
+    ANSWER_CACHE_MAX_ENTRIES="0",
+)
+
+from rag_knowledge_base_fastapi.config.settings import settings  # noqa: E402
+
+
+@pytest.fixture
+def numpy_backend(tmp_path, monkeypatch):
+    """RETRIEVAL_BACKEND=numpy on an empty index in a temporary directory."""
+    from rag_knowledge_base_fastapi.services.numpy_index import close_numpy_index
+
+    close_numpy_index()
+    monkeypatch.setattr(settings, "retrieval_backend", "numpy")
+    monkeypatch.setattr(settings, "numpy_index_dir", str(tmp_path / "numpy_index"))
+    yield
+    close_numpy_index()
+
+
+@pytest.fixture
+def pg_backend(monkeypatch):
+    """RETRIEVAL_BACKEND=pgvector on empty kb_* tables in TEST_DATABASE_URL."""
+    url = os.environ.get("TEST_DATABASE_URL")
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    from sqlalchemy import text
+
+    from rag_knowledge_base_fastapi.services import db, schema
+
+    monkeypatch.setattr(settings, "database_url", url)
+    monkeypatch.setattr(settings, "retrieval_backend", "pgvector")
+    db.dispose_engine()
+    asyncio.run(db.dispose_async_engine())
+    with db.get_engine().begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS kb_chunks, kb_documents CASCADE"))
+    schema.init_db()
+    yield
+    db.dispose_engine()
+    asyncio.run(db.dispose_async_engine())
+
+
+@pytest.fixture
+def api_client(numpy_backend, tmp_path, monkeypatch):
+    """TestClient of the app (lifespan included) on the numpy backend, with its own ingest job store."""
+    from fastapi.testclient import TestClient
+
+    from rag_knowledge_base_fastapi.main import app
+
+    monkeypatch.setattr(settings, "ingest_jobs_dir", str(tmp_path / "ingest_jobs"))
+    with TestClient(app) as client:
+        yield client
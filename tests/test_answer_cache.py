@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pytest
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services import answer_cache
+from rag_knowledge_base_fastapi.services.answer_cache import AnswerCache
+from rag_knowledge_base_fastapi.services.chat_service import answer_with_rag
+from rag_knowledge_base_fastapi.services.kb_repository import insert_chunks_with_embeddings
+
+A = np.array([1.0, 0.0, 0.0], dtype=np.float32)
+NEAR_A = np.array([1.0, 0.1, 0.0], dtype=np.float32)  # cosine ~0.995
+B = np.array([0.0, 1.0, 0.0], dtype=np.float32)
+
+
+def _cache(**kwargs) -> AnswerCache:
+    return AnswerCache(**{"max_entries": 10, "ttl_seconds": 60.0, "threshold": 0.95, **kwargs})
+
+
+def _put(cache: AnswerCache, vector: np.ndarray, value: str, partition: str = "p") -> None:
+    cache.put(partition, vector, value, chunk_ids=[1], fingerprint=1)
+
+
+def test_hit_at_or_above_threshold():
+    cache = _cache()
+    _put(cache, A, "a")
+    hit = cache.lookup("p", NEAR_A)
+    assert hit is not None and hit.value == "a" and hit.similarity > 0.95
+
+
+def test_miss_below_threshold_or_in_another_partition():
+    cache = _cache()
+    _put(cache, A, "a")
+    assert cache.lookup("p", B) is None
+    assert cache.lookup("other", A) is None
+    assert cache.stats().misses == 2
+
+
+def test_expired_best_match_does_not_hide_a_live_one():
+    cache = _cache(ttl_seconds=0.05)
+    _put(cache, A, "old")
+    time.sleep(0.1)
+    _put(cache, NEAR_A, "new")
+    hit = cache.lookup("p", A)
+    assert hit is not None and hit.value == "new"
+    assert cache.stats().expirations == 1
+    assert cache.stats().size == 1
+
+
+def test_ttl_expiry():
+    cache = _cache(ttl_seconds=0.05)
+    _put(cache, A, "a")
+    time.sleep(0.1)
+    assert cache.lookup("p", A) is None
+    assert (cache.stats().size, cache.stats().expirations) == (0, 1)
+
+
+def test_lru_eviction():
+    cache = _cache(max_entries=2)
+    _put(cache, A, "a")
+    _put(cache, B, "b")
+    assert cache.lookup("p", A).value == "a"  # b is now least recently used
+    _put(cache, np.array([0.0, 0.0, 1.0], dtype=np.float32), "c")
+    assert cache.lookup("p", B) is None
+    assert cache.lookup("p", A).value == "a"
+    assert cache.stats().evictions == 1
+
+
+@pytest.fixture
+def chat_cache(numpy_backend, monkeypatch):
+    monkeypatch.setattr(settings, "answer_cache_max_entries", 100)
+    monkeypatch.setattr(answer_cache, "_cache", None)
+    yield answer_cache.get_answer_cache()
+    answer_cache._cache = None
+
+
+def test_reingest_of_a_cited_chunk_rejects_the_answer(chat_cache):
+    chunks = [(0, "Postgres stores the vectors in kb_chunks."), (1, "The HNSW index speeds up search.")]
+    insert_chunks_with_embeddings(source="s", doc_id="d", chunks=chunks)
+    question = "Where are the vectors stored?"
+
+    assert not answer_with_rag(message=question).cached
+    assert answer_with_rag(message=question).cached
+
+    insert_chunks_with_embeddings(source="s", doc_id="d", chunks=[chunks[0], (1, "The index was rebuilt.")])
+    assert not answer_with_rag(message=question).cached
+    assert chat_cache.stats().stale == 1
+    assert answer_with_rag(message=question).cached
+
+
+def test_ann_settings_partition_the_cache(chat_cache):
+    insert_chunks_with_embeddings(source="s", doc_id="d", chunks=[(0, "Postgres stores the vectors.")])
+    question = "Where are the vectors stored?"
+
+    answer_with_rag(message=question, ef_search=40)
+    assert not answer_with_rag(message=question, ef_search=400).cached
+    assert answer_with_rag(message=question, ef_search=40).cached
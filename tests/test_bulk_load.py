@@ -0,0 +1,96 @@
+"""Re-loading documents with bulk_load replaces them whole."""
+from __future__ import annotations
+
+import json
+import time
+
+import pytest
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services import bulk_load as bulk_load_module
+from rag_knowledge_base_fastapi.services.bulk_load import BulkLoadStats, bulk_load, iter_documents
+from rag_knowledge_base_fastapi.services.kb_repository import text_doc_id
+from rag_knowledge_base_fastapi.services.numpy_index import get_numpy_index
+
+LONG = " ".join(f"Sentence number {i} of the long version." for i in range(200))
+SHORT = "The short version of the document."
+
+
+def _chunks(source: str, doc_id: str) -> dict[int, tuple[int, str | None, str | None]]:
+    return get_numpy_index().doc_chunks(source=source, doc_id=doc_id)
+
+
+def test_reload_drops_tail_chunks(numpy_backend, tmp_path):
+    corpus = tmp_path / "corpus"
+    corpus.mkdir()
+    (corpus / "a.txt").write_text(LONG, encoding="utf-8")
+    bulk_load(iter_documents(corpus), procs=1)
+    assert len(_chunks("corpus", "a.txt")) > 1
+
+    (corpus / "a.txt").write_text(SHORT, encoding="utf-8")
+    stats = bulk_load(iter_documents(corpus), procs=1)
+    assert list(_chunks("corpus", "a.txt")) == [0]
+    assert stats.dedupe_deleted > 1
+
+
+def test_jsonl_without_doc_id(numpy_backend, tmp_path):
+    corpus = tmp_path / "docs.jsonl"
+    lines = [{"content": "First document."}, {"content": "Second document."}]
+    corpus.write_text("\n".join(json.dumps(line) for line in lines), encoding="utf-8")
+
+    docs = list(iter_documents(corpus))
+    assert [d.doc_id for d in docs] == [text_doc_id("First document."), text_doc_id("Second document.")]
+
+    bulk_load(docs, procs=1)
+    assert len(get_numpy_index()) == 2
+
+
+def test_admin_endpoint_keeps_indexes(api_client, tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(settings, "bulk_load_root", str(tmp_path))
+    monkeypatch.setattr(bulk_load_module, "bulk_load", lambda docs, **kwargs: calls.append(kwargs) or BulkLoadStats())
+    (tmp_path / "docs.jsonl").write_text(json.dumps({"content": "A document."}), encoding="utf-8")
+
+    for body, keep in [({"path": "docs.jsonl"}, True), ({"path": "docs.jsonl", "drop_indexes": True}, False)]:
+        r = api_client.post("/admin/bulk-load", json=body)
+        assert r.status_code == 202
+        assert r.json()["keep_indexes"] is keep
+        while bulk_load_module.bulk_load_status()["status"] == "running":
+            time.sleep(0.01)
+        assert calls[-1]["keep_indexes"] is keep
+
+
+def _duplicate_corpus(tmp_path):
+    corpus = tmp_path / "docs.jsonl"
+    lines = [
+        {"content": "Same text twice."},
+        {"content": "Same text twice."},
+        {"doc_id": "d", "content": LONG},
+        {"doc_id": "d", "content": SHORT},
+    ]
+    corpus.write_text("\n".join(json.dumps(line) for line in lines), encoding="utf-8")
+    return corpus
+
+
+def test_duplicate_documents_keep_the_last_copy(numpy_backend, tmp_path):
+    corpus = _duplicate_corpus(tmp_path)
+    for batch_rows in (1, 2048):  # copies in separate batches, then in one
+        bulk_load(iter_documents(corpus), procs=1, batch_rows=batch_rows)
+        assert list(_chunks("docs", text_doc_id("Same text twice."))) == [0]
+        assert list(_chunks("docs", "d")) == [0]
+        assert len(get_numpy_index()) == 2
+
+
+@pytest.mark.parametrize("keep_indexes", [True, False])
+def test_duplicate_documents_keep_the_last_copy_pg(pg_backend, tmp_path, keep_indexes):
+    from sqlalchemy import text
+
+    from rag_knowledge_base_fastapi.services.db import get_engine
+
+    corpus = _duplicate_corpus(tmp_path)
+    for batch_rows in (1, 2048):
+        stats = bulk_load(iter_documents(corpus), procs=1, batch_rows=batch_rows, keep_indexes=keep_indexes)
+        assert not stats.index_seconds or "kb_chunks_doc_chunk_key" in stats.index_seconds
+        with get_engine().connect() as conn:
+            rows = conn.execute(text("SELECT doc_id, chunk_index, content FROM kb_chunks ORDER BY doc_id")).all()
+        assert [tuple(r) for r in rows] == [("d", 0, SHORT), (text_doc_id("Same text twice."), 0, "Same text twice.")]
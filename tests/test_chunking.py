@@ -0,0 +1,62 @@
+"""Streamed chunking (ingest jobs, bulk load) matches chunking the whole text."""
+from __future__ import annotations
+
+import asyncio
+import random
+
+import pytest
+
+from rag_knowledge_base_fastapi.services.chunking import aiter_chunks, chunk_text, iter_chunks
+from rag_knowledge_base_fastapi.services.streaming_ingest import adecode_utf8
+
+OPTIONS = [
+    pytest.param({"mode": "chars", "chunk_size": 120, "chunk_overlap": 30}, id="chars"),
+    pytest.param({"mode": "tokens", "chunk_size": 40, "chunk_overlap": 10}, id="tokens"),
+]
+
+
+def _document(seed: int) -> str:
+    rng = random.Random(seed)
+    words = "the index stores vectors; queries über große Daten — recall latency cache 東京 shard".split()
+    paragraphs = []
+    for _ in range(12):
+        sentences = [" ".join(rng.choices(words, k=rng.randint(3, 30))).capitalize() + "." for _ in range(6)]
+        paragraphs.append(" ".join(sentences))
+    # A run-on "sentence" far over the token budget, and blank-line padding.
+    paragraphs.append(" ".join(rng.choices(words, k=300)))
+    return "\n\n  " + "\n\n".join(paragraphs) + "\n\n\n"
+
+
+def _pieces(text: str, size: int) -> list[str]:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("options", OPTIONS)
+@pytest.mark.parametrize("piece_size", [1, 7, 64, 1000, 10**6])
+def test_streamed_matches_whole_text(options, piece_size):
+    text = _document(piece_size)
+    whole = chunk_text(text, **options)
+    assert len(whole) > 3
+    assert list(iter_chunks(_pieces(text, piece_size), **options)) == whole
+
+
+@pytest.mark.parametrize("options", OPTIONS)
+def test_async_stream_of_bytes_matches_whole_text(options):
+    text = _document(0)
+    data = text.encode("utf-8")
+
+    async def blocks():
+        # 5-byte blocks split the multi-byte characters.
+        for i in range(0, len(data), 5):
+            yield data[i : i + 5]
+
+    async def collect():
+        return [c async for c in aiter_chunks(adecode_utf8(blocks()), **options)]
+
+    assert asyncio.run(collect()) == chunk_text(text, **options)
+
+
+@pytest.mark.parametrize("options", OPTIONS)
+def test_empty_text(options):
+    assert chunk_text("  \n ", **options) == []
+    assert list(iter_chunks(["  ", "\n", ""], **options)) == []
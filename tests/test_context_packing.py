@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from rag_knowledge_base_fastapi.services.context_packing import pack_context
+from rag_knowledge_base_fastapi.services.retrieval import RetrievalHit
+from rag_knowledge_base_fastapi.services.tokenizer import ApproxTokenizer
+
+TOK = ApproxTokenizer()
+TEXT = " ".join(f"word{i}" for i in range(400))
+
+
+def _hit(id_: int, doc_id: str, chunk_index: int, content: str, score: float = 0.5) -> RetrievalHit:
+    return RetrievalHit(id=id_, source="s", doc_id=doc_id, chunk_index=chunk_index, content=content, score=score)
+
+
+def test_neighbouring_chunks_merge_without_their_overlap():
+    hits = [_hit(1, "a", 1, TEXT[90:200]), _hit(2, "a", 0, TEXT[:120]), _hit(3, "b", 0, "other document")]
+    packed = pack_context(hits, max_tokens=0, tokenizer=TOK)
+
+    assert [[h.id for h in b.hits] for b in packed.blocks] == [[2, 1], [3]]
+    assert packed.blocks[0].text.endswith(TEXT[:200])
+    assert packed.blocks[0].text.startswith("[1] source=s doc_id=a chunk=0-1")
+    assert not packed.truncated
+    assert packed.tokens_saved > 0
+    assert packed.hits_for({2}) == [(2, hits[2])]
+
+
+def test_budget_cuts_the_last_block():
+    hits = [_hit(1, "a", 0, TEXT[:300]), _hit(2, "b", 0, TEXT), _hit(3, "c", 0, "never reached")]
+    first = pack_context(hits[:1], max_tokens=0, tokenizer=TOK).tokens
+    budget = first + 80
+
+    packed = pack_context(hits, max_tokens=budget, tokenizer=TOK)
+    assert packed.truncated
+    assert [b.n for b in packed.blocks] == [1, 2]
+    assert packed.tokens <= budget
+    assert TOK.count(packed.text) <= budget
+    assert TEXT.startswith(packed.blocks[1].text.split("\n", 1)[1])
+
+
+def test_no_room_for_a_useful_block_leaves_it_out():
+    hits = [_hit(1, "a", 0, TEXT[:300]), _hit(2, "b", 0, TEXT)]
+    budget = pack_context(hits[:1], max_tokens=0, tokenizer=TOK).tokens + 5
+
+    packed = pack_context(hits, max_tokens=budget, tokenizer=TOK)
+    assert packed.truncated
+    assert [b.n for b in packed.blocks] == [1]
+    assert packed.tokens <= budget
+
+
+def test_first_block_is_cut_rather_than_dropped():
+    packed = pack_context([_hit(1, "a", 0, TEXT)], max_tokens=40, tokenizer=TOK)
+    assert packed.truncated
+    assert len(packed.blocks) == 1
+    assert packed.tokens <= 40
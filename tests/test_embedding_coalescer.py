@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from rag_knowledge_base_fastapi.services.embedding_coalescer import EmbeddingCoalescer
+
+
+class FakeProvider:
+    """Records each batch; a batch returns once `release` is set."""
+
+    def __init__(self, *, vectors_per_batch: int | None = None) -> None:
+        self.batches: list[list[str]] = []
+        self.release = asyncio.Event()
+        self.release.set()
+        self._count = vectors_per_batch
+
+    async def __call__(self, texts: list[str]) -> list[np.ndarray]:
+        self.batches.append(list(texts))
+        await self.release.wait()
+        n = len(texts) if self._count is None else self._count
+        return [np.full(2, float(len(t)), dtype=np.float32) for t in texts[:n]]
+
+
+def _run(coro):
+    return asyncio.run(asyncio.wait_for(coro, timeout=5))
+
+
+def test_idle_query_is_sent_at_once():
+    async def main():
+        provider = FakeProvider()
+        coalescer = EmbeddingCoalescer(provider, window_seconds=60.0, max_batch=8)
+        vector = await coalescer.embed("abc")
+        assert vector.tolist() == [3.0, 3.0]
+        assert provider.batches == [["abc"]]
+
+    _run(main())
+
+
+def test_queries_batch_while_one_is_in_flight():
+    async def main():
+        provider = FakeProvider()
+        provider.release.clear()
+        coalescer = EmbeddingCoalescer(provider, window_seconds=60.0, max_batch=8)
+        first = asyncio.create_task(coalescer.embed("a"))
+        await asyncio.sleep(0)
+        rest = [asyncio.create_task(coalescer.embed(t)) for t in ("bb", "ccc")]
+        await asyncio.sleep(0.01)
+        assert provider.batches == [["a"]]  # the others wait for the first batch
+
+        provider.release.set()
+        results = await asyncio.gather(first, *rest)
+        assert [r[0] for r in results] == [1.0, 2.0, 3.0]
+        assert provider.batches == [["a"], ["bb", "ccc"]]
+        assert coalescer.stats().largest_batch == 2
+
+    _run(main())
+
+
+def test_window_sends_the_batch_while_one_is_still_in_flight():
+    async def main():
+        provider = FakeProvider()
+        provider.release.clear()
+        coalescer = EmbeddingCoalescer(provider, window_seconds=0.01, max_batch=8)
+        first = asyncio.create_task(coalescer.embed("a"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(coalescer.embed("bb"))
+        await asyncio.sleep(0.05)
+        assert provider.batches == [["a"], ["bb"]]
+        provider.release.set()
+        await asyncio.gather(first, second)
+
+    _run(main())
+
+
+def test_max_batch_cuts_off_the_batch():
+    async def main():
+        provider = FakeProvider()
+        provider.release.clear()
+        coalescer = EmbeddingCoalescer(provider, window_seconds=60.0, max_batch=2)
+        tasks = [asyncio.create_task(coalescer.embed("a"))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(coalescer.embed(t)) for t in ("b", "c", "d")]
+        await asyncio.sleep(0.01)
+        # "b" and "c" filled a batch and went out; "d" waits.
+        assert provider.batches == [["a"], ["b", "c"]]
+        provider.release.set()
+        await asyncio.gather(*tasks)
+        assert provider.batches == [["a"], ["b", "c"], ["d"]]
+
+    _run(main())
+
+
+def test_provider_error_fails_every_caller():
+    async def main():
+        async def failing(texts):
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        coalescer = EmbeddingCoalescer(failing, window_seconds=60.0, max_batch=8)
+        first = asyncio.create_task(coalescer.embed("a"))
+        await asyncio.sleep(0)
+        rest = [asyncio.create_task(coalescer.embed(t)) for t in ("b", "c")]
+        results = await asyncio.gather(first, *rest, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    _run(main())
+
+
+def test_wrong_number_of_vectors_fails_every_caller():
+    async def main():
+        provider = FakeProvider(vectors_per_batch=1)
+        provider.release.clear()
+        coalescer = EmbeddingCoalescer(provider, window_seconds=60.0, max_batch=8)
+        first = asyncio.create_task(coalescer.embed("a"))
+        await asyncio.sleep(0)
+        rest = [asyncio.create_task(coalescer.embed(t)) for t in ("b", "c")]
+        await asyncio.sleep(0)
+        provider.release.set()
+        assert (await first).tolist() == [1.0, 1.0]  # a batch of one got its one vector
+        for task in rest:
+            with pytest.raises(ValueError):
+                await task
+
+    _run(main())
@@ -0,0 +1,62 @@
+"""Re-ingesting a document writes only what changed and deletes what is gone."""
+from __future__ import annotations
+
+from rag_knowledge_base_fastapi.services.kb_repository import _plan_ingest, content_hash, insert_chunks_with_embeddings
+from rag_knowledge_base_fastapi.services.numpy_index import get_numpy_index
+from rag_knowledge_base_fastapi.services.providers import HashingEmbedder
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self) -> None:
+        super().__init__()
+        self.texts: list[str] = []
+
+    def embed_texts(self, texts):
+        self.texts.extend(texts)
+        return super().embed_texts(texts)
+
+
+def _stored(*contents: str, model: str = "m") -> dict:
+    return {i: (f"key{i}", content_hash(c), model) for i, c in enumerate(contents)}
+
+
+def test_plan_skips_unchanged_and_prunes_missing():
+    plan = _plan_ingest([(0, "a"), (1, "b2")], _stored("a", "b", "c"), "m", prune=True)
+    assert plan.pending == [(1, "b2", content_hash("b2"))]
+    assert plan.replaced == ["key1"]
+    assert plan.stale == ["key2"]
+    assert plan.unchanged == 1
+
+
+def test_plan_without_prune_keeps_other_chunks():
+    # Streamed batches only see their own chunk range.
+    plan = _plan_ingest([(1, "b")], _stored("a", "b", "c"), "m", prune=False)
+    assert (plan.pending, plan.replaced, plan.stale, plan.unchanged) == ([], [], [], 1)
+
+
+def test_plan_rewrites_chunks_of_another_model():
+    plan = _plan_ingest([(0, "a"), (1, "b")], _stored("a", "b", model="old"), "m", prune=True)
+    assert [p[0] for p in plan.pending] == [0, 1]
+    assert plan.replaced == ["key0", "key1"]
+    assert plan.unchanged == 0
+
+
+def test_reingest_reuses_and_prunes(numpy_backend):
+    embedder = CountingEmbedder()
+    first = insert_chunks_with_embeddings(
+        source="s", doc_id="d", chunks=[(0, "alpha"), (1, "beta"), (2, "gamma")], embedder=embedder
+    )
+    assert (first.inserted, first.embedded, first.deleted) == (3, 3, 0)
+
+    embedder.texts.clear()
+    # Chunk 1 now has chunk 2's old text (its stored embedding is reused);
+    # only chunk 2's new text goes to the provider.
+    second = insert_chunks_with_embeddings(
+        source="s", doc_id="d", chunks=[(0, "alpha"), (1, "gamma"), (2, "delta")], embedder=embedder
+    )
+    assert embedder.texts == ["delta"]
+    assert (second.unchanged, second.inserted, second.reused, second.embedded) == (1, 2, 1, 1)
+
+    third = insert_chunks_with_embeddings(source="s", doc_id="d", chunks=[(0, "alpha")], embedder=embedder)
+    assert (third.unchanged, third.inserted, third.deleted) == (1, 0, 2)
+    assert list(get_numpy_index().doc_chunks(source="s", doc_id="d")) == [0]
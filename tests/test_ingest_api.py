@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import time
+
+
+def _wait(client, job: dict) -> dict:
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        status = client.get(job["status_url"]).json()
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"job {job['job_id']} did not finish")
+
+
+def _ingest_text(client, content: str, **fields) -> dict:
+    resp = client.post("/ingest/text", json={"content": content, "source": "notes", **fields})
+    assert resp.status_code == 202
+    job = resp.json()
+    assert _wait(client, job)["status"] == "done"
+    return job
+
+
+def _docs(client) -> dict[str, int]:
+    return {d["doc_id"]: d["chunks"] for d in client.get("/kb/docs", params={"source": "notes"}).json()["docs"]}
+
+
+def test_text_without_doc_id_does_not_replace_other_texts(api_client):
+    first = _ingest_text(api_client, "Postgres stores the vectors. " * 80)
+    second = _ingest_text(api_client, "The cache keeps recent answers. " * 10)
+
+    assert first["doc_id"] != second["doc_id"]
+    assert first["doc_id"].startswith("text-")
+    docs = _docs(api_client)
+    assert set(docs) == {first["doc_id"], second["doc_id"]}
+    assert docs[first["doc_id"]] > docs[second["doc_id"]]
+
+
+def test_same_text_without_doc_id_is_the_same_document(api_client):
+    first = _ingest_text(api_client, "One paragraph about ingestion. " * 20)
+    again = _ingest_text(api_client, "One paragraph about ingestion. " * 20)
+
+    assert again["doc_id"] == first["doc_id"]
+    assert list(_docs(api_client)) == [first["doc_id"]]
+
+
+def test_explicit_doc_id_is_kept(api_client):
+    job = _ingest_text(api_client, "Some text.", doc_id="handbook")
+    assert job["doc_id"] == "handbook"
+    assert list(_docs(api_client)) == ["handbook"]
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from rag_knowledge_base_fastapi.services.ingest_jobs import IngestJobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IngestJobStore(tmp_path, lease_seconds=60.0)
+    yield store
+    store.close()
+
+
+def _submit(store: IngestJobStore, job_id: str, *, source: str, doc_id: str | None) -> None:
+    store.payload_path(job_id).write_text("content", encoding="utf-8")
+    store.create(job_id, source=source, doc_id=doc_id, metadata={})
+    time.sleep(0.001)  # distinct created_at, so claims follow submission order
+
+
+def test_one_running_job_per_document(store):
+    _submit(store, "a1", source="s", doc_id="a")
+    _submit(store, "a2", source="s", doc_id="a")
+    _submit(store, "b1", source="s", doc_id="b")
+    _submit(store, "other-source", source="t", doc_id="a")
+
+    assert [store.claim().id for _ in range(3)] == ["a1", "b1", "other-source"]
+    assert store.claim() is None  # a2 waits for a1
+
+    store.finish("a1")
+    assert store.claim().id == "a2"
+
+
+def test_documents_without_doc_id_are_serialized_by_source(store):
+    _submit(store, "n1", source="s", doc_id=None)
+    _submit(store, "n2", source="s", doc_id=None)
+    assert store.claim().id == "n1"
+    assert store.claim() is None
+    store.release("n1")
+    assert store.claim().id == "n1"
+
+
+def test_expired_lease_unblocks_the_document(tmp_path):
+    store = IngestJobStore(tmp_path, lease_seconds=0.0)
+    try:
+        _submit(store, "a1", source="s", doc_id="a")
+        _submit(store, "a2", source="s", doc_id="a")
+        assert store.claim().id == "a1"
+        time.sleep(0.01)
+        # a1's worker is presumed dead: it is resumed first, ahead of a2.
+        assert store.claim().id == "a1"
+    finally:
+        store.close()
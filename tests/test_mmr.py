@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import random
+
+import numpy as np
+import pytest
+
+from rag_knowledge_base_fastapi.services.kb_repository import insert_chunks_with_embeddings
+from rag_knowledge_base_fastapi.services.mmr import mmr
+from rag_knowledge_base_fastapi.services.retrieval import search_chunks
+
+# Candidates 0-2 are near-duplicates; 3 and 4 point elsewhere.
+CANDIDATES = np.array(
+    [
+        [1.0, 0.0, 0.0],
+        [0.99, 0.01, 0.0],
+        [0.98, 0.0, 0.02],
+        [0.0, 1.0, 0.0],
+        [0.0, 0.0, 1.0],
+    ],
+    dtype=np.float32,
+)
+RANKED = np.array([5.0, 4.0, 3.0, 2.0, 1.0], dtype=np.float32)
+
+
+def test_lambda_one_keeps_the_ranking():
+    assert mmr(CANDIDATES, RANKED, top_k=3, lambda_=1.0).tolist() == [0, 1, 2]
+
+
+def test_lambda_one_ignores_embedding_order():
+    # Relevance that the embeddings don't reflect (a fused hybrid score,
+    # a lexical-only hit) still decides the order.
+    relevance = np.array([1.0, 2.0, 3.0, 4.0, 5.0], dtype=np.float32)
+    assert mmr(CANDIDATES, relevance, top_k=5, lambda_=1.0).tolist() == [4, 3, 2, 1, 0]
+
+
+def test_lambda_zero_picks_the_best_then_novelty():
+    assert mmr(CANDIDATES, RANKED, top_k=3, lambda_=0.0).tolist() == [0, 3, 4]
+
+
+def test_relevance_per_candidate():
+    with pytest.raises(ValueError):
+        mmr(CANDIDATES, RANKED[:3], top_k=3, lambda_=0.5)
+
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+def test_search_with_lambda_one_matches_plain_search(numpy_backend, mode):
+    rng = random.Random(0)
+    words = "index vector query latency cache shard replica postgres token chunk".split()
+    for d in range(20):
+        insert_chunks_with_embeddings(
+            source="s", doc_id=f"d{d}", chunks=[(i, " ".join(rng.choices(words, k=8))) for i in range(3)]
+        )
+    plain = search_chunks(query="postgres index latency", top_k=5, mode=mode)
+    diversified = search_chunks(query="postgres index latency", top_k=5, mode=mode, mmr_lambda=1.0, fetch_multiplier=4)
+    assert [h.id for h in diversified] == [h.id for h in plain]
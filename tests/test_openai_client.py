@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from rag_knowledge_base_fastapi.services.openai_client import _retry_after_seconds
+
+
+def _rate_limited(**headers: str) -> Exception:
+    exc = Exception("429")
+    exc.response = SimpleNamespace(headers=headers)  # type: ignore[attr-defined]
+    return exc
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"),
+    [
+        ({"retry-after-ms": "1500"}, 1.5),
+        ({"retry-after": "3"}, 3.0),
+        ({"retry-after": "-2"}, 0.0),
+        ({}, None),
+        ({"retry-after": "soon"}, None),
+        ({"retry-after": "Mon, 99 Foo 2024 25:61:00 GMT"}, None),
+    ],
+)
+def test_retry_after_seconds(headers, expected):
+    assert _retry_after_seconds(_rate_limited(**headers)) == expected
+
+
+@pytest.mark.parametrize("usegmt", [True, False])  # "... GMT" / "... -0000"
+def test_retry_after_http_date(usegmt):
+    value = _retry_after_seconds(_rate_limited(**{"retry-after": formatdate(time.time() + 30, usegmt=usegmt)}))
+    assert 25 < value <= 30
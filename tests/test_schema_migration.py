@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import pytest
+from sqlalchemy import text
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.db import get_engine
+from rag_knowledge_base_fastapi.services.schema import dedupe_chunks, init_db
+
+_INSERT = text(
+    """
+    INSERT INTO kb_chunks (source, doc_id, chunk_index, content, embedding)
+    VALUES (:source, :doc_id, :chunk_index, :content, CAST(:embedding AS vector))
+    """
+)
+
+
+def _legacy_table() -> None:
+    """kb_chunks as before the unique chunk key, when every ingest appended."""
+    with get_engine().begin() as conn:
+        conn.execute(text("DROP INDEX kb_chunks_doc_chunk_key"))
+
+
+def _legacy_ingest(source: str, doc_id: str | None, chunks: int) -> None:
+    zero = "[" + ",".join(["0"] * settings.embed_dim) + "]"
+    with get_engine().begin() as conn:  # one transaction per ingest, as the old code did
+        for i in range(chunks):
+            params = {"source": source, "doc_id": doc_id, "chunk_index": i, "content": f"{doc_id} {i}"}
+            conn.execute(_INSERT, {**params, "embedding": zero})
+
+
+def _documents() -> dict[tuple[str, str | None], int]:
+    with get_engine().connect() as conn:
+        rows = conn.execute(text("SELECT source, doc_id, count(*) FROM kb_chunks GROUP BY source, doc_id"))
+        return {(r[0], r[1]): r[2] for r in rows}
+
+
+def test_init_db_splits_legacy_rows_without_doc_id_by_ingest(pg_backend):
+    _legacy_table()
+    _legacy_ingest("notes", None, 3)
+    _legacy_ingest("notes", None, 2)
+
+    init_db()
+
+    docs = _documents()
+    assert sorted(docs.values()) == [2, 3]
+    assert all(doc_id.startswith("legacy-") for _, doc_id in docs)
+
+
+def test_init_db_refuses_reingested_documents_until_deduped(pg_backend):
+    _legacy_table()
+    _legacy_ingest("docs", "guide", 3)
+    _legacy_ingest("docs", "guide", 2)
+
+    with pytest.raises(RuntimeError, match="schema dedupe"):
+        init_db()
+    assert _documents() == {("docs", "guide"): 5}  # nothing deleted
+
+    assert dedupe_chunks() == {"deleted": 3, "duplicate_keys": 0}
+    init_db()
+    assert _documents() == {("docs", "guide"): 2}
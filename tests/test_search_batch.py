@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import asyncio
+import random
+from contextlib import asynccontextmanager, contextmanager
+
+import pytest
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services import retrieval
+from rag_knowledge_base_fastapi.services.kb_repository import insert_chunks_with_embeddings
+from rag_knowledge_base_fastapi.services.retrieval import (
+    SearchQuery,
+    asearch_chunks,
+    asearch_chunks_batch,
+    search_chunks,
+    search_chunks_batch,
+)
+from rag_knowledge_base_fastapi.services.vector_index import _SET_LOCAL
+
+WORDS = "index vector query latency cache shard replica postgres token chunk recall batch filter rank".split()
+
+QUERIES = [
+    SearchQuery("postgres index latency", top_k=5, ef_search=400),
+    SearchQuery("vector recall", top_k=3),
+    SearchQuery("cache shard", top_k=4, source="s1"),
+    SearchQuery("replica token", top_k=2, mode="lexical"),
+    SearchQuery("batch filter rank", top_k=5, mode="hybrid", probes=3),
+    SearchQuery("query chunk", top_k=5, ef_search=100),
+    SearchQuery("latency recall", top_k=5),
+]
+
+
+def _load_corpus() -> None:
+    rng = random.Random(0)
+    for d in range(30):
+        chunks = [(i, " ".join(rng.choices(WORDS, k=12))) for i in range(4)]
+        insert_chunks_with_embeddings(source=f"s{d % 3}", doc_id=f"d{d}", chunks=chunks)
+
+
+def _ids(hits) -> list[tuple[int, float]]:
+    return [(h.id, round(h.score, 5)) for h in hits]
+
+
+def _single(q: SearchQuery):
+    return search_chunks(
+        query=q.query,
+        top_k=q.top_k,
+        doc_id=q.doc_id,
+        source=q.source,
+        ef_search=q.ef_search,
+        probes=q.probes,
+        mode=q.mode,
+    )
+
+
+@pytest.mark.parametrize("backend", ["numpy_backend", "pg_backend"])
+def test_batch_matches_single_queries(backend, request):
+    request.getfixturevalue(backend)
+    _load_corpus()
+
+    batch = search_chunks_batch(QUERIES)
+    assert [_ids(hits) for hits in batch] == [_ids(_single(q)) for q in QUERIES]
+
+
+@pytest.mark.parametrize("backend", ["numpy_backend", "pg_backend"])
+def test_async_batch_matches_single_queries(backend, request):
+    request.getfixturevalue(backend)
+    _load_corpus()
+
+    async def run():
+        batch = await asearch_chunks_batch(QUERIES)
+        single = [
+            await asearch_chunks(
+                query=q.query,
+                top_k=q.top_k,
+                doc_id=q.doc_id,
+                source=q.source,
+                ef_search=q.ef_search,
+                probes=q.probes,
+                mode=q.mode,
+            )
+            for q in QUERIES
+        ]
+        return batch, single
+
+    batch, single = asyncio.run(run())
+    assert [_ids(hits) for hits in batch] == [_ids(hits) for hits in single]
+
+
+class _Result:
+    def fetchall(self):
+        return []
+
+
+class _FakeConnection:
+    """
+    Records the ANN settings in effect for each batch statement. Like
+    Postgres, SET LOCAL values last until the transaction ends, and
+    statements outside `begin()` share one implicit transaction.
+    """
+
+    def __init__(self) -> None:
+        self.gucs: dict[str, str] = {}
+        self.seen: dict[int, dict[str, str]] = {}
+
+    def _execute(self, statement, params):
+        if statement is _SET_LOCAL:
+            self.gucs[params["name"]] = params["v"]
+        else:
+            for ord_ in params["ord"]:
+                self.seen[ord_] = dict(self.gucs)
+        return _Result()
+
+    def execute(self, statement, params=None):
+        return self._execute(statement, params)
+
+    @contextmanager
+    def begin(self):
+        yield
+        self.gucs = {}
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+
+class _FakeAsyncConnection(_FakeConnection):
+    async def execute(self, statement, params=None):
+        return self._execute(statement, params)
+
+    @asynccontextmanager
+    async def begin(self):
+        yield
+        self.gucs = {}
+
+    @asynccontextmanager
+    async def connect(self):
+        yield self
+
+
+def _mixed_ef_search() -> list[SearchQuery]:
+    return [SearchQuery("first", ef_search=400), SearchQuery("second"), SearchQuery("third", probes=7)]
+
+
+def _check_isolated(seen: dict[int, dict[str, str]]) -> None:
+    assert seen[0] == {"hnsw.ef_search": "400"}
+    # Defaults must not inherit the earlier group's SET LOCAL.
+    assert seen[1] == {}
+    assert seen[2] == {"ivfflat.probes": "7"}
+
+
+def test_batch_groups_do_not_share_ann_settings(monkeypatch):
+    monkeypatch.setattr(settings, "retrieval_backend", "pgvector")
+    monkeypatch.setattr(settings, "hnsw_ef_search", None)
+    monkeypatch.setattr(settings, "ivfflat_probes", None)
+    conn = _FakeConnection()
+    monkeypatch.setattr(retrieval, "get_engine", lambda: conn)
+
+    search_chunks_batch(_mixed_ef_search())
+    _check_isolated(conn.seen)
+
+
+def test_async_batch_groups_do_not_share_ann_settings(monkeypatch):
+    monkeypatch.setattr(settings, "retrieval_backend", "pgvector")
+    monkeypatch.setattr(settings, "hnsw_ef_search", None)
+    monkeypatch.setattr(settings, "ivfflat_probes", None)
+    conn = _FakeAsyncConnection()
+    monkeypatch.setattr(retrieval, "get_async_engine", lambda: conn)
+
+    asyncio.run(asearch_chunks_batch(_mixed_ef_search()))
+    _check_isolated(conn.seen)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+
+from rag_knowledge_base_fastapi.services.slow_requests import SlowRequestSampler
+
+
+def test_slow_request_is_dumped_off_the_event_loop(tmp_path, monkeypatch):
+    writers: list[str] = []
+    write = SlowRequestSampler._write
+
+    def recording_write(self, dump):
+        writers.append(threading.current_thread().name)
+        return write(self, dump)
+
+    monkeypatch.setattr(SlowRequestSampler, "_write", recording_write)
+    sampler = SlowRequestSampler(threshold_seconds=0.02, interval_seconds=0.005, dump_dir=str(tmp_path))
+
+    async def request(seconds: float) -> None:
+        tracked = sampler.track()
+        await asyncio.sleep(seconds)
+        sampler.finish(tracked, route="/chat", seconds=seconds, timings={"llm": seconds})
+
+    async def main() -> None:
+        await request(0.1)
+        await request(0.001)  # under the threshold: never sampled or dumped
+        for _ in range(100):
+            if writers:
+                break
+            await asyncio.sleep(0.01)
+
+    try:
+        asyncio.run(main())
+    finally:
+        sampler.close()
+
+    dumps = list(tmp_path.glob("*-chat.folded"))
+    assert len(dumps) == 1
+    lines = dumps[0].read_text(encoding="utf-8").splitlines()
+    assert lines[0].startswith("# /chat 0.100s")
+    assert any(line.startswith("task;") for line in lines[2:])
+    assert writers == ["slow-request-sampler"]
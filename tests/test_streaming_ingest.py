@@ -0,0 +1,37 @@
+"""A streamed re-ingest ends in the same state as ingesting the whole text."""
+from __future__ import annotations
+
+import asyncio
+
+from rag_knowledge_base_fastapi.config.settings import settings
+from rag_knowledge_base_fastapi.services.chunking import chunk_text, chunking_options
+from rag_knowledge_base_fastapi.services.kb_repository import content_hash
+from rag_knowledge_base_fastapi.services.numpy_index import get_numpy_index
+from rag_knowledge_base_fastapi.services.streaming_ingest import aingest_stream
+
+
+def test_streamed_reingest_deletes_old_tail(numpy_backend, monkeypatch):
+    monkeypatch.setattr(settings, "chunk_size_chars", 50)
+    monkeypatch.setattr(settings, "chunk_overlap_chars", 10)
+    long_text = " ".join(f"sentence {i} of the document." for i in range(40))
+    short_text = long_text[:300]
+
+    async def stream(text: str):
+        data = text.encode("utf-8")
+
+        async def blocks():
+            for i in range(0, len(data), 64):
+                yield data[i : i + 64]
+
+        return await aingest_stream(blocks(), source="s", doc_id="d", batch_chunks=4)
+
+    first = asyncio.run(stream(long_text))
+    assert first.chunks_created == len(chunk_text(long_text, **chunking_options()))
+
+    second = asyncio.run(stream(short_text))
+    expected = chunk_text(short_text, **chunking_options())
+    assert second.unchanged == len(expected) - 1  # the last chunk is cut differently
+    assert second.deleted == first.chunks_created - len(expected)
+    stored = get_numpy_index().doc_chunks(source="s", doc_id="d")
+    assert sorted(stored) == list(range(len(expected)))
+    assert [stored[c.chunk_index][1] for c in expected] == [content_hash(c.content) for c in expected]